@@ -0,0 +1,110 @@
+"""Store task ids as BINARY(16) and partition task_statuses by month
+
+Revision ID: 7b5e2c9d4f18
+Revises: f1a4d7c2e853
+Create Date: 2026-10-19 17:20:44.731950
+
+"""
+import uuid
+from datetime import datetime
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = '7b5e2c9d4f18'
+down_revision: Union[str, None] = 'f1a4d7c2e853'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+PARTITIONS_AHEAD = 2
+UUID_RE = '^[0-9a-fA-F]{8}-?[0-9a-fA-F]{4}-?[0-9a-fA-F]{4}-?[0-9a-fA-F]{4}-?[0-9a-fA-F]{12}$'
+
+
+def month_start(moment: datetime, months: int = 0) -> datetime:
+    month_index = moment.year * 12 + moment.month - 1 + months
+    return datetime(month_index // 12, month_index % 12 + 1, 1)
+
+
+def convert_task_ids(bind) -> None:
+    if bind.dialect.name == 'mysql':
+        op.execute(
+            f"UPDATE task_statuses SET task_uuid = UNHEX(REPLACE(task_id, '-', '')) "
+            f"WHERE task_id REGEXP '{UUID_RE}'"
+        )
+        return
+    rows = bind.execute(sa.text("SELECT id, task_id FROM task_statuses WHERE task_id IS NOT NULL")).fetchall()
+    for row_id, task_id in rows:
+        try:
+            value = uuid.UUID(task_id).bytes
+        except ValueError:
+            continue
+        bind.execute(sa.text("UPDATE task_statuses SET task_uuid = :value WHERE id = :id"), {"value": value, "id": row_id})
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    bind = op.get_bind()
+    op.add_column('task_statuses', sa.Column('task_uuid', sa.BINARY(length=16), nullable=True))
+    convert_task_ids(bind)
+    # Ids that are not UUIDs (or missing) could never be looked up again
+    op.execute("DELETE FROM task_statuses WHERE task_uuid IS NULL")
+    op.execute("UPDATE task_statuses SET created_at = CURRENT_TIMESTAMP WHERE created_at IS NULL")
+
+    # Named "task_id" where the table came from a migration; create_all on
+    # SQLite leaves it unnamed, and dropping the column then drops it too
+    unique_names = [
+        constraint['name'] for constraint in sa.inspect(bind).get_unique_constraints('task_statuses')
+        if constraint['column_names'] == ['task_id'] and constraint['name']
+    ]
+    with op.batch_alter_table('task_statuses') as batch_op:
+        for name in unique_names:
+            batch_op.drop_constraint(name, type_='unique')
+        batch_op.drop_column('task_id')
+        batch_op.alter_column('task_uuid', new_column_name='task_id', existing_type=sa.BINARY(length=16), nullable=False)
+        batch_op.alter_column('created_at', existing_type=sa.DateTime(), nullable=False)
+    op.create_index(op.f('ix_task_statuses_task_id'), 'task_statuses', ['task_id'], unique=False)
+    op.create_index(op.f('ix_task_statuses_created_at'), 'task_statuses', ['created_at'], unique=False)
+
+    if bind.dialect.name == 'mysql':
+        # Every unique key of a partitioned table must include the partitioning column
+        op.execute("ALTER TABLE task_statuses DROP PRIMARY KEY, ADD PRIMARY KEY (id, created_at)")
+        oldest = bind.execute(sa.text("SELECT MIN(created_at) FROM task_statuses")).scalar() or datetime.now()
+        month = month_start(oldest)
+        last = month_start(datetime.now(), PARTITIONS_AHEAD)
+        definitions = []
+        while month <= last:
+            definitions.append(
+                f"PARTITION p{month:%Y%m} VALUES LESS THAN (TO_DAYS('{month_start(month, 1):%Y-%m-%d}'))"
+            )
+            month = month_start(month, 1)
+        definitions.append("PARTITION pmax VALUES LESS THAN MAXVALUE")
+        op.execute(
+            f"ALTER TABLE task_statuses PARTITION BY RANGE (TO_DAYS(created_at)) ({', '.join(definitions)})"
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    bind = op.get_bind()
+    if bind.dialect.name == 'mysql':
+        op.execute("ALTER TABLE task_statuses REMOVE PARTITIONING")
+        op.execute("ALTER TABLE task_statuses DROP PRIMARY KEY, ADD PRIMARY KEY (id)")
+
+    op.drop_index(op.f('ix_task_statuses_created_at'), table_name='task_statuses')
+    op.drop_index(op.f('ix_task_statuses_task_id'), table_name='task_statuses')
+    op.add_column('task_statuses', sa.Column('task_id_text', sa.String(length=255), nullable=True))
+    rows = bind.execute(sa.text("SELECT id, task_id FROM task_statuses")).fetchall()
+    for row_id, value in rows:
+        bind.execute(
+            sa.text("UPDATE task_statuses SET task_id_text = :task_id WHERE id = :id"),
+            {"task_id": str(uuid.UUID(bytes=bytes(value))), "id": row_id},
+        )
+    with op.batch_alter_table('task_statuses') as batch_op:
+        batch_op.drop_column('task_id')
+        batch_op.alter_column('task_id_text', new_column_name='task_id', existing_type=sa.String(length=255))
+        batch_op.alter_column('created_at', existing_type=sa.DateTime(), nullable=True)
+    # In a batch of its own: SQLite loses it when added with the rename
+    with op.batch_alter_table('task_statuses') as batch_op:
+        batch_op.create_unique_constraint('task_id', ['task_id'])
@@ -0,0 +1,41 @@
+"""Index filenames without stopwords
+
+Revision ID: b5e1d9f3a7c2
+Revises: f4c7a2e9b158
+Create Date: 2026-10-20 14:12:48.207316
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = 'b5e1d9f3a7c2'
+down_revision: Union[str, None] = 'f4c7a2e9b158'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def rebuild_fulltext_index(stopwords: bool) -> None:
+    # The ngram parser leaves out every token that contains a stopword, so
+    # with the default list ("a", "i", ...) names like "data.csv" cannot be
+    # found. InnoDB keeps the stopword setting in effect when the index is
+    # created, so it is rebuilt with the session's list turned off.
+    op.drop_index('ft_file_uploads_original_filename', table_name='file_uploads', mysql_prefix='FULLTEXT', mysql_with_parser='ngram')
+    op.execute(f"SET SESSION innodb_ft_enable_stopword = {'ON' if stopwords else 'OFF'}")
+    op.create_index('ft_file_uploads_original_filename', 'file_uploads', ['original_filename'], unique=False, mysql_prefix='FULLTEXT', mysql_with_parser='ngram')
+    op.execute("SET SESSION innodb_ft_enable_stopword = DEFAULT")
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Elsewhere the index is a plain one and search uses file_name_trigrams
+    if op.get_bind().dialect.name == 'mysql':
+        rebuild_fulltext_index(stopwords=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    if op.get_bind().dialect.name == 'mysql':
+        rebuild_fulltext_index(stopwords=True)
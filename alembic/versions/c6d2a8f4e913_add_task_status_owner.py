@@ -0,0 +1,29 @@
+"""Record who started each task
+
+Revision ID: c6d2a8f4e913
+Revises: b5e1d9f3a7c2
+Create Date: 2026-10-20 16:05:37.418920
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = 'c6d2a8f4e913'
+down_revision: Union[str, None] = 'b5e1d9f3a7c2'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # No foreign key: task_statuses is partitioned on MySQL. Existing rows
+    # keep NULL and drop out of the batch status lookup.
+    op.add_column('task_statuses', sa.Column('user_id', sa.Integer(), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('task_statuses', 'user_id')
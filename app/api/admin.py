@@ -0,0 +1,171 @@
+import os
+from datetime import date, timedelta
+from typing import Any, List, Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from fastapi.responses import PlainTextResponse
+from sqlalchemy.orm import Session
+
+from app.api import deps
+from app.core.profiler import profiler
+from app.crud import stats as stats_crud
+from app.crud import user as user_crud
+from app.models.user import User
+from app.schemas.stats import (
+    DailyFileStats, ProfilerSettings, ProfilerStatus, SlowRequestCapture, SlowRequestSummary,
+    UserFileStats, UserStatsDetail, UserWithStats,
+)
+
+router = APIRouter()
+
+# Longest range one daily stats request may cover
+MAX_DAILY_STATS_DAYS = 366
+
+
+@router.get("/admin/users", response_model=List[UserWithStats])
+def list_users_with_stats(
+    skip: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1, le=1000),
+    db: Session = Depends(deps.get_db),
+    current_user: User = Depends(deps.get_current_staff_user),
+) -> Any:
+    """
+    List users with their file counters, a page at a time.
+    """
+    return [
+        {
+            "id": user.id,
+            "username": user.username,
+            "email": user.email,
+            "is_staff": user.is_staff,
+            "is_active": user.is_active,
+            "created_at": user.created_at,
+            "stats": UserFileStats.model_validate(stats) if stats else UserFileStats(),
+        }
+        for user, stats in stats_crud.get_users_with_stats(db, skip=skip, limit=limit)
+    ]
+
+
+@router.get("/admin/users/{user_id}/stats", response_model=UserStatsDetail)
+def get_user_stats(
+    user_id: int,
+    db: Session = Depends(deps.get_db),
+    current_user: User = Depends(deps.get_current_staff_user),
+) -> Any:
+    """
+    Get one user's file counters and how many of their files are in each status.
+    """
+    if not user_crud.get(db, user_id):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="User not found"
+        )
+    stats = stats_crud.get_user_stats(db, user_id)
+    return {
+        **(UserFileStats.model_validate(stats) if stats else UserFileStats()).model_dump(),
+        "user_id": user_id,
+        "statuses": stats_crud.get_user_status_counts(db, user_id),
+    }
+
+
+@router.get("/admin/stats/daily", response_model=List[DailyFileStats])
+def get_daily_stats(
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    db: Session = Depends(deps.get_db),
+    current_user: User = Depends(deps.get_current_staff_user),
+) -> Any:
+    """
+    Get uploads, uploaded bytes, failures, deletions and purges per day,
+    for the last 30 days by default. Days without activity are left out.
+    """
+    end = end or date.today()
+    start = start or end - timedelta(days=29)
+    if start > end or (end - start).days >= MAX_DAILY_STATS_DAYS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"start must be before end and cover at most {MAX_DAILY_STATS_DAYS} days"
+        )
+    return stats_crud.get_daily_stats(db, start, end)
+
+
+# Profiler. Each worker process has its own: these endpoints act on the
+# worker that serves the request, identified by the pid in the status.
+
+def profiler_status() -> dict:
+    return {
+        "pid": os.getpid(),
+        "enabled": profiler.running,
+        "interval_ms": profiler.interval * 1000,
+        "slow_request_ms": profiler.slow_threshold * 1000 if profiler.slow_threshold else None,
+        "started_at": profiler.started_at,
+        "samples": len(profiler.samples),
+        "captures": len(profiler.captures),
+    }
+
+
+@router.get("/admin/profiler", response_model=ProfilerStatus)
+def get_profiler(current_user: User = Depends(deps.get_current_staff_user)) -> Any:
+    return profiler_status()
+
+
+@router.put("/admin/profiler", response_model=ProfilerStatus)
+def configure_profiler(
+    profiler_settings: ProfilerSettings,
+    current_user: User = Depends(deps.get_current_staff_user),
+) -> Any:
+    """
+    Switch stack sampling on or off in this worker, and optionally capture
+    file requests slower than slow_request_ms while it is on.
+    """
+    profiler.configure(
+        profiler_settings.enabled,
+        interval=profiler_settings.interval_ms / 1000 if profiler_settings.interval_ms else None,
+        slow_threshold=profiler_settings.slow_request_ms / 1000 if profiler_settings.slow_request_ms else None,
+    )
+    return profiler_status()
+
+
+@router.get("/admin/profiler/profile", response_class=PlainTextResponse)
+def get_profile(
+    seconds: Optional[float] = Query(None, gt=0),
+    current_user: User = Depends(deps.get_current_staff_user),
+) -> Any:
+    """
+    Get the samples taken so far, or in the last `seconds`, as collapsed
+    stacks for flamegraph.pl, speedscope or inferno.
+    """
+    return profiler.profile(seconds)
+
+
+@router.get("/admin/profiler/slow-requests", response_model=List[SlowRequestSummary])
+def list_slow_requests(current_user: User = Depends(deps.get_current_staff_user)) -> Any:
+    return list(reversed(profiler.captures))
+
+
+@router.get("/admin/profiler/slow-requests/{capture_id}", response_model=SlowRequestCapture)
+def get_slow_request(
+    capture_id: int,
+    current_user: User = Depends(deps.get_current_staff_user),
+) -> Any:
+    capture = profiler.get_capture(capture_id)
+    if not capture:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Capture not found"
+        )
+    return capture
+
+
+@router.get("/admin/profiler/slow-requests/{capture_id}/stacks", response_class=PlainTextResponse)
+def get_slow_request_stacks(
+    capture_id: int,
+    current_user: User = Depends(deps.get_current_staff_user),
+) -> Any:
+    capture = profiler.get_capture(capture_id)
+    if not capture:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Capture not found"
+        )
+    return capture["stacks"]
@@ -5,6 +5,7 @@ from pydantic import ValidationError
 from sqlalchemy.orm import Session
 
 from app.config import settings
+from app.core.revocation import revocation_list
 from app.database import get_db
 from app.models.user import User
 from app.schemas.user import TokenPayload
@@ -12,21 +13,41 @@ from app.schemas.user import TokenPayload
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl=f"{settings.API_PREFIX}/token")
 
 
-async def get_current_user(
-    db: Session = Depends(get_db), token: str = Depends(oauth2_scheme)
-) -> User:
+def decode_token(token: str, token_type: str = "access") -> TokenPayload:
+    """Decode a JWT and check it is of the expected type"""
     try:
         payload = jwt.decode(
             token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM]
         )
         token_data = TokenPayload(**payload)
     except (JWTError, ValidationError):
+        token_data = None
+    # Tokens issued before the type claim existed are access tokens
+    if token_data is None or (token_data.type or "access") != token_type:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Could not validate credentials",
             headers={"WWW-Authenticate": "Bearer"},
         )
-    
+    return token_data
+
+
+async def get_current_token(
+    db: Session = Depends(get_db), token: str = Depends(oauth2_scheme)
+) -> TokenPayload:
+    token_data = decode_token(token)
+    if token_data.jti and revocation_list.is_revoked(db, token_data.jti):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Token has been revoked",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    return token_data
+
+
+async def get_current_user(
+    db: Session = Depends(get_db), token_data: TokenPayload = Depends(get_current_token)
+) -> User:
     user = db.query(User).filter(User.id == token_data.sub).first()
     
     if not user:
@@ -44,4 +65,13 @@ def get_current_active_user(current_user: User = Depends(get_current_user)) -> U
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Inactive user"
         )
-    return current_user
\ No newline at end of file
+    return current_user
+
+
+def get_current_staff_user(current_user: User = Depends(get_current_active_user)) -> User:
+    if not current_user.is_staff:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Staff only"
+        )
+    return current_user
@@ -1,21 +1,35 @@
+import asyncio
 import logging
 import hashlib
+import mimetypes
 import os
 import time
 import random
 import string
-from typing import Any, List
-from celery.result import AsyncResult
-from fastapi import APIRouter, Depends, File, HTTPException, UploadFile, logger, status, BackgroundTasks
-from fastapi.responses import JSONResponse
+import uuid
+from datetime import datetime, timedelta
+from functools import partial
+from typing import Any, BinaryIO, Dict, Iterator, List, Optional, Tuple
+from urllib.parse import quote
+from fastapi import APIRouter, Depends, File, Header, HTTPException, Query, Request, UploadFile, logger, status, BackgroundTasks
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import FileResponse, JSONResponse, ORJSONResponse, Response, StreamingResponse
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
 
 from app.api import deps
 from app.config import settings
+from app.core import archive, storage
+from app.core.artifacts import TRANSFORMS, TransformError, artifact_key, artifact_store, normalize_params
+from app.core.cache import FileMetadata, content_cache, metadata_cache
+from app.core.chunks import open_chunked
+from app.crud import chunk as chunk_crud
 from app.crud import file as file_crud
 from app.models.user import User
-from app.schemas.file import FileUpload, FileUploadResponse, TaskStatus
-from app.tasks.file_processing import process_uploaded_file, process_multiple_files
+from app.schemas.file import (
+    ArchiveRequest, FileChangeFeed, FileUpload, FileUploadResponse, TaskStatus, TaskStatusBatch, TaskStatusBatchRequest
+)
+from app.tasks.client import dispatch_artifact, dispatch_file_task, dispatch_multiple_files
 
 logger = logging.getLogger(__name__)
 
@@ -29,111 +43,301 @@ def generate_file_hash(filename: str) -> str:
     return hashlib.sha256(hash_string.encode()).hexdigest()
 
 
-async def save_upload_file(file: UploadFile, file_hash: str) -> str:
-    """Save uploaded file to disk and return the file path"""
-    os.makedirs(settings.UPLOAD_DIR, exist_ok=True)
-    file_path = os.path.join(settings.UPLOAD_DIR, file_hash)
-    
-    with open(file_path, "wb") as buffer:
-        content = await file.read()
-        if len(content) > settings.MAX_UPLOAD_SIZE:
+def is_content_digest(value: str) -> bool:
+    """Check that value looks like a hex encoded SHA-256 digest"""
+    return storage.BLOB_NAME_RE.match(value) is not None
+
+
+async def read_upload_file(file: UploadFile) -> bytes:
+    """Read an uploaded file, rejecting it if it is over the size limit"""
+    content = await file.read()
+    if len(content) > settings.MAX_UPLOAD_SIZE:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"File size exceeds the limit of {settings.MAX_UPLOAD_SIZE} bytes",
+        )
+    return content
+
+
+async def save_upload_file(content: bytes, file_hash: str) -> str:
+    """
+    Save uploaded content to its storage nodes and return the file path.
+
+    With STORAGE_MODE "chunked" a single copy is written: the processing
+    task cuts it into chunks and removes it, so the file's content is only
+    written once more, as the chunks not stored yet.
+    """
+    copies = 1 if settings.STORAGE_MODE == "chunked" else None
+    return await run_in_threadpool(storage.write_blob, file_hash, content, copies)
+
+
+def request_fingerprint(files: List[Tuple[Optional[str], str]]) -> str:
+    """Hash of the (filename, content SHA-256) pairs an upload request sends"""
+    digest = hashlib.sha256()
+    for filename, content_sha256 in files:
+        digest.update(hashlib.sha256((filename or "").encode()).digest())
+        digest.update(bytes.fromhex(content_sha256))
+    return digest.hexdigest()
+
+
+def reserve_idempotent_request(
+    db: Session, user_id: int, scope: str, key: Optional[str], request_hash: str
+) -> Optional[Any]:
+    """
+    Claim an idempotency key before any work is done, or return the stored
+    response of the request that already used it.
+
+    The claim is an in-progress record under the key's unique constraint,
+    so a retry that arrives while the first request is still running gets
+    409 instead of doing the work a second time. A key reused for a
+    different request gets 422.
+    """
+    if not key:
+        return None
+    for _ in range(3):
+        record = file_crud.get_idempotency_key(db, user_id, scope, key)
+        if record is None:
+            try:
+                file_crud.reserve_idempotency_key(db, user_id, scope, key, request_hash)
+                db.commit()
+                return None
+            except IntegrityError:
+                db.rollback()
+                continue
+
+        now = datetime.now()
+        expired = record.created_at < now - timedelta(seconds=settings.IDEMPOTENCY_WINDOW_SECONDS)
+        abandoned = record.response is None and record.created_at < now - timedelta(
+            seconds=settings.IDEMPOTENCY_RESERVATION_TIMEOUT_SECONDS
+        )
+        if expired or abandoned:
+            claimed = file_crud.claim_idempotency_key(db, record, request_hash)
+            db.commit()
+            if claimed:
+                return None
+            continue
+
+        # Keys stored before request hashes were recorded cannot be checked
+        if record.request_hash and record.request_hash != request_hash:
             raise HTTPException(
-                status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
-                detail=f"File size exceeds the limit of {settings.MAX_UPLOAD_SIZE} bytes",
+                status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                detail="Idempotency-Key was already used for a different request"
             )
-        buffer.write(content)
-    
-    return file_path
+        if record.response is None:
+            break
+        return record.response
+
+    raise HTTPException(
+        status_code=status.HTTP_409_CONFLICT,
+        detail="A request with this Idempotency-Key is still in progress",
+        headers={"Retry-After": "1"},
+    )
+
+
+def complete_idempotent_request(db: Session, user_id: int, scope: str, key: Optional[str], response: Any) -> Any:
+    """Store the response for a claimed idempotency key, to be replayed to retries"""
+    if key:
+        file_crud.save_idempotent_response(db, user_id, scope, key, response)
+        db.commit()
+    return response
+
+
+def release_idempotent_request(db: Session, user_id: int, scope: str, key: Optional[str]) -> None:
+    """Give up the claim on an idempotency key after the request failed, so a retry runs it again"""
+    if not key:
+        return
+    try:
+        db.rollback()
+        file_crud.release_idempotency_key(db, user_id, scope, key)
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        logger.error(f"Error releasing idempotency key: {str(e)}")
 
 
 @router.post("/files/upload", response_model=FileUploadResponse)
 async def upload_file(
     background_tasks: BackgroundTasks,
     file: UploadFile = File(...),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key"),
     db: Session = Depends(deps.get_db),
     current_user: User = Depends(deps.get_current_active_user),
 ) -> Any:
     """
     Upload a single file and process it in the background.
+
+    Retries that repeat the Idempotency-Key header within the replay window
+    get the original response back instead of a second upload, and get 409
+    while the original upload is still running.
     """
+    content = await read_upload_file(file)
+    content_sha256 = hashlib.sha256(content).hexdigest()
+    replayed = reserve_idempotent_request(
+        db, current_user.id, "files.upload", idempotency_key, request_fingerprint([(file.filename, content_sha256)])
+    )
+    if replayed is not None:
+        return replayed
+
+    file_path = None
+    task_id = None
     try:
         # Generate file hash
         file_hash = generate_file_hash(file.filename)
 
         # Save the uploaded file
-        file_path = await save_upload_file(file, file_hash)
+        file_path = await save_upload_file(content, file_hash)
 
         # Create file record in the database
         file_data = {
             "file_hash": file_hash,
             "original_filename": file.filename,
             "file_path": file_path,
+            "content_sha256": content_sha256,
+            "size": len(content),
             "user_id": current_user.id,
             "status": "pending"
         }
         db_file = file_crud.create(db, file_data)
 
-        # Dispatch the task to process the file
-        task = process_uploaded_file.delay(file_hash)
-
-        # Save task info in the database
+        # Save task info in the database before dispatching, so the worker's
+        # state updates always find the row
+        task_id = str(uuid.uuid4())
         task_data = {
-            "task_id": task.id,
+            "task_id": task_id,
+            "user_id": current_user.id,
             "status": "pending"
         }
         file_crud.create_task_status(db, task_data)
         db.commit()
 
-        return {
-            "task_id": task.id,
+        # Dispatch the task to process the file
+        dispatch_file_task(file_hash, task_id)
+
+        response = {
+            "task_id": task_id,
             "file_hash": file_hash,
             "status": "processing"
         }
+    except HTTPException:
+        if file_path:
+            storage.remove_blob_copies(file_hash)
+        release_idempotent_request(db, current_user.id, "files.upload", idempotency_key)
+        raise
     except Exception as e:
         logger.error(f"Error uploading file: {str(e)}")
+        db.rollback()
+        if file_path:
+            # The records may already be committed; drop them with the blob
+            file_crud.purge(db, [file_hash])
+            file_crud.delete_task_statuses(db, [task_id])
+            db.commit()
+            storage.remove_blob_copies(file_hash)
+        release_idempotent_request(db, current_user.id, "files.upload", idempotency_key)
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Error uploading file: {str(e)}"
         )
 
+    return complete_idempotent_request(db, current_user.id, "files.upload", idempotency_key, response)
+
 
 @router.post("/files/upload-multiple", response_model=List[FileUploadResponse])
 async def upload_multiple_files(
     background_tasks: BackgroundTasks,
     files: List[UploadFile] = File(...),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key"),
     db: Session = Depends(deps.get_db),
     current_user: User = Depends(deps.get_current_active_user),
 ) -> Any:
     # ... existing validation code ...
 
+    # Hash every file first, one at a time, to claim the key before storing anything
+    digests = []
+    for file in files:
+        digests.append(hashlib.sha256(await read_upload_file(file)).hexdigest())
+        await file.seek(0)
+    replayed = reserve_idempotent_request(
+        db, current_user.id, "files.upload-multiple", idempotency_key,
+        request_fingerprint([(file.filename, digest) for file, digest in zip(files, digests)]),
+    )
+    if replayed is not None:
+        return replayed
+
     file_hashes = []
     response = []
-    for file in files:
-        file_hash = generate_file_hash(file.filename)
-        file_hashes.append(file_hash)
-        file_path = await save_upload_file(file, file_hash)
-        
-        # Create file record in the database
-        file_data = {
-            "file_hash": file_hash,
-            "original_filename": file.filename,
-            "file_path": file_path,
-            "user_id": current_user.id,
-            "status": "pending"
-        }
-        db_file = file_crud.create(db, file_data)
-    
-    # Process files in background
-    task = process_multiple_files.delay(file_hashes)
-    
+    task_id = None
+    try:
+        for file, content_sha256 in zip(files, digests):
+            file_hash = generate_file_hash(file.filename)
+            file_hashes.append(file_hash)
+            content = await file.read()
+            file_path = await save_upload_file(content, file_hash)
+
+            # Create file record in the database
+            file_data = {
+                "file_hash": file_hash,
+                "original_filename": file.filename,
+                "file_path": file_path,
+                "content_sha256": content_sha256,
+                "size": len(content),
+                "user_id": current_user.id,
+                "status": "pending"
+            }
+            db_file = file_crud.create(db, file_data)
+
+        # Process files in background
+        task_id = str(uuid.uuid4())
+        file_crud.create_task_status(db, {"task_id": task_id, "user_id": current_user.id, "status": "pending"})
+        db.commit()
+        dispatch_multiple_files(file_hashes, task_id)
+    except Exception as e:
+        logger.error(f"Error uploading files: {str(e)}")
+        db.rollback()
+        if file_hashes:
+            # Files stored before the failure are already committed; drop
+            # them so that a retry with the same key does not duplicate them
+            file_crud.purge(db, file_hashes)
+            file_crud.delete_task_statuses(db, [task_id])
+            db.commit()
+            for file_hash in file_hashes:
+                storage.remove_blob_copies(file_hash)
+        release_idempotent_request(db, current_user.id, "files.upload-multiple", idempotency_key)
+        raise
+
     # Prepare response with initial processing status
     response = [{
         "file_hash": file_hash,
-        "task_id": task.id,
+        "task_id": task_id,
         "status": "processing"
     } for file_hash in file_hashes]
-    
-    return response
+
+    return complete_idempotent_request(db, current_user.id, "files.upload-multiple", idempotency_key, response)
+
+
+@router.api_route("/files/check/{content_sha256}", methods=["GET", "HEAD"], response_model=FileUpload)
+def check_file_content(
+    content_sha256: str,
+    db: Session = Depends(deps.get_db),
+    current_user: User = Depends(deps.get_current_active_user),
+) -> Any:
+    """
+    Check whether the current user already stored a file with this SHA-256 digest.
+
+    Clients call this before uploading and skip the transfer when it returns 200.
+    """
+    content_sha256 = content_sha256.lower()
+    if not is_content_digest(content_sha256):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Digest must be a hex encoded SHA-256"
+        )
+    file_record = file_crud.get_user_file_by_digest(db, content_sha256, user_id=current_user.id)
+    if not file_record:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="File not found"
+        )
+    return file_record
 
 
 @router.get("/files/task-status/{task_id}", response_model=TaskStatus)
@@ -143,45 +347,55 @@ def check_task_status(
     current_user: User = Depends(deps.get_current_active_user),
 ) -> Any:
     """
-    Check the status of a file processing task with enhanced debugging.
+    Check the status of a file processing task.
+
+    task_statuses is the only record of task state; it is written by the
+    worker's task signal handlers.
     """
-    logger.info(f"Checking status for task_id: {task_id}")
-    
-    # Retrieve task status from database
     task_status = file_crud.get_task_status(db, task_id)
-    
-    if task_status:
-        logger.info(f"Task status found in database: {task_status.__dict__}")
-        return task_status
-    
-    # Check Celery task status as a fallback
-    try:
-        celery_task = AsyncResult(task_id)
-        logger.info(f"Celery task status: {celery_task.status}")
-        
-        if celery_task.status and celery_task.status.lower() in ["pending", "started", "success", "failure"]:
-            task_data = {
-                "task_id": task_id,
-                "status": celery_task.status.lower()
-            }
-            task_status = file_crud.create_task_status(db, task_data)
-            db.commit()
-            return task_status
-        else:
-            logger.warning(f"Task {task_id} not found in Celery.")
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail=f"Task {task_id} not found in both database and Celery"
-            )
-    except Exception as e:
-        logger.error(f"Error retrieving Celery task status: {e}")
+    if not task_status:
         raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Error retrieving Celery task status: {str(e)}"
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Task {task_id} not found"
         )
+    return task_status
 
 
-@router.get("/files", response_model=List[FileUpload])
+@router.post("/files/task-status/batch", response_model=TaskStatusBatch)
+def check_task_status_batch(
+    batch: TaskStatusBatchRequest,
+    db: Session = Depends(deps.get_db),
+    current_user: User = Depends(deps.get_current_active_user),
+) -> Any:
+    """
+    Check the status of many tasks and files in one request.
+
+    Task ids are resolved with a single query against the current user's
+    tasks and file hashes with a single query against their files; anything
+    else is reported as not found.
+    """
+    task_ids = list(dict.fromkeys(batch.task_ids))
+    file_hashes = list(dict.fromkeys(batch.file_hashes))
+    if len(task_ids) + len(file_hashes) > settings.TASK_STATUS_BATCH_MAX:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"At most {settings.TASK_STATUS_BATCH_MAX} task ids and file hashes per request"
+        )
+
+    tasks = file_crud.get_user_task_statuses(db, task_ids, user_id=current_user.id)
+    found_task_ids = {task.task_id for task in tasks}
+
+    files = file_crud.get_user_file_statuses(db, file_hashes, user_id=current_user.id)
+    found_file_hashes = {file["file_hash"] for file in files}
+
+    not_found = [task_id for task_id in task_ids if task_id not in found_task_ids]
+    not_found += [file_hash for file_hash in file_hashes if file_hash not in found_file_hashes]
+    return {"tasks": tasks, "files": files, "not_found": not_found}
+
+
+# Listings return ORJSONResponse directly: the rows are already shaped like
+# the schema, so response_model only documents them and validation is skipped.
+@router.get("/files", response_model=List[FileUpload], response_class=ORJSONResponse)
 def get_user_files(
     db: Session = Depends(deps.get_db),
     current_user: User = Depends(deps.get_current_active_user),
@@ -191,6 +405,402 @@ def get_user_files(
     """
     Get all files uploaded by the current user.
     """
-    return file_crud.get_user_files(
+    return ORJSONResponse(file_crud.get_user_file_rows(
         db, user_id=current_user.id, skip=skip, limit=limit
-    )
\ No newline at end of file
+    ))
+
+
+@router.get("/files/trash", response_model=List[FileUpload], response_class=ORJSONResponse)
+def get_user_trash(
+    db: Session = Depends(deps.get_db),
+    current_user: User = Depends(deps.get_current_active_user),
+    skip: int = 0,
+    limit: int = 100,
+) -> Any:
+    """
+    Get the files the current user has deleted and can still restore.
+    """
+    return ORJSONResponse(file_crud.get_user_file_rows(
+        db, user_id=current_user.id, skip=skip, limit=limit, deleted=True
+    ))
+
+
+@router.post("/files/archive", response_class=StreamingResponse)
+def download_archive(
+    archive_in: ArchiveRequest,
+    db: Session = Depends(deps.get_db),
+    current_user: User = Depends(deps.get_current_active_user),
+) -> Any:
+    """
+    Download several files as one ZIP archive.
+
+    The archive is streamed while it is built, straight from the stored
+    files, so the first bytes go out at once and nothing is staged. With
+    compression "auto", formats that are already compressed are stored as is.
+    """
+    file_hashes = list(dict.fromkeys(archive_in.file_hashes))
+    if not file_hashes or len(file_hashes) > settings.ARCHIVE_MAX_FILES:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Give between 1 and {settings.ARCHIVE_MAX_FILES} file hashes"
+        )
+
+    records = {record.file_hash: record for record in file_crud.get_user_files_by_hashes(
+        db, file_hashes, user_id=current_user.id
+    )}
+    missing = [file_hash for file_hash in file_hashes if file_hash not in records]
+    if missing:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Files not found: {', '.join(missing)}"
+        )
+
+    # Everything is resolved before streaming starts: once the status line
+    # is sent, a missing file can only cut the download short. The session
+    # is closed by then too, so chunk lists are loaded here.
+    file_chunks = chunk_crud.get_files_chunks(
+        db, [file_hash for file_hash in file_hashes if records[file_hash].is_chunked]
+    )
+    entries = []
+    used_names = set()
+    for file_hash in file_hashes:
+        record = records[file_hash]
+        if record.is_chunked:
+            chunks = file_chunks.get(file_hash, [])
+            opener = partial(open_chunked, chunks)
+            size = sum(chunk_size for _, chunk_size in chunks)
+        else:
+            file_path = storage.locate_blob(file_hash, record.file_path)
+            opener = partial(open, file_path, "rb")
+            try:
+                size = os.path.getsize(file_path) if file_path else None
+            except OSError:
+                size = None
+        if size is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=f"Content of file {file_hash} is not available"
+            )
+        entries.append(archive.ArchiveEntry(
+            archive.archive_name(record.original_filename, used_names), opener, size, record.created_at
+        ))
+
+    return StreamingResponse(
+        archive.stream_zip(entries, archive_in.compression),
+        media_type="application/zip",
+        headers={"Content-Disposition": 'attachment; filename="files.zip"'},
+    )
+
+
+@router.get("/files/search", response_model=List[FileUpload], response_class=ORJSONResponse)
+def search_files(
+    q: Optional[str] = Query(None, max_length=255),
+    prefix: Optional[str] = Query(None, max_length=255),
+    ext: Optional[str] = Query(None, max_length=32),
+    limit: int = Query(50, ge=1, le=settings.SEARCH_MAX_RESULTS),
+    db: Session = Depends(deps.get_db),
+    current_user: User = Depends(deps.get_current_active_user),
+) -> Any:
+    """
+    Search the current user's files by name.
+
+    `q` matches anywhere in the name, `prefix` at its start and `ext` the
+    extension; all given filters must match. Matching is case-insensitive.
+    """
+    ext = ext.lstrip(".") if ext else ext
+    if not (q or prefix or ext):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Give at least one of q, prefix or ext"
+        )
+    return ORJSONResponse(file_crud.search_user_files(
+        db, user_id=current_user.id, q=q, prefix=prefix, ext=ext, limit=limit
+    ))
+
+
+def poll_changes(db: Session, user_id: int, since: int, limit: int) -> Tuple[List[Dict[str, Any]], int]:
+    """
+    Number newly committed changes, then read the user's changes up to the
+    last number handed out, which is read first so that no change between
+    the two reads can fall behind the cursor returned.
+    """
+    file_crud.sequence_changes(db)
+    until = file_crud.get_change_cursor(db)
+    return file_crud.get_user_changes(db, user_id, since, until, limit), until
+
+
+@router.get("/files/changes", response_model=FileChangeFeed, response_class=ORJSONResponse)
+async def get_file_changes(
+    since: Optional[int] = Query(None, ge=0),
+    limit: int = Query(settings.CHANGE_FEED_PAGE_SIZE, ge=1, le=settings.CHANGE_FEED_PAGE_SIZE),
+    wait: int = Query(0, ge=0, le=settings.CHANGE_FEED_MAX_WAIT_SECONDS),
+    db: Session = Depends(deps.get_db),
+    current_user: User = Depends(deps.get_current_active_user),
+) -> Any:
+    """
+    Get the changes to the current user's files after the `since` cursor.
+
+    Without `since` this only returns the current cursor: take it, list the
+    files once, then follow the feed from there. Every change after a
+    cursor is delivered, in the order the changes were numbered after
+    commit. With `wait`, the request is held for up to that many seconds
+    until a change arrives; it checks the database every
+    CHANGE_FEED_POLL_INTERVAL_SECONDS meanwhile. A cursor older than the
+    retained history gets 410 and the client has to list again.
+    """
+    user_id = current_user.id
+
+    if since is None:
+        await run_in_threadpool(file_crud.sequence_changes, db)
+        cursor = await run_in_threadpool(file_crud.get_change_cursor, db)
+        return ORJSONResponse({"changes": [], "cursor": cursor, "has_more": False})
+
+    oldest = await run_in_threadpool(file_crud.get_oldest_change_seq, db)
+    if oldest is not None and since < oldest - 1:
+        raise HTTPException(
+            status_code=status.HTTP_410_GONE,
+            detail="Cursor is older than the retained change history, list files again"
+        )
+
+    deadline = time.monotonic() + wait
+    while True:
+        changes, until = await run_in_threadpool(poll_changes, db, user_id, since, limit)
+        remaining = deadline - time.monotonic()
+        if changes or remaining <= 0:
+            break
+        # End the transaction: the next poll must see new commits, and the
+        # connection goes back to the pool while this request waits
+        await run_in_threadpool(db.rollback)
+        await asyncio.sleep(min(settings.CHANGE_FEED_POLL_INTERVAL_SECONDS, remaining))
+
+    cursor = changes[-1]["seq"] if changes else since
+    if len(changes) < limit:
+        # Caught up: skip past other users' changes so an idle cursor never expires
+        cursor = max(cursor, until)
+    return ORJSONResponse({"changes": changes, "cursor": cursor, "has_more": len(changes) == limit})
+
+
+def content_disposition(filename: str) -> str:
+    """The Content-Disposition header FileResponse sends for filename"""
+    quoted = quote(filename)
+    if quoted != filename:
+        return f"attachment; filename*=utf-8''{quoted}"
+    return f'attachment; filename="{filename}"'
+
+
+def iter_content(source: BinaryIO) -> Iterator[bytes]:
+    with source:
+        while True:
+            chunk = source.read(settings.CHUNK_SIZE)
+            if not chunk:
+                break
+            yield chunk
+
+
+def get_file_metadata(db: Session, file_hash: str) -> Optional[FileMetadata]:
+    metadata = metadata_cache.get(file_hash)
+    if metadata is None:
+        record = file_crud.get(db, file_hash)
+        if record is None:
+            return None
+        metadata = FileMetadata(
+            file_hash=record.file_hash,
+            user_id=record.user_id,
+            original_filename=record.original_filename,
+            content_sha256=record.content_sha256,
+            size=record.size,
+            file_path=record.file_path,
+            media_type=mimetypes.guess_type(record.original_filename or "")[0] or "application/octet-stream",
+            is_deleted=bool(record.is_deleted),
+            is_chunked=bool(record.is_chunked),
+        )
+        metadata_cache.put(metadata)
+    return metadata
+
+
+@router.get("/files/{file_hash}/download")
+def download_file(
+    file_hash: str,
+    if_none_match: Optional[str] = Header(None),
+    db: Session = Depends(deps.get_db),
+    current_user: User = Depends(deps.get_current_active_user),
+) -> Any:
+    """
+    Download a file.
+
+    Small files that are read often are served from memory: the record
+    comes from a short-lived metadata cache and the content from a cache
+    keyed by its SHA-256, so a hot read needs neither a query nor a disk read.
+    """
+    metadata = get_file_metadata(db, file_hash)
+    if not metadata or metadata.user_id != current_user.id or metadata.is_deleted:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="File not found"
+        )
+
+    headers = {}
+    if metadata.content_sha256:
+        headers["ETag"] = f'"{metadata.content_sha256}"'
+        if if_none_match and headers["ETag"] in if_none_match:
+            return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    cacheable = metadata.content_sha256 and metadata.size is not None and metadata.size <= content_cache.max_item_bytes
+    content = content_cache.get(metadata.content_sha256) if cacheable else None
+    if content is None:
+        file_path = None
+        if not metadata.is_chunked:
+            # Read from whichever replica is available
+            file_path = storage.locate_blob(file_hash, metadata.file_path)
+            if not file_path:
+                # A chunked file has no blob any more, and the cached record may predate that
+                metadata_cache.forget(file_hash)
+                metadata = get_file_metadata(db, file_hash)
+                if metadata is None or not metadata.is_chunked:
+                    raise HTTPException(
+                        status_code=status.HTTP_404_NOT_FOUND,
+                        detail="File content not found"
+                    )
+        if file_path:
+            if not cacheable:
+                return FileResponse(
+                    file_path, media_type=metadata.media_type, filename=metadata.original_filename, headers=headers
+                )
+            opener = partial(open, file_path, "rb")
+        else:
+            # The session is closed before a streamed body is sent, so the chunk list is loaded now
+            chunks = chunk_crud.get_file_chunks(db, file_hash)
+            if not cacheable:
+                headers["Content-Length"] = str(sum(size for _, size in chunks))
+                if metadata.original_filename:
+                    headers["Content-Disposition"] = content_disposition(metadata.original_filename)
+                return StreamingResponse(
+                    iter_content(open_chunked(chunks)), media_type=metadata.media_type, headers=headers
+                )
+            opener = partial(open_chunked, chunks)
+        try:
+            with opener() as source:
+                content = source.read()
+        except FileNotFoundError:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="File content not found"
+            )
+        content_cache.put(metadata.content_sha256, content)
+    if metadata.original_filename:
+        headers["Content-Disposition"] = content_disposition(metadata.original_filename)
+    return Response(content, media_type=metadata.media_type, headers=headers)
+
+
+@router.get("/files/{file_hash}/artifacts/{transform}")
+def get_artifact(
+    file_hash: str,
+    transform: str,
+    request: Request,
+    db: Session = Depends(deps.get_db),
+    current_user: User = Depends(deps.get_current_active_user),
+) -> Any:
+    """
+    Get a derived artifact of a file: `preview` (?bytes=), `gzip` (?level=)
+    or `thumbnail` (?width=&height=).
+
+    The first request queues its generation and gets 202 with Retry-After;
+    concurrent requests for the same artifact share that one job. Later
+    requests get the stored artifact.
+    """
+    metadata = get_file_metadata(db, file_hash)
+    if not metadata or metadata.user_id != current_user.id or metadata.is_deleted:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="File not found"
+        )
+    try:
+        params = normalize_params(transform, dict(request.query_params))
+    except TransformError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+
+    key = artifact_key(file_hash, transform, params)
+    path = artifact_store.get(key, transform)
+    if path:
+        return FileResponse(path, media_type=TRANSFORMS[transform].media_type)
+
+    error = artifact_store.get_error(key)
+    if error:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=f"Could not generate {transform}: {error}"
+        )
+
+    if artifact_store.acquire(key):
+        try:
+            dispatch_artifact(file_hash, transform, params)
+        except Exception:
+            artifact_store.release(key)
+            raise
+    return JSONResponse(
+        {"status": "pending", "file_hash": file_hash, "transform": transform},
+        status_code=status.HTTP_202_ACCEPTED,
+        headers={"Retry-After": str(settings.ARTIFACT_RETRY_AFTER_SECONDS)},
+    )
+
+
+@router.get("/files/cache/stats")
+def get_file_cache_stats(
+    current_user: User = Depends(deps.get_current_staff_user),
+) -> Any:
+    """
+    Hit and miss counts of this worker process's file caches. Staff only.
+    """
+    return {"process": os.getpid(), "content": content_cache.stats(), "metadata": metadata_cache.stats()}
+
+
+@router.delete("/files/{file_hash}", response_model=FileUpload)
+def delete_file(
+    file_hash: str,
+    db: Session = Depends(deps.get_db),
+    current_user: User = Depends(deps.get_current_active_user),
+) -> Any:
+    """
+    Move a file to the trash. It is purged permanently once the retention period expires.
+    """
+    file_record = file_crud.get_user_file(db, file_hash, user_id=current_user.id)
+    if not file_record or file_record.is_deleted:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="File not found"
+        )
+    if not file_crud.soft_delete(db, file_record):
+        # Deleted or purged by a concurrent request
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="File not found"
+        )
+    metadata_cache.forget(file_hash)
+    return file_record
+
+
+@router.post("/files/{file_hash}/restore", response_model=FileUpload)
+def restore_file(
+    file_hash: str,
+    db: Session = Depends(deps.get_db),
+    current_user: User = Depends(deps.get_current_active_user),
+) -> Any:
+    """
+    Restore a file from the trash.
+    """
+    file_record = file_crud.get_user_file(db, file_hash, user_id=current_user.id)
+    if not file_record or not file_record.is_deleted:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="File not found in trash"
+        )
+    if not file_crud.restore(db, file_record):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="File not found in trash"
+        )
+    metadata_cache.forget(file_hash)
+    return file_record
@@ -1,19 +1,58 @@
 from datetime import timedelta
 from typing import Any, List
 
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, status
 from fastapi.security import OAuth2PasswordRequestForm
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
 
 from app.api import deps
 from app.config import settings
+from app.core.revocation import revocation_list
 from app.core.security import create_access_token, get_password_hash, verify_password
+from app.crud import token as token_crud
 from app.crud import user as user_crud
-from app.schemas.user import User, UserCreate, Token
+from app.schemas.user import User, UserCreate, Token, TokenPayload, TokenRefresh
 
 router = APIRouter()
 
 
+def issue_tokens(user_id: int) -> dict:
+    """Create a new access and refresh token pair for a user"""
+    access_token_expires = timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
+    refresh_token_expires = timedelta(days=settings.REFRESH_TOKEN_EXPIRE_DAYS)
+
+    access_token = create_access_token(
+        user_id, expires_delta=access_token_expires
+    )
+    refresh_token = create_access_token(
+        user_id, expires_delta=refresh_token_expires, token_type="refresh"
+    )
+
+    return {
+        "access_token": access_token,
+        "refresh_token": refresh_token,
+        "token_type": "bearer",
+    }
+
+
+def revoke_token(db: Session, token_data: TokenPayload) -> bool:
+    """
+    Record a token as revoked. Returns False if it already was.
+
+    The unique jti makes this the point where two concurrent refreshes with
+    the same token are told apart: only one insert succeeds.
+    """
+    try:
+        token_crud.revoke(db, token_data.jti, token_data.exp.replace(tzinfo=None))
+        db.commit()
+    except IntegrityError:
+        db.rollback()
+        return False
+    revocation_list.remember(token_data.jti)
+    return True
+
+
 @router.post("/register", response_model=User, status_code=status.HTTP_201_CREATED)
 def register_user(
     *,
@@ -60,34 +99,76 @@ def login_access_token(
             detail="Incorrect username or password",
         )
 
-    access_token_expires = timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
-    refresh_token_expires = timedelta(days=settings.REFRESH_TOKEN_EXPIRE_DAYS)
+    return issue_tokens(user.id)
 
-    access_token = create_access_token(
-        user.id, expires_delta=access_token_expires
-    )
-    refresh_token = create_access_token(
-        user.id, expires_delta=refresh_token_expires, token_type="refresh"
-    )
 
-    return {
-        "access_token": access_token,
-        "refresh_token": refresh_token,
-        "token_type": "bearer",
-    }
+@router.post("/token/refresh", response_model=Token)
+def refresh_access_token(
+    token_in: TokenRefresh,
+    db: Session = Depends(deps.get_db),
+) -> Any:
+    """
+    Exchange a refresh token for a new access token and refresh token.
+
+    No password is checked, so renewing a session costs a signature check and
+    a couple of indexed queries instead of a bcrypt verify. Refresh tokens are
+    single use: the presented token is revoked, and presenting it again fails.
+    """
+    token_data = deps.decode_token(token_in.refresh_token, token_type="refresh")
+    if not token_data.jti or not token_data.exp or revocation_list.is_revoked(db, token_data.jti):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid refresh token",
+        )
+
+    user = user_crud.get(db, token_data.sub)
+    if not user or not user.is_active:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid refresh token",
+        )
+
+    if not revoke_token(db, token_data):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Refresh token has already been used",
+        )
+    return issue_tokens(user.id)
+
+
+@router.post("/token/revoke", status_code=status.HTTP_204_NO_CONTENT)
+def revoke_tokens(
+    token_in: TokenRefresh,
+    db: Session = Depends(deps.get_db),
+    token_data: TokenPayload = Depends(deps.get_current_token),
+) -> None:
+    """
+    Log out: revoke the refresh token and the access token used to call this.
+    """
+    refresh_data = deps.decode_token(token_in.refresh_token, token_type="refresh")
+    if refresh_data.sub != token_data.sub:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Refresh token belongs to another user",
+        )
+    for revoked in (refresh_data, token_data):
+        if revoked.jti and revoked.exp:
+            revoke_token(db, revoked)
 
 
 @router.get("/users", response_model=List[User])
 def get_users(
     db: Session = Depends(deps.get_db),
     current_user: User = Depends(deps.get_current_active_user),
+    skip: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1, le=1000),
 ) -> Any:
     """
-    Retrieve all users if the current user is staff, otherwise return only the current user's information.
+    Retrieve a page of users if the current user is staff, otherwise return only the current user's information.
     """
     if current_user.is_staff:
-        # Staff user: Retrieve all users
-        users = user_crud.get_all(db)
+        # Staff user: Retrieve a page of users
+        users = user_crud.get_all(db, skip=skip, limit=limit)
         return users
     else:
         # Non-staff user: Return only their own information
@@ -0,0 +1,55 @@
+import logging
+
+from app.config import settings
+from app.core.rate_limit import is_upload_request, reject
+from app import database
+
+logger = logging.getLogger(__name__)
+
+
+def db_pool_saturated() -> bool:
+    """True when every connection the pool may open is checked out"""
+    pool = database.engine.pool
+    checkedout = getattr(pool, "checkedout", None)
+    if checkedout is None:
+        return False
+    return checkedout() >= settings.DB_POOL_SIZE + settings.DB_MAX_OVERFLOW
+
+
+class AdmissionControlMiddleware:
+    """
+    Shed load with 503 and Retry-After instead of queueing it.
+
+    Uploads are refused once MAX_INFLIGHT_UPLOADS are already being
+    received by this process, and API requests are refused while the
+    database pool has no connection left to hand out.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.inflight_uploads = 0
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not scope["path"].startswith(settings.API_PREFIX):
+            await self.app(scope, receive, send)
+            return
+
+        if db_pool_saturated():
+            logger.warning("Database pool saturated, shedding request")
+            await reject(scope, receive, send, 503, "Server busy, retry later", settings.ADMISSION_RETRY_AFTER_SECONDS)
+            return
+
+        if not is_upload_request(scope):
+            await self.app(scope, receive, send)
+            return
+
+        if self.inflight_uploads >= settings.MAX_INFLIGHT_UPLOADS:
+            logger.warning(f"{self.inflight_uploads} uploads in flight, shedding upload")
+            await reject(scope, receive, send, 503, "Too many uploads in progress, retry later", settings.ADMISSION_RETRY_AFTER_SECONDS)
+            return
+
+        self.inflight_uploads += 1
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.inflight_uploads -= 1
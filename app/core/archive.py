@@ -0,0 +1,116 @@
+import os
+import zipfile
+from collections import deque
+from datetime import datetime
+from typing import BinaryIO, Callable, Deque, Iterable, Iterator, NamedTuple, Optional
+
+from app.config import settings
+
+# Formats that are already compressed; deflating them again costs CPU for nothing
+COMPRESSED_EXTENSIONS = {
+    ".7z", ".avi", ".bz2", ".docx", ".flac", ".gif", ".gz", ".heic", ".jpeg", ".jpg",
+    ".m4a", ".mkv", ".mov", ".mp3", ".mp4", ".ogg", ".pdf", ".png", ".pptx", ".rar",
+    ".webm", ".webp", ".xlsx", ".xz", ".zip", ".zst",
+}
+
+COMPRESSION_MODES = ("auto", "stored", "deflate")
+
+
+class ArchiveEntry(NamedTuple):
+    name: str
+    opener: Callable[[], BinaryIO]  # Opens the member's content for reading
+    size: int
+    modified: Optional[datetime]
+
+
+class StreamSink:
+    """
+    Write-only, non-seekable file object that collects what zipfile writes
+    until the caller drains it.
+
+    zipfile notices that it cannot seek and writes a data descriptor after
+    each member instead of going back to patch the local header, so the
+    archive comes out strictly front to back.
+    """
+
+    def __init__(self):
+        self._chunks: Deque[bytes] = deque()
+        self._position = 0
+
+    def write(self, data) -> int:
+        if data:
+            self._chunks.append(bytes(data))
+            self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def seekable(self) -> bool:
+        return False
+
+    def flush(self) -> None:
+        pass
+
+    def drain(self) -> Iterator[bytes]:
+        while self._chunks:
+            yield self._chunks.popleft()
+
+
+def compression_for(name: str, mode: str) -> int:
+    if mode == "stored":
+        return zipfile.ZIP_STORED
+    if mode == "auto" and os.path.splitext(name)[1].lower() in COMPRESSED_EXTENSIONS:
+        return zipfile.ZIP_STORED
+    return zipfile.ZIP_DEFLATED
+
+
+def archive_name(name: Optional[str], used: set) -> str:
+    """Make a file name safe and unique inside the archive"""
+    name = (name or "file").replace("\\", "/").rsplit("/", 1)[-1].strip() or "file"
+    if name in (".", ".."):
+        name = "file"
+    stem, ext = os.path.splitext(name)
+    candidate, counter = name, 1
+    while candidate in used:
+        candidate = f"{stem} ({counter}){ext}"
+        counter += 1
+    used.add(candidate)
+    return candidate
+
+
+def zip_timestamp(modified: Optional[datetime]) -> tuple:
+    # ZIP timestamps start in 1980
+    if modified is None or modified.year < 1980:
+        return (1980, 1, 1, 0, 0, 0)
+    return modified.timetuple()[:6]
+
+
+def stream_zip(entries: Iterable[ArchiveEntry], compression: str = "auto") -> Iterator[bytes]:
+    """
+    Yield a ZIP archive of entries piece by piece as it is built.
+
+    Each member is read in CHUNK_SIZE pieces and handed on as soon
+    as zipfile has written it, so memory stays bounded by one chunk whatever
+    the size of the archive. Members whose size needs it get ZIP64 headers,
+    and the central directory switches to ZIP64 on its own once there are
+    too many members or the archive passes 4 GiB.
+    """
+    sink = StreamSink()
+    with zipfile.ZipFile(sink, mode="w", allowZip64=True) as archive:
+        for entry in entries:
+            info = zipfile.ZipInfo(entry.name, date_time=zip_timestamp(entry.modified))
+            info.compress_type = compression_for(entry.name, compression)
+            info.external_attr = 0o644 << 16
+            # zipfile decides on ZIP64 from the expected size before writing
+            info.file_size = entry.size
+            with entry.opener() as source, archive.open(info, mode="w") as member:
+                while True:
+                    chunk = source.read(settings.CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    member.write(chunk)
+                    yield from sink.drain()
+            yield from sink.drain()
+    yield from sink.drain()
+
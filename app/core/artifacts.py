@@ -0,0 +1,234 @@
+"""
+Derived artifacts (previews, thumbnails, compressed copies) of stored files.
+
+Artifacts are generated on first request by the generate_artifact worker
+task and kept in ARTIFACT_DIR, apart from the uploads. They are keyed by
+(file_hash, transform, params); a stored blob never changes, so neither does
+its artifact. The directory is kept under ARTIFACT_CACHE_MAX_BYTES by
+evicting the least recently used artifacts, tracked by file mtime, which a
+cache hit refreshes.
+"""
+import gzip
+import hashlib
+import importlib.util
+import json
+import logging
+import os
+import shutil
+import time
+from typing import Any, BinaryIO, Callable, Dict, Iterator, NamedTuple, Optional, Tuple
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class TransformError(ValueError):
+    """Raised for an unknown transform or invalid parameters"""
+
+
+class Transform(NamedTuple):
+    media_type: str
+    extension: str
+    defaults: Dict[str, int]
+    limits: Dict[str, Tuple[int, int]]
+    generate: Callable[[BinaryIO, str, Dict[str, int]], None]  # (source, target path, params)
+    requires: Optional[str] = None  # Optional package the transform needs
+
+
+def generate_preview(source: BinaryIO, target_path: str, params: Dict[str, int]) -> None:
+    """The first `bytes` bytes of the file, as text"""
+    head = source.read(params["bytes"])
+    with open(target_path, "w", encoding="utf-8") as target:
+        target.write(head.decode("utf-8", errors="replace"))
+
+
+def generate_gzip(source: BinaryIO, target_path: str, params: Dict[str, int]) -> None:
+    with gzip.open(target_path, "wb", compresslevel=params["level"]) as target:
+        shutil.copyfileobj(source, target, settings.CHUNK_SIZE)
+
+
+def generate_thumbnail(source: BinaryIO, target_path: str, params: Dict[str, int]) -> None:
+    # Pillow is optional; without it only this transform is unavailable
+    from PIL import Image
+
+    with Image.open(source) as image:
+        image.thumbnail((params["width"], params["height"]))
+        image.convert("RGB").save(target_path, format="JPEG", quality=85)
+
+
+TRANSFORMS: Dict[str, Transform] = {
+    "preview": Transform("text/plain", ".txt", {"bytes": 4096}, {"bytes": (1, 65536)}, generate_preview),
+    "gzip": Transform("application/gzip", ".gz", {"level": 6}, {"level": (1, 9)}, generate_gzip),
+    "thumbnail": Transform(
+        "image/jpeg", ".jpg",
+        {"width": 256, "height": 256}, {"width": (16, 2048), "height": (16, 2048)},
+        generate_thumbnail, requires="PIL",
+    ),
+}
+
+
+def normalize_params(transform: str, params: Dict[str, Any]) -> Dict[str, int]:
+    """
+    Validate params for a transform and fill in defaults.
+
+    Equivalent requests must map to the same artifact, so the result holds
+    every parameter, as an int.
+    """
+    spec = TRANSFORMS.get(transform)
+    if spec is None:
+        raise TransformError(f"Unknown transform {transform}, expected one of {', '.join(TRANSFORMS)}")
+    if spec.requires and importlib.util.find_spec(spec.requires) is None:
+        raise TransformError(f"The {transform} transform is not available on this server")
+    unknown = set(params) - set(spec.defaults)
+    if unknown:
+        raise TransformError(f"Unknown parameters for {transform}: {', '.join(sorted(unknown))}")
+    normalized = {}
+    for name, default in spec.defaults.items():
+        try:
+            value = int(params.get(name, default))
+        except (TypeError, ValueError):
+            raise TransformError(f"Parameter {name} must be an integer")
+        low, high = spec.limits[name]
+        if not low <= value <= high:
+            raise TransformError(f"Parameter {name} must be between {low} and {high}")
+        normalized[name] = value
+    return normalized
+
+
+def artifact_key(file_hash: str, transform: str, params: Dict[str, int]) -> str:
+    canonical = json.dumps([file_hash, transform, params], sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+class ArtifactStore:
+    def __init__(self, root: str, max_bytes: int, lock_timeout: float):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.lock_timeout = lock_timeout
+
+    def path(self, key: str, transform: str) -> str:
+        # Two levels of fan-out keep directories small
+        return os.path.join(self.root, key[:2], key + TRANSFORMS[transform].extension)
+
+    def get(self, key: str, transform: str) -> Optional[str]:
+        """Return the artifact's path if it exists, marking it recently used"""
+        path = self.path(key, transform)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return path
+
+    def generate(self, key: str, transform: str, source: BinaryIO, params: Dict[str, int]) -> str:
+        """Build an artifact; it appears under its final name only when complete"""
+        path = self.path(key, transform)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        partial = f"{path}.{os.getpid()}.partial"
+        try:
+            TRANSFORMS[transform].generate(source, partial, params)
+            os.replace(partial, path)
+        finally:
+            if os.path.exists(partial):
+                os.remove(partial)
+        return path
+
+    # Coalescing: whoever creates the lock file queues the job, everyone
+    # else waits for the artifact. A lock older than lock_timeout belongs to
+    # a job that died and is taken over.
+
+    def _lock_path(self, key: str) -> str:
+        return os.path.join(self.root, key[:2], key + ".lock")
+
+    def _error_path(self, key: str) -> str:
+        return os.path.join(self.root, key[:2], key + ".error")
+
+    def acquire(self, key: str) -> bool:
+        lock_path = self._lock_path(key)
+        os.makedirs(os.path.dirname(lock_path), exist_ok=True)
+        for _ in range(2):
+            try:
+                os.close(os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+                return True
+            except FileExistsError:
+                try:
+                    if time.time() - os.path.getmtime(lock_path) < self.lock_timeout:
+                        return False
+                    logger.warning(f"Taking over stale artifact lock {lock_path}")
+                    os.remove(lock_path)
+                except FileNotFoundError:
+                    pass
+        return False
+
+    def release(self, key: str) -> None:
+        try:
+            os.remove(self._lock_path(key))
+        except FileNotFoundError:
+            pass
+
+    def record_error(self, key: str, error: str) -> None:
+        with open(self._error_path(key), "w") as marker:
+            marker.write(error)
+
+    def get_error(self, key: str) -> Optional[str]:
+        """Return why the last attempt failed; it may be retried after lock_timeout"""
+        error_path = self._error_path(key)
+        try:
+            if time.time() - os.path.getmtime(error_path) >= self.lock_timeout:
+                os.remove(error_path)
+                return None
+            with open(error_path) as marker:
+                return marker.read()
+        except FileNotFoundError:
+            return None
+
+    def clear_error(self, key: str) -> None:
+        try:
+            os.remove(self._error_path(key))
+        except FileNotFoundError:
+            pass
+
+    # Eviction
+
+    def iter_artifacts(self) -> Iterator[Tuple[float, int, str]]:
+        """Yield (mtime, size, path) of every complete artifact"""
+        if not os.path.isdir(self.root):
+            return
+        for shard in os.scandir(self.root):
+            if not shard.is_dir():
+                continue
+            for entry in os.scandir(shard.path):
+                if entry.name.endswith((".lock", ".error", ".partial")):
+                    continue
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                yield stat.st_mtime, stat.st_size, entry.path
+
+    def evict(self) -> Tuple[int, int]:
+        """
+        Delete least recently used artifacts until the store fits its budget.
+
+        Returns the number of artifacts removed and the bytes left.
+        """
+        artifacts = sorted(self.iter_artifacts())
+        total = sum(size for _, size, _ in artifacts)
+        removed = 0
+        for _, size, path in artifacts:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+            removed += 1
+        return removed, total
+
+
+artifact_store = ArtifactStore(
+    root=settings.ARTIFACT_DIR,
+    max_bytes=settings.ARTIFACT_CACHE_MAX_BYTES,
+    lock_timeout=settings.ARTIFACT_LOCK_TIMEOUT_SECONDS,
+)
@@ -0,0 +1,186 @@
+import threading
+import time
+from collections import OrderedDict
+from hashlib import blake2b
+from typing import Any, Dict, NamedTuple, Optional
+
+from app.config import settings
+
+
+class CountMinSketch:
+    """
+    Approximate access frequencies in a fixed amount of memory.
+
+    Counters saturate at 15 and are all halved after sample_size increments,
+    so old popularity fades and the sketch follows the current workload.
+    """
+
+    DEPTH = 4
+    MAX_COUNT = 15
+    HALVE = bytes(count >> 1 for count in range(256))
+
+    def __init__(self, width: int):
+        self.width = max(64, width)
+        self.sample_size = self.width * 10
+        self._rows = [bytearray(self.width) for _ in range(self.DEPTH)]
+        self._additions = 0
+
+    def _indexes(self, key: str):
+        digest = blake2b(key.encode(), digest_size=4 * self.DEPTH).digest()
+        for row in range(self.DEPTH):
+            yield int.from_bytes(digest[row * 4:row * 4 + 4], "little") % self.width
+
+    def increment(self, key: str) -> None:
+        for row, index in zip(self._rows, self._indexes(key)):
+            if row[index] < self.MAX_COUNT:
+                row[index] += 1
+        self._additions += 1
+        if self._additions >= self.sample_size:
+            self._age()
+
+    def estimate(self, key: str) -> int:
+        return min(row[index] for row, index in zip(self._rows, self._indexes(key)))
+
+    def _age(self) -> None:
+        for row in self._rows:
+            row[:] = row.translate(self.HALVE)
+        self._additions //= 2
+
+
+class ContentCache:
+    """
+    Byte-budgeted LRU of file contents with TinyLFU admission.
+
+    Keys are content SHA-256 digests, so an entry can never go stale and is
+    never invalidated. When a new entry would push the cache over its byte
+    budget, it only gets in if the sketch says it is read more often than
+    each entry it would evict; one-off reads therefore cannot flush the hot
+    set.
+    """
+
+    def __init__(self, max_bytes: int, max_item_bytes: int):
+        self.max_bytes = max_bytes
+        self.max_item_bytes = max_item_bytes
+        self.sketch = CountMinSketch(max(1, max_bytes // 4096))
+        self._entries: "OrderedDict[str, bytes]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.admissions = self.rejections = self.evictions = 0
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            self.sketch.increment(key)
+            content = self._entries.get(key)
+            if content is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return content
+
+    def put(self, key: str, content: bytes) -> bool:
+        size = len(content)
+        if size > self.max_item_bytes or size > self.max_bytes:
+            return False
+        with self._lock:
+            if key in self._entries:
+                return True
+            # Check admission before touching anything
+            needed = self._bytes + size - self.max_bytes
+            frequency = self.sketch.estimate(key)
+            victims = []
+            for victim, victim_content in self._entries.items():
+                if needed <= 0:
+                    break
+                if self.sketch.estimate(victim) >= frequency:
+                    self.rejections += 1
+                    return False
+                victims.append(victim)
+                needed -= len(victim_content)
+            for victim in victims:
+                self._bytes -= len(self._entries.pop(victim))
+                self.evictions += 1
+            self._entries[key] = content
+            self._bytes += size
+            self.admissions += 1
+            return True
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            requests = self.hits + self.misses
+            return {
+                "items": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / requests if requests else 0.0,
+                "admissions": self.admissions,
+                "rejections": self.rejections,
+                "evictions": self.evictions,
+            }
+
+
+class FileMetadata(NamedTuple):
+    file_hash: str
+    user_id: int
+    original_filename: Optional[str]
+    content_sha256: Optional[str]
+    size: Optional[int]
+    file_path: Optional[str]  # None when stored as chunks
+    media_type: str
+    is_deleted: bool
+    is_chunked: bool = False
+
+
+class MetadataCache:
+    """
+    Short-lived LRU of file records, so hot reads skip the lookup query.
+
+    Unlike contents, records change (delete, restore); this process forgets
+    an entry when it changes one, and other processes see the change once
+    the entry expires after ttl seconds.
+    """
+
+    def __init__(self, max_entries: int, ttl: float):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = self.misses = 0
+
+    def get(self, file_hash: str) -> Optional[FileMetadata]:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(file_hash)
+            if entry is None or entry[0] < now:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(file_hash)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, metadata: FileMetadata) -> None:
+        with self._lock:
+            self._entries[metadata.file_hash] = (time.monotonic() + self.ttl, metadata)
+            self._entries.move_to_end(metadata.file_hash)
+            if len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def forget(self, file_hash: str) -> None:
+        with self._lock:
+            self._entries.pop(file_hash, None)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"items": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+content_cache = ContentCache(
+    max_bytes=settings.FILE_CACHE_MAX_BYTES,
+    max_item_bytes=settings.FILE_CACHE_MAX_ITEM_BYTES,
+)
+metadata_cache = MetadataCache(
+    max_entries=settings.FILE_CACHE_METADATA_MAX_ENTRIES,
+    ttl=settings.FILE_CACHE_METADATA_TTL_SECONDS,
+)
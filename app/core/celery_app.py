@@ -4,17 +4,57 @@ from app.config import settings
 celery_app = Celery(
     "worker",
     broker=settings.RABBITMQ_URL,  # Ensure this points to your RabbitMQ broker
-    backend=settings.CELERY_RESULT_BACKEND,  # Add a valid result backend
-    include=["app.tasks.file_processing"]
+    # No result backend: task state is written to task_statuses by the
+    # signal handlers in app.tasks.lifecycle
+    include=["app.tasks.lifecycle", "app.tasks.file_processing", "app.tasks.maintenance"]
 )
 
 celery_app.conf.update(
-    task_track_started=True,
+    task_ignore_result=True,
     task_serializer="json",
-    result_serializer="json",
     accept_content=["json"],
-    result_expires=3600,  # Task results expire after 1 hour
     worker_prefetch_multiplier=1,
     task_acks_late=True,
+    # Redeliver a task whose pool process died instead of acking it as
+    # failed; its buffered status updates died with the process
+    task_reject_on_worker_lost=True,
     broker_connection_retry_on_startup=True,
+    beat_schedule={
+        "purge-deleted-files": {
+            "task": "app.tasks.maintenance.purge_deleted_files",
+            "schedule": settings.TRASH_PURGE_INTERVAL_SECONDS,
+        },
+        "collect-orphan-blobs": {
+            "task": "app.tasks.maintenance.collect_orphan_blobs",
+            "schedule": settings.ORPHAN_GC_INTERVAL_SECONDS,
+        },
+        "purge-idempotency-keys": {
+            "task": "app.tasks.maintenance.purge_idempotency_keys",
+            "schedule": settings.IDEMPOTENCY_PURGE_INTERVAL_SECONDS,
+        },
+        "purge-revoked-tokens": {
+            "task": "app.tasks.maintenance.purge_revoked_tokens",
+            "schedule": settings.REVOKED_TOKEN_PURGE_INTERVAL_SECONDS,
+        },
+        "purge-file-changes": {
+            "task": "app.tasks.maintenance.purge_file_changes",
+            "schedule": settings.CHANGE_FEED_PURGE_INTERVAL_SECONDS,
+        },
+        "purge-task-statuses": {
+            "task": "app.tasks.maintenance.purge_task_statuses",
+            "schedule": settings.TASK_STATUS_PURGE_INTERVAL_SECONDS,
+        },
+        "evict-artifacts": {
+            "task": "app.tasks.maintenance.evict_artifacts",
+            "schedule": settings.ARTIFACT_EVICTION_INTERVAL_SECONDS,
+        },
+        "rebalance-blobs": {
+            "task": "app.tasks.maintenance.rebalance_blobs",
+            "schedule": settings.STORAGE_REBALANCE_INTERVAL_SECONDS,
+        },
+        "collect-unused-chunks": {
+            "task": "app.tasks.maintenance.collect_unused_chunks",
+            "schedule": settings.CHUNK_GC_INTERVAL_SECONDS,
+        },
+    },
 )
\ No newline at end of file
@@ -0,0 +1,213 @@
+"""
+Content-defined chunking for deduplicated storage (STORAGE_MODE "chunked").
+
+Files are cut where a rolling gear hash of the last 64 bytes matches a
+mask (FastCDC with normalized chunking), so a cut point depends only on
+the bytes around it. Inserting or removing data therefore changes the
+chunks around the edit and leaves the rest of the file cutting into the
+same chunks, which are stored once by their SHA-256.
+"""
+import io
+import os
+from bisect import bisect_right
+from hashlib import blake2b, sha256
+from typing import BinaryIO, Dict, Iterator, List, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.core import storage
+from app.crud import chunk as chunk_crud
+
+MASK64 = (1 << 64) - 1
+
+# One fixed pseudo-random 64-bit value per byte. Changing the table moves
+# every cut point, so it must stay the same for as long as chunks are kept.
+GEAR = tuple(int.from_bytes(blake2b(bytes([value]), digest_size=8).digest(), "big") for value in range(256))
+
+READ_SIZE = 1048576
+
+
+class ChunkerError(ValueError):
+    pass
+
+
+def masks(avg_size: int) -> Tuple[int, int]:
+    """
+    Masks tested before and after a chunk reaches the average size. The
+    first has two more bits than log2(avg_size) and the second two fewer,
+    which pulls chunk sizes towards the average (normalized chunking).
+    """
+    bits = avg_size.bit_length() - 1
+    return (
+        ((1 << (bits + 2)) - 1) << (64 - bits - 2),
+        ((1 << (bits - 2)) - 1) << (64 - bits + 2),
+    )
+
+
+class Chunker:
+    def __init__(self, min_size: int, avg_size: int, max_size: int):
+        if not 64 <= min_size < avg_size < max_size:
+            raise ChunkerError("Chunk sizes must satisfy 64 <= min < avg < max")
+        self.min_size = min_size
+        self.avg_size = avg_size
+        self.max_size = max_size
+        self.mask_small, self.mask_large = masks(avg_size)
+
+    def cut_point(self, data, end: int) -> int:
+        """Return where the chunk at the start of data[:end] ends"""
+        if end <= self.min_size:
+            return end
+        stop = min(end, self.max_size)
+        normal = min(stop, self.avg_size)
+        gear, mask_small, mask_large = GEAR, self.mask_small, self.mask_large
+        digest = 0
+        # No cut can come before min_size, so hashing starts there
+        for position in range(self.min_size, normal):
+            digest = ((digest << 1) + gear[data[position]]) & MASK64
+            if not digest & mask_small:
+                return position + 1
+        for position in range(normal, stop):
+            digest = ((digest << 1) + gear[data[position]]) & MASK64
+            if not digest & mask_large:
+                return position + 1
+        return stop
+
+    def iter_chunks(self, source: BinaryIO) -> Iterator[bytes]:
+        """Read source to the end and yield its content chunk by chunk"""
+        buffer = bytearray()
+        eof = False
+        while True:
+            while not eof and len(buffer) < self.max_size:
+                block = source.read(READ_SIZE)
+                if not block:
+                    eof = True
+                buffer += block
+            if not buffer:
+                return
+            cut = self.cut_point(buffer, len(buffer))
+            yield bytes(buffer[:cut])
+            del buffer[:cut]
+
+
+def create_chunker() -> Chunker:
+    return Chunker(settings.DEDUP_MIN_CHUNK_SIZE, settings.DEDUP_AVG_CHUNK_SIZE, settings.DEDUP_MAX_CHUNK_SIZE)
+
+
+def store_chunks(db: Session, source: BinaryIO) -> Tuple[List[Tuple[str, int]], Dict[str, int]]:
+    """
+    Cut a seekable source into chunks and write the ones not stored yet.
+    Returns the file's (digest, size) list, for chunk_crud.add_file_chunks
+    before the caller commits, and the chunk and byte counts written.
+
+    The source is read once, and chunk files are written during that pass,
+    before any row is locked. The rows are locked afterwards, only to check
+    that no chunk without references was collected in the meantime.
+    """
+    chunks, offsets, fresh = [], [], set()
+    written = {"chunks": 0, "new_chunks": 0, "new_bytes": 0}
+    offset = 0
+    for piece in create_chunker().iter_chunks(source):
+        digest = sha256(piece).hexdigest()
+        chunks.append((digest, len(piece)))
+        offsets.append(offset)
+        offset += len(piece)
+        if digest not in fresh and not storage.locate_chunk(digest):
+            storage.write_chunk(digest, piece)
+            fresh.add(digest)
+            written["new_chunks"] += 1
+            written["new_bytes"] += len(piece)
+    written["chunks"] = len(chunks)
+
+    # The collector removes the files of unreferenced chunks while holding
+    # their rows. Once we hold them, a chunk we did not just write, or whose
+    # file is gone, is written again from the source; this is rare.
+    refcounts = chunk_crud.lock_chunks(db, [digest for digest, _ in chunks])
+    checked = set()
+    for (digest, size), start in zip(chunks, offsets):
+        if refcounts.get(digest, 0) > 0 or digest in checked:
+            continue
+        checked.add(digest)
+        if digest in fresh and storage.locate_chunk(digest):
+            continue
+        source.seek(start)
+        storage.write_chunk(digest, source.read(size))
+        if digest not in fresh:
+            written["new_chunks"] += 1
+        written["new_bytes"] += size
+    return chunks, written
+
+
+class ChunkedFile(io.RawIOBase):
+    """
+    Read-only, seekable view of a file stored as a list of chunks, opening
+    one chunk at a time from whichever replica is available.
+    """
+
+    def __init__(self, chunks: List[Tuple[str, int]]):
+        super().__init__()
+        self.chunks = chunks
+        self.offsets = []
+        total = 0
+        for _, size in chunks:
+            self.offsets.append(total)
+            total += size
+        self.size = total
+        self.position = 0
+        self._index: Optional[int] = None
+        self._file: Optional[BinaryIO] = None
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self.position
+
+    def seek(self, offset: int, whence: int = os.SEEK_SET) -> int:
+        if whence == os.SEEK_CUR:
+            offset += self.position
+        elif whence == os.SEEK_END:
+            offset += self.size
+        if offset < 0:
+            raise ValueError("Negative seek position")
+        self.position = offset
+        return offset
+
+    def _open(self, index: int) -> BinaryIO:
+        if self._index != index:
+            if self._file:
+                self._file.close()
+            digest = self.chunks[index][0]
+            path = storage.locate_chunk(digest)
+            if path is None:
+                raise FileNotFoundError(f"Chunk {digest} not found")
+            self._file = open(path, "rb")
+            self._index = index
+        return self._file
+
+    def readinto(self, buffer) -> int:
+        if self.position >= self.size or not len(buffer):
+            return 0
+        index = bisect_right(self.offsets, self.position) - 1
+        chunk_offset = self.position - self.offsets[index]
+        length = min(len(buffer), self.chunks[index][1] - chunk_offset)
+        source = self._open(index)
+        source.seek(chunk_offset)
+        read = source.readinto(memoryview(buffer)[:length])
+        if read != length:
+            raise IOError(f"Chunk {self.chunks[index][0]} is shorter than recorded")
+        self.position += read
+        return read
+
+    def close(self) -> None:
+        if self._file:
+            self._file.close()
+            self._file = None
+        super().close()
+
+
+def open_chunked(chunks: List[Tuple[str, int]]) -> BinaryIO:
+    return io.BufferedReader(ChunkedFile(chunks), buffer_size=settings.DEDUP_MAX_CHUNK_SIZE)
@@ -0,0 +1,252 @@
+"""
+Statistical profiler and slow request capture for a single worker process.
+
+A background thread samples the stacks of every other thread with
+sys._current_frames() every PROFILER_INTERVAL_MS. A signal-based timer
+would only interrupt the main thread, while sync endpoints and database
+calls run in the threadpool. Profiles are rendered in the collapsed stack
+format ("frame;frame;frame count" per line) that flamegraph.pl,
+speedscope and inferno read directly.
+
+While a slow request threshold is set, requests to the routes in
+app.api.files record their SQL statements, and any request that takes
+longer than the threshold is kept together with the samples taken while
+it ran. Nothing is sampled or recorded while the profiler is off: the
+middleware checks one attribute and the SQL hooks are not installed.
+"""
+import itertools
+import logging
+import os
+import sys
+import threading
+import time
+from collections import Counter, deque
+from contextvars import ContextVar
+from datetime import datetime
+from typing import Deque, Dict, List, Optional, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Requests to endpoints defined in these modules are checked against the threshold
+PROFILED_MODULES = ("app.api.files",)
+
+# Leaf frames of threads blocked waiting for work, left out of profiles
+IDLE_FRAMES = {
+    ("selectors.py", "select"),
+    ("threading.py", "wait"),
+    ("queue.py", "get"),
+}
+
+_queries: ContextVar[Optional[List[Dict]]] = ContextVar("profiler_queries", default=None)
+
+Sample = Tuple[float, int, tuple]  # (monotonic time, thread id, code objects from the root)
+
+
+def frame_label(code) -> str:
+    filename = code.co_filename
+    for path in sorted(sys.path, key=len, reverse=True):
+        if path and filename.startswith(path + os.sep):
+            filename = filename[len(path) + 1:]
+            break
+    return f"{code.co_name} ({filename}:{code.co_firstlineno})".replace(";", ",")
+
+
+def collapse(samples: List[Sample]) -> str:
+    """Render samples as collapsed stacks, one per thread and call path"""
+    names = {thread.ident: thread.name for thread in threading.enumerate()}
+    labels: Dict[object, str] = {}
+    stacks = Counter()
+    for _, thread_id, codes in samples:
+        frames = [names.get(thread_id, f"thread-{thread_id}")]
+        for code in codes:
+            label = labels.get(code)
+            if label is None:
+                label = labels[code] = frame_label(code)
+            frames.append(label)
+        stacks[";".join(frames)] += 1
+    return "".join(f"{stack} {count}\n" for stack, count in sorted(stacks.items()))
+
+
+class Profiler:
+    def __init__(self, interval: float, max_samples: int, max_captures: int, max_queries: int):
+        self.interval = interval
+        self.max_queries = max_queries
+        self.slow_threshold: Optional[float] = None
+        self.started_at: Optional[datetime] = None
+        self.samples: Deque[Sample] = deque(maxlen=max_samples)
+        self.captures: Deque[Dict] = deque(maxlen=max_captures)
+        self._capture_ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._pid: Optional[int] = None
+
+    @property
+    def running(self) -> bool:
+        # A thread does not survive fork, so a worker never inherits a running profiler
+        return self._thread is not None and self._pid == os.getpid() and self._thread.is_alive()
+
+    def configure(self, enabled: bool, interval: Optional[float] = None, slow_threshold: Optional[float] = None) -> None:
+        """
+        Start or stop sampling in this process. Capturing slow requests
+        needs the samples, so a threshold is only kept while enabled.
+        """
+        with self._lock:
+            if interval is not None:
+                self.interval = interval
+            if not enabled:
+                self.slow_threshold = None
+                self._remove_sql_hooks()
+                self._stop_thread()
+                return
+            if not self.running:
+                self.samples.clear()
+                self.started_at = datetime.now()
+                self._stop = threading.Event()
+                self._pid = os.getpid()
+                self._thread = threading.Thread(target=self._run, args=(self._stop,), name="profiler", daemon=True)
+                self._thread.start()
+            if slow_threshold:
+                self._install_sql_hooks()
+                self.slow_threshold = slow_threshold
+            else:
+                self.slow_threshold = None
+                self._remove_sql_hooks()
+
+    def _stop_thread(self) -> None:
+        if self.running:
+            self._stop.set()
+            self._thread.join(timeout=max(1.0, self.interval * 10))
+        self._thread = None
+
+    def _run(self, stop: threading.Event) -> None:
+        own_id = threading.get_ident()
+        while not stop.wait(self.interval):
+            now = time.monotonic()
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                code = frame.f_code
+                if (os.path.basename(code.co_filename), code.co_name) in IDLE_FRAMES:
+                    continue
+                codes = []
+                while frame is not None:
+                    codes.append(frame.f_code)
+                    frame = frame.f_back
+                codes.reverse()
+                self.samples.append((now, thread_id, tuple(codes)))
+
+    def profile(self, seconds: Optional[float] = None) -> str:
+        """Collapsed stacks of the samples kept, or of the last `seconds` only"""
+        samples = list(self.samples)
+        if seconds is not None:
+            since = time.monotonic() - seconds
+            samples = [sample for sample in samples if sample[0] >= since]
+        return collapse(samples)
+
+    # Slow requests
+
+    def _install_sql_hooks(self) -> None:
+        if not event.contains(Engine, "before_cursor_execute", _before_cursor_execute):
+            event.listen(Engine, "before_cursor_execute", _before_cursor_execute)
+            event.listen(Engine, "after_cursor_execute", _after_cursor_execute)
+
+    def _remove_sql_hooks(self) -> None:
+        if event.contains(Engine, "before_cursor_execute", _before_cursor_execute):
+            event.remove(Engine, "before_cursor_execute", _before_cursor_execute)
+            event.remove(Engine, "after_cursor_execute", _after_cursor_execute)
+
+    def capture(self, scope: Dict, status_code: Optional[int], started: float, finished: float, queries: List[Dict]) -> Dict:
+        samples = [sample for sample in list(self.samples) if started <= sample[0] <= finished]
+        capture = {
+            "id": next(self._capture_ids),
+            "method": scope["method"],
+            "path": scope["path"],
+            "status_code": status_code,
+            "duration_ms": round((finished - started) * 1000, 1),
+            "captured_at": datetime.now(),
+            "sample_count": len(samples),
+            "query_count": len(queries),
+            "queries": queries,
+            "stacks": collapse(samples),
+        }
+        self.captures.append(capture)
+        logger.warning(
+            f"Slow request {capture['method']} {capture['path']} took {capture['duration_ms']}ms "
+            f"with {len(queries)} queries, captured as {capture['id']} in worker {os.getpid()}"
+        )
+        return capture
+
+    def get_capture(self, capture_id: int) -> Optional[Dict]:
+        for capture in list(self.captures):
+            if capture["id"] == capture_id:
+                return capture
+        return None
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _queries.get() is not None:
+        conn.info.setdefault("profiler_query_started", []).append(time.monotonic())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    queries = _queries.get()
+    if queries is None or not conn.info.get("profiler_query_started"):
+        return
+    started = conn.info["profiler_query_started"].pop()
+    if len(queries) < profiler.max_queries:
+        queries.append({
+            "statement": statement,
+            "duration_ms": round((time.monotonic() - started) * 1000, 2),
+            "executemany": executemany,
+        })
+
+
+class SlowRequestMiddleware:
+    """
+    Capture the profile and SQL statements of slow requests to the routes
+    in PROFILED_MODULES while the profiler has a slow request threshold.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        threshold = profiler.slow_threshold
+        if threshold is None or scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status_code = None
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        # The threadpool copies the context, so sync endpoints record into this list too
+        queries: List[Dict] = []
+        token = _queries.set(queries)
+        started = time.monotonic()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            finished = time.monotonic()
+            _queries.reset(token)
+            endpoint = scope.get("endpoint")
+            if finished - started >= threshold and getattr(endpoint, "__module__", None) in PROFILED_MODULES:
+                profiler.capture(scope, status_code, started, finished, queries)
+
+
+profiler = Profiler(
+    interval=settings.PROFILER_INTERVAL_MS / 1000,
+    max_samples=settings.PROFILER_MAX_SAMPLES,
+    max_captures=settings.SLOW_REQUEST_MAX_CAPTURES,
+    max_queries=settings.SLOW_REQUEST_MAX_QUERIES,
+)
@@ -0,0 +1,197 @@
+import logging
+import math
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+from jose import jwt, JWTError
+from starlette.responses import JSONResponse
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Atomically refill and draw from a bucket stored as a redis hash. Returns
+# the number of seconds to wait (as a string, redis truncates Lua numbers).
+TOKEN_BUCKET_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local cost = tonumber(ARGV[3])
+local now = tonumber(ARGV[4])
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1])
+local ts = tonumber(state[2])
+if tokens == nil then
+    tokens = burst
+    ts = now
+end
+tokens = math.min(burst, tokens + math.max(0, now - ts) * rate)
+local need = math.min(cost, burst)
+local wait = 0
+if tokens >= need then
+    tokens = tokens - cost
+else
+    wait = (need - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'ts', now)
+redis.call('EXPIRE', KEYS[1], math.ceil((burst + cost) / rate) + 1)
+return tostring(wait)
+"""
+
+
+def draw_tokens(tokens: float, updated: float, now: float, rate: float, burst: float, cost: float) -> Tuple[float, float]:
+    """
+    Refill a bucket and try to draw `cost` tokens from it.
+
+    Returns the new token count and the seconds to wait (0 when allowed).
+    A cost larger than the burst is admitted from a full bucket and leaves it
+    in debt, so a single large upload is throttled afterwards rather than
+    rejected forever.
+    """
+    tokens = min(burst, tokens + max(0.0, now - updated) * rate)
+    need = min(cost, burst)
+    if tokens >= need:
+        return tokens - cost, 0.0
+    return tokens, (need - tokens) / rate
+
+
+class MemoryBucketStore:
+    """Token buckets held in this process, evicting the least recently used keys"""
+
+    def __init__(self, max_keys: int = 100000):
+        self.max_keys = max_keys
+        self._buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    async def take(self, key: str, rate: float, burst: float, cost: float = 1) -> float:
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.pop(key, (burst, now))
+            tokens, wait = draw_tokens(tokens, updated, now, rate, burst, cost)
+            self._buckets[key] = (tokens, now)
+            if len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        return wait
+
+
+class RedisBucketStore:
+    """Token buckets shared by every process through redis"""
+
+    def __init__(self, url: str):
+        import redis.asyncio as redis
+
+        self._client = redis.from_url(url)
+        self._script = self._client.register_script(TOKEN_BUCKET_SCRIPT)
+
+    async def take(self, key: str, rate: float, burst: float, cost: float = 1) -> float:
+        try:
+            wait = await self._script(keys=[f"ratelimit:{key}"], args=[rate, burst, cost, time.time()])
+        except Exception as e:
+            # Fail open: an unavailable store must not take the API down with it
+            logger.error(f"Rate limit store error: {str(e)}")
+            return 0.0
+        return float(wait)
+
+
+def create_bucket_store():
+    if settings.RATE_LIMIT_STORE_URL:
+        return RedisBucketStore(settings.RATE_LIMIT_STORE_URL)
+    return MemoryBucketStore()
+
+
+def get_header(scope: Dict, name: bytes) -> Optional[bytes]:
+    for key, value in scope.get("headers", []):
+        if key == name:
+            return value
+    return None
+
+
+def get_user_id(scope: Dict) -> Optional[str]:
+    """Read the user id from a bearer token without touching the database"""
+    authorization = get_header(scope, b"authorization")
+    if not authorization or authorization[:7].lower() != b"bearer ":
+        return None
+    try:
+        payload = jwt.decode(
+            authorization[7:].decode("latin-1"), settings.SECRET_KEY, algorithms=[settings.ALGORITHM]
+        )
+    except JWTError:
+        return None
+    subject = payload.get("sub")
+    return str(subject) if subject is not None else None
+
+
+def get_client_ip(scope: Dict) -> str:
+    client = scope.get("client")
+    return client[0] if client else "unknown"
+
+
+def is_upload_request(scope: Dict) -> bool:
+    return scope["method"] == "POST" and scope["path"].startswith(f"{settings.API_PREFIX}/files/upload")
+
+
+async def reject(scope: Dict, receive, send, status_code: int, detail: str, retry_after: float) -> None:
+    response = JSONResponse(
+        {"detail": detail},
+        status_code=status_code,
+        headers={"Retry-After": str(max(1, math.ceil(retry_after)))},
+    )
+    await response(scope, receive, send)
+
+
+class RateLimitMiddleware:
+    """
+    Token bucket rate limiting per user and per client IP.
+
+    Every request draws from a request-count bucket for the client IP and,
+    when it carries a valid token, one for the user. Uploads additionally
+    draw their Content-Length from an upload-bytes bucket, and are refused
+    with 411 without one.
+    """
+
+    def __init__(self, app, store=None):
+        self.app = app
+        self.store = store or create_bucket_store()
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not settings.RATE_LIMIT_ENABLED:
+            await self.app(scope, receive, send)
+            return
+
+        user_id = get_user_id(scope)
+        client_key = f"user:{user_id}" if user_id else f"ip:{get_client_ip(scope)}"
+
+        wait = await self.store.take(
+            f"requests:ip:{get_client_ip(scope)}",
+            settings.RATE_LIMIT_IP_REQUESTS_PER_SECOND,
+            settings.RATE_LIMIT_IP_BURST,
+        )
+        if not wait and user_id:
+            wait = await self.store.take(
+                f"requests:user:{user_id}",
+                settings.RATE_LIMIT_USER_REQUESTS_PER_SECOND,
+                settings.RATE_LIMIT_USER_BURST,
+            )
+        if wait:
+            await reject(scope, receive, send, 429, "Too many requests", wait)
+            return
+
+        if is_upload_request(scope):
+            content_length = get_header(scope, b"content-length")
+            # A chunked upload would not be charged at all, so its size must be declared
+            if not content_length or not content_length.isdigit():
+                response = JSONResponse({"detail": "Uploads must send Content-Length"}, status_code=411)
+                await response(scope, receive, send)
+                return
+            wait = await self.store.take(
+                f"upload-bytes:{client_key}",
+                settings.RATE_LIMIT_UPLOAD_BYTES_PER_SECOND,
+                settings.RATE_LIMIT_UPLOAD_BURST_BYTES,
+                int(content_length),
+            )
+            if wait:
+                await reject(scope, receive, send, 429, "Upload bandwidth limit exceeded", wait)
+                return
+
+        await self.app(scope, receive, send)
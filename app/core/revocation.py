@@ -0,0 +1,77 @@
+import logging
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Optional
+
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.core.bloom import BloomFilter
+from app.crud import token as token_crud
+
+logger = logging.getLogger(__name__)
+
+# Re-read revocations this far back on every sync, so rows committed late by
+# a slow transaction are not skipped
+SYNC_OVERLAP = timedelta(seconds=60)
+
+
+class RevocationList:
+    """
+    In-memory view of the revoked_tokens table.
+
+    Every authenticated request asks whether its token was revoked. A Bloom
+    filter answers "no" for almost all of them without a query; only filter
+    hits are confirmed against the table. Each process pulls revocations made
+    by other processes every REVOCATION_SYNC_INTERVAL_SECONDS, so a token
+    revoked elsewhere can still be used for at most that long.
+    """
+
+    def __init__(self, capacity: int, error_rate: float, sync_interval: float):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.sync_interval = sync_interval
+        self._lock = threading.Lock()
+        self._bloom = BloomFilter(capacity, error_rate)
+        self._since: Optional[datetime] = None
+        self._synced_at: Optional[float] = None
+
+    def _sync(self, db: Session) -> None:
+        now = time.monotonic()
+        if self._synced_at is not None and now - self._synced_at < self.sync_interval:
+            return
+        with self._lock:
+            if self._synced_at is not None and now - self._synced_at < self.sync_interval:
+                return
+            # Expired revocations never leave the filter, so start over once
+            # it holds more keys than it was sized for
+            if len(self._bloom) >= self.capacity:
+                logger.info(f"Rebuilding token revocation filter after {len(self._bloom)} entries")
+                self._bloom = BloomFilter(self.capacity, self.error_rate)
+                self._since = None
+            started = datetime.now()
+            for jti in token_crud.iter_revoked_since(db, self._since, datetime.utcnow()):
+                if jti not in self._bloom:
+                    self._bloom.add(jti)
+            self._since = started - SYNC_OVERLAP
+            self._synced_at = now
+
+    def is_revoked(self, db: Session, jti: str) -> bool:
+        self._sync(db)
+        if jti not in self._bloom:
+            return False
+        return token_crud.is_revoked(db, jti)
+
+    def remember(self, jti: str) -> None:
+        """Add a token revoked by this process without waiting for the next sync"""
+        with self._lock:
+            if jti not in self._bloom:
+                self._bloom.add(jti)
+
+
+revocation_list = RevocationList(
+    capacity=settings.REVOCATION_BLOOM_CAPACITY,
+    error_rate=settings.REVOCATION_BLOOM_ERROR_RATE,
+    sync_interval=settings.REVOCATION_SYNC_INTERVAL_SECONDS,
+)
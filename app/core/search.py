@@ -0,0 +1,52 @@
+import re
+from typing import Optional, Set
+
+from app.config import settings
+
+# Markers around a name so prefix and extension filters become trigrams too:
+# "\x02rep" only occurs at the start of a name and ".pdf\x03" at the end
+START = "\x02"
+END = "\x03"
+
+# Not a backslash, whose escaping differs between MySQL and other databases
+LIKE_ESCAPE = "/"
+_LIKE_SPECIAL_RE = re.compile(r"([/%_])")
+
+
+def trigrams(text: str) -> Set[bytes]:
+    """Return the distinct trigrams of text, as UTF-8 bytes"""
+    return {text[i:i + 3].encode() for i in range(len(text) - 2)}
+
+
+def name_trigrams(name: str) -> Set[bytes]:
+    """Trigrams indexed for a filename"""
+    return trigrams(f"{START}{name.lower()}{END}")
+
+
+def query_trigrams(q: Optional[str], prefix: Optional[str], ext: Optional[str]) -> Set[bytes]:
+    """
+    Trigrams a filename must contain to match every given filter.
+
+    Having them all is necessary, not sufficient: matches still need checking
+    against the name itself.
+    """
+    grams: Set[bytes] = set()
+    if q:
+        grams |= trigrams(q.lower())
+    if prefix:
+        grams |= trigrams(f"{START}{prefix.lower()}")
+    if ext:
+        grams |= trigrams(f".{ext.lower()}{END}")
+    return grams
+
+
+def like_escape(value: str) -> str:
+    """Escape LIKE wildcards in user input; use with escape=LIKE_ESCAPE"""
+    return _LIKE_SPECIAL_RE.sub(r"/\1", value)
+
+
+def backend(dialect_name: str) -> str:
+    """Resolve SEARCH_BACKEND for a database dialect"""
+    if settings.SEARCH_BACKEND != "auto":
+        return settings.SEARCH_BACKEND
+    return "fulltext" if dialect_name == "mysql" else "trigram"
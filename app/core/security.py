@@ -1,3 +1,4 @@
+import uuid
 from datetime import datetime, timedelta
 from typing import Any, Optional, Union
 
@@ -14,7 +15,8 @@ def create_access_token(subject: str, expires_delta: Optional[timedelta] = None,
     else:
         expire = datetime.utcnow() + timedelta(minutes=15)
     
-    to_encode = {"exp": expire, "sub": str(subject), "type": token_type}
+    # jti identifies the token in the revocation list
+    to_encode = {"exp": expire, "sub": str(subject), "type": token_type, "jti": uuid.uuid4().hex}
     encoded_jwt = jwt.encode(to_encode, settings.SECRET_KEY, algorithm=settings.ALGORITHM)
     return encoded_jwt
 
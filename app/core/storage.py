@@ -0,0 +1,423 @@
+import heapq
+import logging
+import os
+import re
+import shutil
+from bisect import bisect
+from hashlib import blake2b
+from typing import Dict, Iterable, Iterator, List, Optional
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Blobs are stored under their file hash (64 lowercase hex characters).
+# Anything else in the upload directory is not ours and is never touched.
+BLOB_NAME_RE = re.compile(r"^[0-9a-f]{64}$")
+SHARD_NAME_RE = re.compile(r"^[0-9a-f]{2}$")
+
+# Written to a node once it has been rebalanced for the current ring
+RING_MARKER = ".ring"
+
+# Bumped when blobs move to new paths on their nodes, so every node is
+# rebalanced once. Layout 2 shards blobs into <first two hex digits>/ like
+# chunks; layout 1 kept them all in the node's top directory.
+BLOB_LAYOUT = 2
+
+# Deduplicated chunks (STORAGE_MODE "chunked") live in their own namespace
+# on each node, under chunks/<first two hex digits>/<SHA-256>
+CHUNK_DIR = "chunks"
+
+
+def ring_point(key: str) -> int:
+    return int.from_bytes(blake2b(key.encode(), digest_size=8).digest(), "big")
+
+
+class HashRing:
+    """
+    Consistent hash ring placing each blob on `replicas` distinct nodes.
+
+    Every node owns `vnodes` points on the ring, and a blob lives on the
+    first distinct nodes found walking clockwise from its own point. Adding
+    a node therefore moves only the blobs whose points fall just before
+    the new node's points, about 1/N of them, and spreads both the moved
+    blobs and new writes evenly over the nodes.
+    """
+
+    def __init__(self, nodes: List[str], vnodes: int, replicas: int):
+        if not nodes:
+            raise ValueError("A hash ring needs at least one node")
+        self.nodes = list(dict.fromkeys(nodes))
+        self.replicas = max(1, min(replicas, len(self.nodes)))
+        points = sorted(
+            (ring_point(f"{node}#{index}"), node) for node in self.nodes for index in range(vnodes)
+        )
+        self._points = [point for point, _ in points]
+        self._owners = [node for _, node in points]
+        self.fingerprint = blake2b(
+            f"{BLOB_LAYOUT}:{vnodes}:{self.replicas}:{chr(0).join(sorted(self.nodes))}".encode(), digest_size=8
+        ).hexdigest()
+
+    def nodes_for(self, key: str) -> List[str]:
+        """The nodes holding key, primary first"""
+        start = bisect(self._points, ring_point(key))
+        found: List[str] = []
+        for offset in range(len(self._owners)):
+            node = self._owners[(start + offset) % len(self._owners)]
+            if node not in found:
+                found.append(node)
+                if len(found) == self.replicas:
+                    break
+        return found
+
+
+def create_ring() -> HashRing:
+    return HashRing(
+        settings.STORAGE_NODES or [settings.UPLOAD_DIR],
+        settings.STORAGE_VIRTUAL_NODES,
+        settings.STORAGE_REPLICAS,
+    )
+
+
+ring = create_ring()
+
+
+def storage_nodes() -> List[str]:
+    """Every node that may hold blobs: the ring's, then those being drained"""
+    return ring.nodes + [node for node in settings.STORAGE_DRAINING_NODES if node not in ring.nodes]
+
+
+def blob_path(file_hash: str, node: Optional[str] = None) -> str:
+    """Return the on-disk path of the blob stored for file_hash, on its primary node by default"""
+    return os.path.join(node or ring.nodes_for(file_hash)[0], file_hash[:2], file_hash)
+
+
+def legacy_blob_path(file_hash: str, node: str) -> str:
+    """Where layout 1 stored a blob, until the rebalance task moves it"""
+    return os.path.join(node, file_hash)
+
+
+def replica_paths(file_hash: str) -> List[str]:
+    return [blob_path(file_hash, node) for node in ring.nodes_for(file_hash)]
+
+
+def locate_blob(file_hash: str, file_path: Optional[str] = None) -> Optional[str]:
+    """
+    Find a readable copy of a blob: its replicas in ring order first, then
+    the path recorded at upload and any other node, which still hold blobs
+    a rebalance has not moved yet.
+    """
+    candidates = replica_paths(file_hash)
+    if file_path and file_path not in candidates:
+        candidates.append(file_path)
+    for node in storage_nodes():
+        for path in (blob_path(file_hash, node), legacy_blob_path(file_hash, node)):
+            if path not in candidates:
+                candidates.append(path)
+    for path in candidates:
+        try:
+            if os.path.isfile(path):
+                return path
+        except OSError as e:
+            logger.warning(f"Storage path {path} unavailable: {str(e)}")
+    return None
+
+
+def write_blob(file_hash: str, content: bytes, copies: Optional[int] = None) -> str:
+    """
+    Write a blob to each of its replica nodes, or to the first `copies` of
+    them that accept it, and return the first path written. Fails only if
+    no replica could be written; if fewer were than asked for, the nodes
+    holding a copy are marked unbalanced so the next rebalance copies it to
+    the others.
+    """
+    written = []
+    nodes = ring.nodes_for(file_hash)
+    wanted = min(copies or len(nodes), len(nodes))
+    for node in nodes:
+        if len(written) == wanted:
+            break
+        path = blob_path(file_hash, node)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Readers and the rebalance task never see a partial blob under its name
+            partial = f"{path}.{os.getpid()}.partial"
+            with open(partial, "wb") as buffer:
+                buffer.write(content)
+            os.replace(partial, path)
+            written.append(node)
+        except OSError as e:
+            logger.error(f"Error writing blob {file_hash} to {path}: {str(e)}")
+    if not written:
+        raise OSError(f"No storage node accepted blob {file_hash}")
+    if len(written) < wanted:
+        under_replicated(file_hash, written)
+    return blob_path(file_hash, written[0])
+
+
+def blob_nodes(file_hash: str) -> List[str]:
+    """The nodes holding a copy of a blob"""
+    return [node for node in storage_nodes() if os.path.isfile(blob_path(file_hash, node))]
+
+
+def chunk_path(digest: str, node: Optional[str] = None) -> str:
+    """Return the on-disk path of a chunk, on its primary node by default"""
+    return os.path.join(node or ring.nodes_for(digest)[0], CHUNK_DIR, digest[:2], digest)
+
+
+def locate_chunk(digest: str) -> Optional[str]:
+    """Find a readable copy of a chunk, trying its replicas in ring order first"""
+    nodes = ring.nodes_for(digest)
+    nodes.extend(node for node in storage_nodes() if node not in nodes)
+    for node in nodes:
+        path = chunk_path(digest, node)
+        try:
+            if os.path.isfile(path):
+                return path
+        except OSError as e:
+            logger.warning(f"Storage path {path} unavailable: {str(e)}")
+    return None
+
+
+def write_chunk(digest: str, content: bytes) -> int:
+    """
+    Write a chunk to each of its replica nodes and return how many copies
+    were written. Chunks are shared, so each copy is written to a temporary
+    name first and readers never see a partial one. Missing copies are
+    restored by the next rebalance, as for blobs.
+    """
+    written = []
+    nodes = ring.nodes_for(digest)
+    for node in nodes:
+        path = chunk_path(digest, node)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            partial = f"{path}.{os.getpid()}.partial"
+            with open(partial, "wb") as buffer:
+                buffer.write(content)
+            os.replace(partial, path)
+            written.append(node)
+        except OSError as e:
+            logger.error(f"Error writing chunk {digest} to {node}: {str(e)}")
+    if not written:
+        raise OSError(f"No storage node accepted chunk {digest}")
+    if len(written) < len(nodes):
+        under_replicated(digest, written)
+    return len(written)
+
+
+def remove_blob(file_path: Optional[str]) -> bool:
+    """Delete a blob from disk, returning False if it was already gone"""
+    if not file_path:
+        return False
+    try:
+        os.remove(file_path)
+        return True
+    except FileNotFoundError:
+        return False
+    except OSError as e:
+        logger.error(f"Error removing blob {file_path}: {str(e)}")
+        return False
+
+
+def remove_blob_copies(file_hash: Optional[str]) -> bool:
+    """Delete every copy of a blob, on any node, returning False if there was none"""
+    if not file_hash:
+        return False
+    removed = [
+        remove_blob(path) for node in storage_nodes()
+        for path in (blob_path(file_hash, node), legacy_blob_path(file_hash, node))
+    ]
+    return any(removed)
+
+
+def list_dir_names(directory: str, older_than: Optional[float] = None, ordered: bool = True) -> List[str]:
+    """
+    List the blob or chunk names in one directory, sorted unless `ordered`
+    is False. Blobs modified after `older_than` (a unix timestamp) are
+    skipped so uploads that have been written but not yet committed to the
+    database are left alone.
+    """
+    names = []
+    try:
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                if not BLOB_NAME_RE.match(entry.name) or not entry.is_file():
+                    continue
+                if older_than is not None and entry.stat().st_mtime > older_than:
+                    continue
+                names.append(entry.name)
+    except FileNotFoundError:
+        return []
+    if ordered:
+        names.sort()
+    return names
+
+
+def iter_sharded_names(root: str, older_than: Optional[float] = None) -> Iterator[str]:
+    """
+    Yield the names stored under root's <first two hex digits>/ directories
+    in ascending order. The directories sort like the names in them, so only
+    one directory, about 1/256 of the names, is held in memory at a time.
+    """
+    if not os.path.isdir(root):
+        return
+    for prefix in sorted(name for name in os.listdir(root) if SHARD_NAME_RE.match(name)):
+        yield from list_dir_names(os.path.join(root, prefix), older_than)
+
+
+def iter_node_blob_names(node: str, older_than: Optional[float] = None) -> Iterator[str]:
+    """Yield the names of the blobs stored on one node in ascending order"""
+    return unique_merge([
+        iter_sharded_names(node, older_than),
+        # Layout 1 blobs, none once the node has been rebalanced
+        iter(list_dir_names(node, older_than)),
+    ])
+
+
+def remove_chunk_copies(digest: str, older_than: Optional[float] = None) -> bool:
+    """
+    Delete every copy of a chunk, on any node, returning False if there was
+    none. Copies modified after `older_than` were just written again for a
+    new reference and are kept.
+    """
+    removed = False
+    for node in storage_nodes():
+        path = chunk_path(digest, node)
+        try:
+            if older_than is not None and os.stat(path).st_mtime > older_than:
+                continue
+        except FileNotFoundError:
+            continue
+        except OSError as e:
+            logger.error(f"Error checking chunk {path}: {str(e)}")
+            continue
+        removed = remove_blob(path) or removed
+    return removed
+
+
+def iter_node_chunk_names(node: str, older_than: Optional[float] = None) -> Iterator[str]:
+    """Yield the digests of the chunks stored on one node in ascending order"""
+    return iter_sharded_names(os.path.join(node, CHUNK_DIR), older_than)
+
+
+def unique_merge(iterators: List[Iterator[str]]) -> Iterator[str]:
+    last = None
+    for name in heapq.merge(*iterators):
+        if name != last:
+            yield name
+            last = name
+
+
+def iter_blob_names(older_than: Optional[float] = None) -> Iterator[str]:
+    """Yield the names of the blobs stored on any node in ascending order, once each"""
+    return unique_merge([iter_node_blob_names(node, older_than) for node in storage_nodes()])
+
+
+def iter_chunk_names(older_than: Optional[float] = None) -> Iterator[str]:
+    """Yield the digests of the chunks stored on any node in ascending order, once each"""
+    return unique_merge([iter_node_chunk_names(node, older_than) for node in storage_nodes()])
+
+
+def is_balanced(node: str) -> bool:
+    try:
+        with open(os.path.join(node, RING_MARKER)) as marker:
+            return marker.read().strip() == ring.fingerprint
+    except OSError:
+        return False
+
+
+def mark_balanced(node: str) -> None:
+    os.makedirs(node, exist_ok=True)
+    with open(os.path.join(node, RING_MARKER), "w") as marker:
+        marker.write(ring.fingerprint)
+
+
+def mark_unbalanced(node: str) -> None:
+    try:
+        os.remove(os.path.join(node, RING_MARKER))
+    except FileNotFoundError:
+        pass
+
+
+def under_replicated(name: str, written: List[str]) -> None:
+    """
+    Make the next rebalance rescan the nodes that hold a copy of `name`, so
+    it copies the blob or chunk to the replicas that could not be written.
+    A rebalance already scanning one of them skips the fresh copy and leaves
+    the node unbalanced, so the copy is never missed.
+    """
+    logger.warning(f"Stored {name} on {len(written)} of its replicas, queueing it for the next rebalance")
+    for node in written:
+        try:
+            mark_unbalanced(node)
+        except OSError as e:
+            logger.error(f"Error marking {node} for rebalance: {str(e)}")
+
+
+def copy_blob(source: str, destination: str) -> None:
+    """Copy a blob so that readers never see a partial destination"""
+    os.makedirs(os.path.dirname(destination), exist_ok=True)
+    partial = f"{destination}.partial"
+    shutil.copyfile(source, partial)
+    shutil.copystat(source, partial)
+    os.replace(partial, destination)
+
+
+def rebalance_node(node: str, older_than: float) -> Dict[str, int]:
+    """
+    Move the blobs and chunks on one node to where the ring places them:
+    copy each to the replicas missing it, then drop the local copy if this
+    node is not one of them. Blobs still in layout 1 are moved to their
+    sharded paths on the way.
+
+    Blobs modified after `older_than` may still be being written and are
+    skipped; the node is only marked balanced once nothing was skipped or
+    failed, so a later run picks them up.
+    """
+    counts = {"copied": 0, "moved": 0, "removed": 0, "skipped": 0, "failed": 0}
+    rebalance_names(node, iter_sharded_names(node), blob_path, older_than, counts)
+    rebalance_names(node, list_dir_names(node, ordered=False), blob_path, older_than, counts, legacy_blob_path)
+    rebalance_names(node, iter_node_chunk_names(node), chunk_path, older_than, counts)
+    if not counts["skipped"] and not counts["failed"]:
+        mark_balanced(node)
+    return counts
+
+
+def rebalance_names(
+    node: str, names: Iterable[str], path_for, older_than: float, counts: Dict[str, int], source_for=None
+) -> None:
+    for name in names:
+        source = (source_for or path_for)(name, node)
+        try:
+            if os.stat(source).st_mtime > older_than:
+                counts["skipped"] += 1
+                continue
+        except FileNotFoundError:
+            continue  # Purged meanwhile
+        destinations = [path_for(name, target) for target in ring.nodes_for(name)]
+        local = path_for(name, node)
+        if local != source and local in destinations:
+            # A layout 1 blob this node keeps is renamed rather than copied
+            try:
+                os.makedirs(os.path.dirname(local), exist_ok=True)
+                os.replace(source, local)
+                source = local
+                counts["moved"] += 1
+            except OSError as e:
+                counts["failed"] += 1
+                logger.error(f"Error moving {source} to {local}: {str(e)}")
+                continue
+        complete = True
+        for destination in destinations:
+            if destination == source or os.path.isfile(destination):
+                continue
+            try:
+                copy_blob(source, destination)
+                counts["copied"] += 1
+            except OSError as e:
+                complete = False
+                counts["failed"] += 1
+                logger.error(f"Error copying {source} to {destination}: {str(e)}")
+        if source not in destinations and complete and remove_blob(source):
+            counts["removed"] += 1
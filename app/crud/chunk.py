@@ -0,0 +1,107 @@
+from collections import Counter
+from typing import Dict, Iterator, List, Tuple
+from sqlalchemy import bindparam, update
+from sqlalchemy.orm import Session
+from app.crud import stats as stats_crud
+from app.models.file import Chunk, FileChunk, FileUpload
+
+
+def lock_chunks(db: Session, digests: List[str]) -> Dict[str, int]:
+    """
+    Lock the rows of the chunks that exist among digests and return their
+    reference counts. Holding the locks until commit keeps the collector
+    from deleting a chunk this transaction is about to reference.
+    """
+    if not digests:
+        return {}
+    rows = db.query(Chunk.digest, Chunk.refcount).filter(
+        Chunk.digest.in_(sorted(set(digests)))
+    ).order_by(Chunk.digest).with_for_update()
+    return {digest: refcount for digest, refcount in rows}
+
+
+def add_file_chunks(db: Session, file_hash: str, chunks: List[Tuple[str, int]]) -> None:
+    """
+    Make a file the ordered list of (digest, size) chunks, taking a
+    reference on each. The chunk contents must already be stored.
+    """
+    references = Counter(digest for digest, _ in chunks)
+    sizes = dict(chunks)
+    stats_crud.increment(
+        db, Chunk,
+        [{"digest": digest, "size": sizes[digest], "refcount": count} for digest, count in references.items()],
+        counters=["refcount"],
+    )
+    if chunks:
+        db.bulk_insert_mappings(FileChunk, [
+            {"file_hash": file_hash, "seq": seq, "chunk_digest": digest, "size": size}
+            for seq, (digest, size) in enumerate(chunks)
+        ])
+    db.query(FileUpload).filter(FileUpload.file_hash == file_hash).update(
+        {FileUpload.is_chunked: True}, synchronize_session=False
+    )
+
+
+def get_file_chunks(db: Session, file_hash: str) -> List[Tuple[str, int]]:
+    return [
+        (digest, size) for digest, size in db.query(FileChunk.chunk_digest, FileChunk.size).filter(
+            FileChunk.file_hash == file_hash
+        ).order_by(FileChunk.seq)
+    ]
+
+
+def get_files_chunks(db: Session, file_hashes: List[str]) -> Dict[str, List[Tuple[str, int]]]:
+    """The chunk lists of several files in one query, keyed by file hash"""
+    chunks: Dict[str, List[Tuple[str, int]]] = {}
+    if not file_hashes:
+        return chunks
+    rows = db.query(FileChunk.file_hash, FileChunk.chunk_digest, FileChunk.size).filter(
+        FileChunk.file_hash.in_(file_hashes)
+    ).order_by(FileChunk.file_hash, FileChunk.seq)
+    for file_hash, digest, size in rows:
+        chunks.setdefault(file_hash, []).append((digest, size))
+    return chunks
+
+
+def release_file_chunks(db: Session, file_hashes: List[str]) -> int:
+    """
+    Drop the chunk lists of files and their references to the chunks.
+    Chunks left without references are removed by the collector.
+    """
+    references = Counter(
+        digest for (digest,) in db.query(FileChunk.chunk_digest).filter(FileChunk.file_hash.in_(file_hashes))
+    )
+    if not references:
+        return 0
+    table = Chunk.__table__
+    db.execute(
+        update(table).where(table.c.digest == bindparam("b_digest")).values(
+            refcount=table.c.refcount - bindparam("b_count")
+        ),
+        [{"b_digest": digest, "b_count": count} for digest, count in references.items()],
+    )
+    return db.query(FileChunk).filter(FileChunk.file_hash.in_(file_hashes)).delete(synchronize_session=False)
+
+
+def get_unused_chunks(db: Session, limit: int) -> List[str]:
+    """Lock and return chunks nothing references any more"""
+    return [
+        digest for (digest,) in db.query(Chunk.digest).filter(Chunk.refcount <= 0).order_by(
+            Chunk.digest
+        ).limit(limit).with_for_update()
+    ]
+
+
+def delete_chunks(db: Session, digests: List[str]) -> int:
+    return db.query(Chunk).filter(
+        Chunk.digest.in_(digests), Chunk.refcount <= 0
+    ).delete(synchronize_session=False)
+
+
+def iter_chunk_digests(db: Session, batch_size: int = 1000) -> Iterator[str]:
+    """
+    Stream every chunk digest in ascending order without materializing the table.
+    """
+    query = db.query(Chunk.digest).order_by(Chunk.digest).yield_per(batch_size)
+    for (digest,) in query:
+        yield digest
@@ -1,6 +1,13 @@
-from typing import Optional, List, Dict, Any
+from datetime import datetime
+from typing import Iterator, Optional, List, Dict, Any, Tuple
+from sqlalchemy import bindparam, case, func, insert, literal, select, text
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
-from app.models.file import FileUpload, TaskStatus
+from app.config import settings
+from app.core import search
+from app.crud import chunk as chunk_crud
+from app.crud import stats as stats_crud
+from app.models.file import ChangeSequence, FileChange, FileNameTrigram, FileUpload, IdempotencyKey, TaskStatus
 from app.schemas.file import FileUploadCreate, FileUploadUpdate, TaskStatusCreate
 
 
@@ -10,6 +17,12 @@ def get(db: Session, file_hash: str) -> Optional[FileUpload]:
 def create(db: Session, obj_in: Dict[str, Any]) -> FileUpload:
     db_obj = FileUpload(**obj_in)
     db.add(db_obj)
+    db.add(FileChange(
+        user_id=db_obj.user_id, file_hash=db_obj.file_hash, change_type="created", status=db_obj.status
+    ))
+    if search_backend(db) == "trigram":
+        index_file_names(db, [(db_obj.user_id, db_obj.file_hash, db_obj.original_filename)])
+    stats_crud.count_created(db, db_obj.user_id, db_obj.size, db_obj.status or "pending")
     db.commit()
     db.refresh(db_obj)
     return db_obj
@@ -20,8 +33,309 @@ def update(db: Session, db_obj, obj_in: dict) -> None:
     db.commit()
     db.refresh(db_obj)
 
+def set_status_many(db: Session, file_hashes: List[str], status: str) -> set:
+    """
+    Set the status of every existing file in file_hashes and return the hashes that exist.
+    """
+    known = {row.file_hash for row in db.query(FileUpload.file_hash).filter(FileUpload.file_hash.in_(file_hashes))}
+    if known:
+        set_status(db, list(known), status)
+    return known
+
+def set_status(db: Session, file_hashes: List[str], status: str, now: Optional[datetime] = None) -> None:
+    """
+    Set the status of files with one UPDATE, keeping the usage counters and
+    the change feed in step. The caller commits.
+    """
+    stats_crud.count_status_change(db, file_hashes, status)
+    db.query(FileUpload).filter(FileUpload.file_hash.in_(file_hashes)).update(
+        {"status": status, "updated_at": now or datetime.now()}, synchronize_session=False
+    )
+    record_changes(db, file_hashes, "status")
+
+def get_user_file(db: Session, file_hash: str, user_id: int) -> Optional[FileUpload]:
+    return db.query(FileUpload).filter(
+        FileUpload.file_hash == file_hash, FileUpload.user_id == user_id
+    ).first()
+
+def get_user_file_by_digest(db: Session, content_sha256: str, user_id: int) -> Optional[FileUpload]:
+    return db.query(FileUpload).filter(
+        FileUpload.user_id == user_id,
+        FileUpload.content_sha256 == content_sha256,
+        FileUpload.is_deleted.isnot(True),
+    ).order_by(FileUpload.created_at.desc()).first()
+
 def get_user_files(db: Session, user_id: int, skip: int = 0, limit: int = 100) -> List[FileUpload]:
-    return db.query(FileUpload).filter(FileUpload.user_id == user_id).offset(skip).limit(limit).all()
+    return db.query(FileUpload).filter(
+        FileUpload.user_id == user_id, FileUpload.is_deleted.isnot(True)
+    ).offset(skip).limit(limit).all()
+
+def get_user_files_by_hashes(db: Session, file_hashes: List[str], user_id: int) -> List[FileUpload]:
+    if not file_hashes:
+        return []
+    return db.query(FileUpload).filter(
+        FileUpload.file_hash.in_(file_hashes),
+        FileUpload.user_id == user_id,
+        FileUpload.is_deleted.isnot(True),
+    ).all()
+
+# Columns of the FileUpload schema, for listings that skip ORM instances entirely
+FILE_LISTING_COLUMNS = (
+    FileUpload.file_hash,
+    FileUpload.original_filename,
+    FileUpload.content_sha256,
+    FileUpload.size,
+    FileUpload.status,
+    FileUpload.created_at,
+    FileUpload.is_deleted,
+    FileUpload.deleted_at,
+)
+FILE_LISTING_KEYS = tuple(column.key for column in FILE_LISTING_COLUMNS)
+
+def get_user_file_rows(
+    db: Session, user_id: int, skip: int = 0, limit: int = 100, deleted: bool = False
+) -> List[Dict[str, Any]]:
+    """
+    List a user's files as plain dicts shaped like the FileUpload schema.
+
+    Fetches column tuples rather than ORM instances, so there is no identity
+    map or attribute instrumentation to pay for on large pages.
+    """
+    query = db.query(*FILE_LISTING_COLUMNS).filter(FileUpload.user_id == user_id)
+    if deleted:
+        query = query.filter(FileUpload.is_deleted.is_(True)).order_by(FileUpload.deleted_at.desc())
+    else:
+        query = query.filter(FileUpload.is_deleted.isnot(True))
+    return [dict(zip(FILE_LISTING_KEYS, row)) for row in query.offset(skip).limit(limit)]
+
+def soft_delete(db: Session, db_obj: FileUpload) -> bool:
+    """
+    Move a file to the trash. The UPDATE only matches a file that is not in
+    the trash yet, so when two requests delete it at once only one is
+    counted; returns False for the other.
+    """
+    return _set_deleted(db, db_obj, True, "deleted")
+
+def restore(db: Session, db_obj: FileUpload) -> bool:
+    """Take a file out of the trash; returns False if it was not in it any more"""
+    return _set_deleted(db, db_obj, False, "restored")
+
+def _set_deleted(db: Session, db_obj: FileUpload, deleted: bool, change_type: str) -> bool:
+    now = datetime.now()
+    changed = db.query(FileUpload).filter(
+        FileUpload.file_hash == db_obj.file_hash,
+        FileUpload.is_deleted.isnot(True) if deleted else FileUpload.is_deleted.is_(True),
+    ).update(
+        {"is_deleted": deleted, "deleted_at": now if deleted else None, "updated_at": now},
+        synchronize_session=False,
+    )
+    if changed:
+        db.add(FileChange(user_id=db_obj.user_id, file_hash=db_obj.file_hash, change_type=change_type, status=db_obj.status))
+        stats_crud.count_deleted(db, db_obj.user_id, restored=not deleted)
+    db.commit()
+    if changed:
+        db.refresh(db_obj)
+    return bool(changed)
+
+def get_expired_trash(db: Session, cutoff: datetime, limit: int = 500) -> List[FileUpload]:
+    return db.query(FileUpload).filter(
+        FileUpload.is_deleted.is_(True), FileUpload.deleted_at < cutoff
+    ).order_by(FileUpload.deleted_at).limit(limit).all()
+
+def purge(db: Session, file_hashes: List[str]) -> int:
+    """
+    Permanently delete file records and release their chunks. The caller
+    commits and removes the blobs.
+    """
+    if not file_hashes:
+        return 0
+    record_changes(db, file_hashes, "purged")
+    stats_crud.count_purged(db, file_hashes)
+    chunk_crud.release_file_chunks(db, file_hashes)
+    if search_backend(db) == "trigram":
+        db.query(FileNameTrigram).filter(
+            FileNameTrigram.file_hash.in_(file_hashes)
+        ).delete(synchronize_session=False)
+    return db.query(FileUpload).filter(
+        FileUpload.file_hash.in_(file_hashes)
+    ).delete(synchronize_session=False)
+
+def search_backend(db: Session) -> str:
+    return search.backend(db.get_bind().dialect.name)
+
+def index_file_names(db: Session, files: List[Tuple[int, str, Optional[str]]]) -> None:
+    """
+    Add the trigrams of each (user_id, file_hash, original_filename) to the search index.
+    """
+    rows = [
+        {"user_id": user_id, "trigram": trigram, "file_hash": file_hash}
+        for user_id, file_hash, name in files if name
+        for trigram in search.name_trigrams(name)
+    ]
+    if rows:
+        db.execute(insert(FileNameTrigram), rows)
+
+def iter_file_names(db: Session, batch_size: int = 1000) -> Iterator[Tuple[int, str, Optional[str]]]:
+    query = db.query(FileUpload.user_id, FileUpload.file_hash, FileUpload.original_filename).yield_per(batch_size)
+    for row in query:
+        yield tuple(row)
+
+def search_user_files(
+    db: Session,
+    user_id: int,
+    q: Optional[str] = None,
+    prefix: Optional[str] = None,
+    ext: Optional[str] = None,
+    limit: int = 50,
+) -> List[Dict[str, Any]]:
+    """
+    Search a user's files by substring, prefix and extension of original_filename.
+
+    Candidates come from the search index (FULLTEXT on MySQL, the trigram
+    table elsewhere) and are then checked against the name itself. Results
+    are ranked exact match first, then prefix matches, then shorter names,
+    then newest. Filters too short for the index fall back to scanning the
+    user's own files.
+    """
+    name = func.lower(FileUpload.original_filename)
+    query = db.query(*FILE_LISTING_COLUMNS).filter(
+        FileUpload.user_id == user_id, FileUpload.is_deleted.isnot(True)
+    )
+    if q:
+        q_pattern = search.like_escape(q.lower())
+        query = query.filter(name.like(f"%{q_pattern}%", escape=search.LIKE_ESCAPE))
+    if prefix:
+        query = query.filter(name.like(f"{search.like_escape(prefix.lower())}%", escape=search.LIKE_ESCAPE))
+    if ext:
+        query = query.filter(name.like(f"%.{search.like_escape(ext.lower())}", escape=search.LIKE_ESCAPE))
+
+    if search_backend(db) == "fulltext":
+        terms = [term for term in (q, prefix, ext) if term and len(term) >= settings.SEARCH_NGRAM_TOKEN_SIZE]
+        if terms:
+            # Every term as a required phrase: the ngram parser matches them anywhere in the name
+            against = " ".join('+"{}"'.format(term.replace('"', " ")) for term in terms)
+            query = query.filter(FileUpload.original_filename.match(against))
+    else:
+        grams = sorted(search.query_trigrams(q, prefix, ext))
+        if grams:
+            matched = db.query(FileNameTrigram.file_hash).filter(
+                FileNameTrigram.user_id == user_id, FileNameTrigram.trigram.in_(grams)
+            ).group_by(FileNameTrigram.file_hash).having(func.count() == len(grams)).subquery()
+            query = query.join(matched, matched.c.file_hash == FileUpload.file_hash)
+
+    if q:
+        query = query.order_by(
+            case((name == q.lower(), 0), (name.like(f"{q_pattern}%", escape=search.LIKE_ESCAPE), 1), else_=2),
+            func.length(FileUpload.original_filename),
+        )
+    query = query.order_by(FileUpload.created_at.desc())
+    return [dict(zip(FILE_LISTING_KEYS, row)) for row in query.limit(limit)]
+
+def record_changes(db: Session, file_hashes: List[str], change_type: str) -> None:
+    """
+    Append a change for each existing file in file_hashes with one INSERT ... SELECT.
+
+    Runs in the caller's transaction, so the change commits with the update it
+    describes; call it before deleting rows.
+    """
+    if not file_hashes:
+        return
+    rows = select(
+        FileUpload.user_id,
+        FileUpload.file_hash,
+        literal(change_type),
+        FileUpload.status,
+        literal(datetime.now()),
+    ).where(FileUpload.file_hash.in_(file_hashes))
+    db.execute(insert(FileChange).from_select(
+        ["user_id", "file_hash", "change_type", "status", "created_at"], rows
+    ))
+
+def sequence_changes(db: Session, limit: int = 1000) -> int:
+    """
+    Number up to limit committed changes for the feed and commit.
+
+    A cursor over ids could move past a change whose transaction commits
+    after a later id is already visible. Sequence numbers are only given to
+    committed rows, under the lock on the change_sequence row, so a change
+    numbered later always gets a higher seq than any cursor handed out
+    before it, however late its transaction committed.
+    """
+    if db.query(FileChange.id).filter(FileChange.seq.is_(None)).first() is None:
+        return 0
+    try:
+        counter = db.query(ChangeSequence).filter(ChangeSequence.id == 1).with_for_update().first()
+        if counter is None:
+            counter = ChangeSequence(id=1, last_seq=db.query(func.max(FileChange.seq)).scalar() or 0)
+            db.add(counter)
+        # Rows of transactions still in flight are locked by them; they are numbered by a later call
+        ids = [row_id for (row_id,) in db.query(FileChange.id).filter(
+            FileChange.seq.is_(None)
+        ).order_by(FileChange.id).limit(limit).with_for_update(skip_locked=True)]
+        if ids:
+            table = FileChange.__table__
+            db.execute(
+                table.update().where(table.c.id == bindparam("b_id")).values(seq=bindparam("b_seq")),
+                [{"b_id": row_id, "b_seq": counter.last_seq + offset} for offset, row_id in enumerate(ids, 1)],
+            )
+            counter.last_seq += len(ids)
+        db.commit()
+    except IntegrityError:
+        # Another request created the counter row first
+        db.rollback()
+        return 0
+    return len(ids)
+
+def get_change_cursor(db: Session) -> int:
+    """Return the last sequence number handed out"""
+    last_seq = db.query(ChangeSequence.last_seq).filter(ChangeSequence.id == 1).scalar()
+    return last_seq or 0
+
+def get_oldest_change_seq(db: Session) -> Optional[int]:
+    return db.query(func.min(FileChange.seq)).scalar()
+
+def get_user_changes(db: Session, user_id: int, since: int, until: int, limit: int = 500) -> List[Dict[str, Any]]:
+    """
+    Return a user's changes with since < seq <= until, oldest first, with
+    the file's current state (None once purged).
+    """
+    rows = db.query(
+        FileChange.seq, FileChange.file_hash, FileChange.change_type, FileChange.status,
+        FileChange.created_at, *FILE_LISTING_COLUMNS,
+    ).outerjoin(
+        FileUpload, FileUpload.file_hash == FileChange.file_hash
+    ).filter(
+        FileChange.user_id == user_id, FileChange.seq > since, FileChange.seq <= until
+    ).order_by(FileChange.seq).limit(limit)
+
+    return [{
+        "seq": seq,
+        "file_hash": file_hash,
+        "change_type": change_type,
+        "status": status,
+        "changed_at": changed_at,
+        "file": dict(zip(FILE_LISTING_KEYS, file_columns)) if file_columns[0] is not None else None,
+    } for seq, file_hash, change_type, status, changed_at, *file_columns in rows]
+
+def delete_old_changes(db: Session, cutoff: datetime, limit: int = 500) -> int:
+    ids = [row.id for row in db.query(FileChange.id).filter(
+        FileChange.created_at < cutoff
+    ).order_by(FileChange.id).limit(limit).all()]
+    if not ids:
+        return 0
+    return db.query(FileChange).filter(FileChange.id.in_(ids)).delete(synchronize_session=False)
+
+def iter_file_hashes(db: Session, batch_size: int = 1000, chunked: Optional[bool] = None) -> Iterator[str]:
+    """
+    Stream every known file hash in ascending order without materializing the table,
+    optionally only those of files stored as chunks (chunked=True) or whole (chunked=False).
+    """
+    query = db.query(FileUpload.file_hash)
+    if chunked is not None:
+        query = query.filter(FileUpload.is_chunked == chunked)
+    query = query.order_by(FileUpload.file_hash).yield_per(batch_size)
+    for (file_hash,) in query:
+        yield file_hash
 
 def create_task_status(db: Session, task_data: dict) -> TaskStatus:
     task_status = TaskStatus(**task_data)
@@ -31,9 +345,153 @@ def create_task_status(db: Session, task_data: dict) -> TaskStatus:
 def get_task_status(db: Session, task_id: str) -> Optional[TaskStatus]:
     return db.query(TaskStatus).filter(TaskStatus.task_id == task_id).first()
 
+def get_user_task_statuses(db: Session, task_ids: List[str], user_id: int) -> List[TaskStatus]:
+    if not task_ids:
+        return []
+    return db.query(TaskStatus).filter(
+        TaskStatus.task_id.in_(task_ids), TaskStatus.user_id == user_id
+    ).all()
+
+def get_user_file_statuses(db: Session, file_hashes: List[str], user_id: int) -> List[Dict[str, Any]]:
+    if not file_hashes:
+        return []
+    rows = db.query(FileUpload.file_hash, FileUpload.status).filter(
+        FileUpload.file_hash.in_(file_hashes), FileUpload.user_id == user_id
+    )
+    return [{"file_hash": file_hash, "status": status} for file_hash, status in rows]
+
+def delete_task_statuses(db: Session, task_ids: List[str]) -> int:
+    task_ids = [task_id for task_id in task_ids if task_id]
+    if not task_ids:
+        return 0
+    return db.query(TaskStatus).filter(TaskStatus.task_id.in_(task_ids)).delete(synchronize_session=False)
+
+# States a task never leaves (see app.tasks.lifecycle)
+TERMINAL_TASK_STATUSES = ("completed", "failed")
+
+def delete_old_task_statuses(
+    db: Session, cutoff: datetime, statuses: Optional[Tuple[str, ...]] = None, limit: int = 500
+) -> int:
+    """
+    Delete up to limit task statuses created before cutoff, optionally only those in statuses.
+    """
+    query = db.query(TaskStatus.id).filter(TaskStatus.created_at < cutoff)
+    if statuses:
+        query = query.filter(TaskStatus.status.in_(statuses))
+    ids = [row.id for row in query.order_by(TaskStatus.created_at).limit(limit).all()]
+    if not ids:
+        return 0
+    # The created_at condition lets MySQL prune partitions
+    return db.query(TaskStatus).filter(
+        TaskStatus.id.in_(ids), TaskStatus.created_at < cutoff
+    ).delete(synchronize_session=False)
+
+def month_start(moment: datetime, months: int = 0) -> datetime:
+    """First instant of the month `months` after the one containing moment"""
+    month_index = moment.year * 12 + moment.month - 1 + months
+    return datetime(month_index // 12, month_index % 12 + 1, 1)
+
+def get_task_status_partitions(db: Session) -> List[str]:
+    """Names of the task_statuses partitions, oldest first; empty unless partitioned (MySQL)"""
+    if db.get_bind().dialect.name != "mysql":
+        return []
+    rows = db.execute(text(
+        "SELECT PARTITION_NAME FROM information_schema.PARTITIONS "
+        "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'task_statuses' AND PARTITION_NAME IS NOT NULL "
+        "ORDER BY PARTITION_ORDINAL_POSITION"
+    ))
+    return [name for (name,) in rows]
+
+def maintain_task_status_partitions(db: Session, now: datetime, months_ahead: int, drop_before: datetime) -> Tuple[int, int]:
+    """
+    Keep monthly task_statuses partitions ready ahead of time and drop whole
+    months created before drop_before.
+
+    Partitions are named pYYYYMM, plus pmax for anything later. New months
+    are split off pmax while it is still empty, so it is a metadata-only
+    change. Returns the number of partitions added and dropped.
+    """
+    partitions = get_task_status_partitions(db)
+    if not partitions:
+        return 0, 0
+    months = sorted(name for name in partitions if name != "pmax")
+    last = datetime.strptime(months[-1], "p%Y%m") if months else month_start(now, -1)
+
+    new_months = []
+    month = month_start(last, 1)
+    while month <= month_start(now, months_ahead):
+        new_months.append(month)
+        month = month_start(month, 1)
+    if new_months:
+        definitions = ", ".join(
+            f"PARTITION p{month:%Y%m} VALUES LESS THAN (TO_DAYS('{month_start(month, 1):%Y-%m-%d}'))"
+            for month in new_months
+        )
+        db.execute(text(
+            f"ALTER TABLE task_statuses REORGANIZE PARTITION pmax INTO "
+            f"({definitions}, PARTITION pmax VALUES LESS THAN MAXVALUE)"
+        ))
+
+    expired = [name for name in months if month_start(datetime.strptime(name, "p%Y%m"), 1) <= drop_before]
+    if expired:
+        db.execute(text(f"ALTER TABLE task_statuses DROP PARTITION {', '.join(expired)}"))
+    return len(new_months), len(expired)
+
 def update_task_status(db: Session, task_id: str, status: str) -> None:
     task_status = db.query(TaskStatus).filter(TaskStatus.task_id == task_id).first()
     if task_status:
         task_status.status = status
         db.commit()
-        db.refresh(task_status)
\ No newline at end of file
+        db.refresh(task_status)
+
+def _idempotency_key_filter(user_id: int, scope: str, key: str) -> tuple:
+    return (IdempotencyKey.user_id == user_id, IdempotencyKey.scope == scope, IdempotencyKey.key == key)
+
+def get_idempotency_key(db: Session, user_id: int, scope: str, key: str) -> Optional[IdempotencyKey]:
+    return db.query(IdempotencyKey).filter(*_idempotency_key_filter(user_id, scope, key)).first()
+
+def reserve_idempotency_key(db: Session, user_id: int, scope: str, key: str, request_hash: str) -> None:
+    """
+    Insert an in-progress record for a key. The unique constraint makes the
+    flush fail with IntegrityError if another request holds the key.
+    """
+    db.add(IdempotencyKey(user_id=user_id, scope=scope, key=key, request_hash=request_hash, response=None))
+    db.flush()
+
+def claim_idempotency_key(db: Session, record: IdempotencyKey, request_hash: str) -> bool:
+    """
+    Turn an expired or abandoned record into a reservation for a new request.
+    The update only matches the record as it was read, so of two requests
+    claiming it at once only one succeeds.
+    """
+    claimed = db.query(IdempotencyKey).filter(
+        IdempotencyKey.id == record.id,
+        IdempotencyKey.created_at == record.created_at,
+    ).update(
+        {IdempotencyKey.request_hash: request_hash, IdempotencyKey.response: None, IdempotencyKey.created_at: datetime.now()},
+        synchronize_session=False,
+    )
+    return claimed == 1
+
+def save_idempotent_response(db: Session, user_id: int, scope: str, key: str, response: Any) -> None:
+    """Complete a reservation with the response to replay; the replay window starts now"""
+    db.query(IdempotencyKey).filter(*_idempotency_key_filter(user_id, scope, key)).update(
+        {IdempotencyKey.response: response, IdempotencyKey.created_at: datetime.now()},
+        synchronize_session=False,
+    )
+
+def release_idempotency_key(db: Session, user_id: int, scope: str, key: str) -> None:
+    """Drop a reservation whose request failed, so a retry can run it again"""
+    db.query(IdempotencyKey).filter(
+        *_idempotency_key_filter(user_id, scope, key), IdempotencyKey.response.is_(None)
+    ).delete(synchronize_session=False)
+
+def delete_expired_idempotency_keys(db: Session, cutoff: datetime, limit: int = 500) -> int:
+    ids = [row.id for row in db.query(IdempotencyKey.id).filter(
+        IdempotencyKey.created_at < cutoff
+    ).limit(limit).all()]
+    if not ids:
+        return 0
+    return db.query(IdempotencyKey).filter(
+        IdempotencyKey.id.in_(ids)
+    ).delete(synchronize_session=False)
@@ -0,0 +1,148 @@
+from collections import Counter, defaultdict
+from datetime import date, datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+from sqlalchemy.orm import Session
+from app.models.file import FileUpload
+from app.models.stats import DailyFileStats, UserFileStats, UserStatusCount
+from app.models.user import User
+
+
+def increment(db: Session, model, rows: List[Dict], counters: Optional[List[str]] = None) -> None:
+    """
+    Add to counter columns of model, creating missing rows, in one statement.
+
+    Each row holds the primary key columns and the amounts to add to the
+    counter columns; any other column in `rows` is only used when the row
+    is created. The upsert is atomic, so concurrent transactions creating
+    the same counter row cannot collide.
+    """
+    if not rows:
+        return
+    table = model.__table__
+    keys = [column.name for column in table.primary_key]
+    if counters is None:
+        counters = [name for name in rows[0] if name not in keys]
+    # Column onupdate defaults do not apply to the update half of an upsert
+    touched = {"updated_at": datetime.now()} if "updated_at" in table.c else {}
+    rows = [{**row, **touched} for row in rows]
+    dialect = db.get_bind().dialect.name
+    # Only the dialect in use is imported
+    if dialect == "mysql":
+        from sqlalchemy.dialects.mysql import insert as dialect_insert
+        statement = dialect_insert(table).values(rows)
+        statement = statement.on_duplicate_key_update(
+            {**{name: table.c[name] + statement.inserted[name] for name in counters}, **touched}
+        )
+    else:
+        if dialect == "postgresql":
+            from sqlalchemy.dialects.postgresql import insert as dialect_insert
+        else:
+            from sqlalchemy.dialects.sqlite import insert as dialect_insert
+        statement = dialect_insert(table).values(rows)
+        statement = statement.on_conflict_do_update(
+            index_elements=keys,
+            set_={**{name: table.c[name] + statement.excluded[name] for name in counters}, **touched},
+        )
+    db.execute(statement)
+
+
+def _user_rows(deltas: Dict[int, Dict[str, int]]) -> List[Dict]:
+    columns = ("file_count", "total_bytes", "deleted_count", "failed_count")
+    return [
+        {"user_id": user_id, **{column: delta.get(column, 0) for column in columns}}
+        for user_id, delta in deltas.items()
+    ]
+
+
+def _daily_row(**counts) -> List[Dict]:
+    columns = ("uploads", "upload_bytes", "failures", "deletions", "purges")
+    return [{"day": date.today(), **{column: counts.get(column, 0) for column in columns}}]
+
+
+def _status_rows(counts: Counter) -> List[Dict]:
+    return [
+        {"user_id": user_id, "status": status, "file_count": count}
+        for (user_id, status), count in counts.items() if count
+    ]
+
+
+def count_created(db: Session, user_id: int, size: Optional[int], status: str) -> None:
+    increment(db, UserFileStats, _user_rows({user_id: {"file_count": 1, "total_bytes": size or 0}}))
+    increment(db, UserStatusCount, _status_rows(Counter({(user_id, status): 1})))
+    increment(db, DailyFileStats, _daily_row(uploads=1, upload_bytes=size or 0))
+
+
+def count_deleted(db: Session, user_id: int, restored: bool = False) -> None:
+    delta = -1 if restored else 1
+    increment(db, UserFileStats, _user_rows({user_id: {"deleted_count": delta}}))
+    if not restored:
+        increment(db, DailyFileStats, _daily_row(deletions=1))
+
+
+def _current(db: Session, file_hashes: Iterable[str]) -> List[Tuple[int, str, int, bool]]:
+    """
+    Read the counted columns of files and lock their rows until commit, so
+    a concurrent status change, delete or purge of the same files waits and
+    then computes its delta from what this transaction leaves behind.
+    """
+    return db.query(
+        FileUpload.user_id, FileUpload.status, FileUpload.size, FileUpload.is_deleted
+    ).filter(FileUpload.file_hash.in_(sorted(set(file_hashes)))).order_by(
+        FileUpload.file_hash
+    ).with_for_update().all()
+
+
+def count_status_change(db: Session, file_hashes: List[str], status: str) -> None:
+    """Move files to a new status in the counters; call before updating them"""
+    moves = Counter()
+    failures: Dict[int, Dict[str, int]] = defaultdict(lambda: {"failed_count": 0})
+    for user_id, old_status, _, _ in _current(db, file_hashes):
+        if old_status == status:
+            continue
+        moves[(user_id, old_status)] -= 1
+        moves[(user_id, status)] += 1
+        if status == "failed":
+            failures[user_id]["failed_count"] += 1
+    increment(db, UserStatusCount, _status_rows(moves))
+    if failures:
+        increment(db, UserFileStats, _user_rows(failures))
+        increment(db, DailyFileStats, _daily_row(failures=sum(delta["failed_count"] for delta in failures.values())))
+
+
+def count_purged(db: Session, file_hashes: List[str]) -> None:
+    """Remove files from the counters; call before deleting them"""
+    statuses = Counter()
+    users: Dict[int, Dict[str, int]] = defaultdict(lambda: {"file_count": 0, "total_bytes": 0, "deleted_count": 0})
+    rows = _current(db, file_hashes)
+    for user_id, status, size, is_deleted in rows:
+        statuses[(user_id, status)] -= 1
+        users[user_id]["file_count"] -= 1
+        users[user_id]["total_bytes"] -= size or 0
+        users[user_id]["deleted_count"] -= 1 if is_deleted else 0
+    increment(db, UserStatusCount, _status_rows(statuses))
+    increment(db, UserFileStats, _user_rows(users))
+    if rows:
+        increment(db, DailyFileStats, _daily_row(purges=len(rows)))
+
+
+def get_users_with_stats(db: Session, skip: int = 0, limit: int = 100) -> List[Tuple[User, Optional[UserFileStats]]]:
+    return db.query(User, UserFileStats).outerjoin(
+        UserFileStats, UserFileStats.user_id == User.id
+    ).order_by(User.id).offset(skip).limit(limit).all()
+
+
+def get_user_stats(db: Session, user_id: int) -> Optional[UserFileStats]:
+    return db.query(UserFileStats).filter(UserFileStats.user_id == user_id).first()
+
+
+def get_user_status_counts(db: Session, user_id: int) -> Dict[str, int]:
+    rows = db.query(UserStatusCount.status, UserStatusCount.file_count).filter(
+        UserStatusCount.user_id == user_id, UserStatusCount.file_count != 0
+    )
+    return {status: count for status, count in rows}
+
+
+def get_daily_stats(db: Session, start: date, end: date) -> List[DailyFileStats]:
+    return db.query(DailyFileStats).filter(
+        DailyFileStats.day >= start, DailyFileStats.day <= end
+    ).order_by(DailyFileStats.day).all()
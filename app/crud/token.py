@@ -0,0 +1,32 @@
+from datetime import datetime
+from typing import Iterator, List, Optional
+from sqlalchemy.orm import Session
+from app.models.token import RevokedToken
+
+
+def is_revoked(db: Session, jti: str) -> bool:
+    return db.query(RevokedToken.id).filter(RevokedToken.jti == jti).first() is not None
+
+def revoke(db: Session, jti: str, expires_at: datetime) -> RevokedToken:
+    db_obj = RevokedToken(jti=jti, expires_at=expires_at)
+    db.add(db_obj)
+    db.flush()
+    return db_obj
+
+def iter_revoked_since(db: Session, since: Optional[datetime], now: datetime, batch_size: int = 1000) -> Iterator[str]:
+    """
+    Stream the jti of every unexpired revocation recorded at or after since.
+    """
+    query = db.query(RevokedToken.jti).filter(RevokedToken.expires_at > now)
+    if since is not None:
+        query = query.filter(RevokedToken.revoked_at >= since)
+    for (jti,) in query.yield_per(batch_size):
+        yield jti
+
+def delete_expired(db: Session, now: datetime, limit: int = 500) -> int:
+    ids: List[int] = [row.id for row in db.query(RevokedToken.id).filter(
+        RevokedToken.expires_at <= now
+    ).limit(limit).all()]
+    if not ids:
+        return 0
+    return db.query(RevokedToken).filter(RevokedToken.id.in_(ids)).delete(synchronize_session=False)
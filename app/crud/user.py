@@ -4,11 +4,14 @@ from app.core.security import get_password_hash, verify_password
 from app.models.user import User
 from app.schemas.user import UserCreate
 
-def get_all(db: Session) -> List[User]:
+def get_all(db: Session, skip: int = 0, limit: int = 100) -> List[User]:
     """
-    Retrieve all users from the database.
+    Retrieve a page of users from the database.
     """
-    return db.query(User).all()
+    return db.query(User).order_by(User.id).offset(skip).limit(limit).all()
+
+def get(db: Session, user_id: int) -> Optional[User]:
+    return db.query(User).filter(User.id == user_id).first()
 
 def get_by_email(db: Session, *, email: str) -> Optional[User]:
     return db.query(User).filter(User.email == email).first()
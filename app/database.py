@@ -4,18 +4,39 @@ from sqlalchemy.orm import sessionmaker
 from app.config import settings
 from sqlalchemy.orm import declarative_base
 
-# Create engine with MySQL-specific arguments
-engine = create_engine(
-    settings.DATABASE_URL,
-    pool_pre_ping=True,
-    connect_args={
-        "charset": "utf8mb4"
-    }
-)
+def create_db_engine():
+    # MySQL-specific arguments; other databases (sqlite in development) reject them
+    connect_args = {}
+    if settings.DATABASE_URL.startswith("mysql"):
+        connect_args["charset"] = "utf8mb4"
+    return create_engine(
+        settings.DATABASE_URL,
+        pool_pre_ping=True,
+        pool_size=settings.DB_POOL_SIZE,
+        max_overflow=settings.DB_MAX_OVERFLOW,
+        connect_args=connect_args
+    )
+
+
+engine = create_db_engine()
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
+
+def rebind_engine():
+    """
+    Give this process its own engine and point SessionLocal at it.
+
+    Call after fork: pooled connections inherited from the parent share
+    sockets with it and must never be used by the child.
+    """
+    global engine
+    engine.dispose(close=False)
+    engine = create_db_engine()
+    SessionLocal.configure(bind=engine)
+    return engine
+
 # Dependency for routes
 def get_db():
     db = SessionLocal()
@@ -1,15 +1,35 @@
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from app.api import files, users
+from app.api import admin, files, users
 from app.config import settings
+from app.core.admission import AdmissionControlMiddleware
+from app.core.profiler import SlowRequestMiddleware, profiler
+from app.core.rate_limit import RateLimitMiddleware
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Runs in every worker, after fork
+    if settings.PROFILER_ENABLED or settings.SLOW_REQUEST_THRESHOLD_MS:
+        profiler.configure(True, slow_threshold=settings.SLOW_REQUEST_THRESHOLD_MS / 1000 or None)
+    yield
+    profiler.configure(False)
+
 
 app = FastAPI(
     title=settings.PROJECT_NAME,
     description=settings.PROJECT_DESCRIPTION,
     version=settings.VERSION,
+    lifespan=lifespan,
 )
 
-# Add CORS middleware
+# Shed load before it queues, then rate limit; the last middleware added runs first
+app.add_middleware(SlowRequestMiddleware)
+app.add_middleware(RateLimitMiddleware)
+app.add_middleware(AdmissionControlMiddleware)
+
+# Add CORS middleware (outermost, so rejections carry CORS headers too)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=settings.ALLOWED_ORIGINS,
@@ -21,6 +41,7 @@ app.add_middleware(
 # Include routers
 app.include_router(users.router, prefix="/api", tags=["users"])
 app.include_router(files.router, prefix="/api", tags=["files"])
+app.include_router(admin.router, prefix="/api", tags=["admin"])
 
 @app.get("/", tags=["root"])
 async def root():
@@ -1,2 +1,4 @@
 from app.models.user import User
-from app.models.file import FileUpload
\ No newline at end of file
+from app.models.file import FileUpload
+from app.models.token import RevokedToken
+from app.models.stats import UserFileStats
\ No newline at end of file
@@ -1,8 +1,9 @@
 from __future__ import annotations
-from sqlalchemy import Column, String, Integer, DateTime, Boolean, ForeignKey, JSON
+from sqlalchemy import Column, String, Integer, BigInteger, DateTime, Boolean, ForeignKey, JSON, Index, UniqueConstraint, VARBINARY
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from app.database import Base
+from app.models.types import UUIDBinary
 
 
 
@@ -12,22 +13,128 @@ class FileUpload(Base):
     file_hash = Column(String(64), primary_key=True)
     original_filename = Column(String(255))
     file_path = Column(String(512))
+    content_sha256 = Column(String(64), nullable=True)
+    size = Column(BigInteger, nullable=True)
     user_id = Column(Integer, ForeignKey("users.id"))
     status = Column(String(20), default="pending")
     created_at = Column(DateTime, default=datetime.now)
     updated_at = Column(DateTime, default=datetime.now, onupdate=datetime.now)
     is_deleted = Column(Boolean, default=False)
-    
+    deleted_at = Column(DateTime, nullable=True, index=True)
+    is_chunked = Column(Boolean, nullable=False, default=False)  # Content is in file_chunks, not at file_path
+
     # Relationships
     user = relationship("User", back_populates="file_uploads")
 
+    __table_args__ = (
+        Index("ix_file_uploads_user_digest", "user_id", "content_sha256"),
+        # Only MySQL builds this as an ngram FULLTEXT index; see app.core.search
+        Index(
+            "ft_file_uploads_original_filename", "original_filename",
+            mysql_prefix="FULLTEXT", mysql_with_parser="ngram",
+        ),
+    )
+
+
+class FileNameTrigram(Base):
+    """
+    Trigram index over original_filename, used for search when the database
+    has no suitable full-text index. Trigrams are stored as UTF-8 bytes so
+    that no collation folds two of them together.
+    """
+    __tablename__ = "file_name_trigrams"
+
+    user_id = Column(Integer, primary_key=True)
+    trigram = Column(VARBINARY(12), primary_key=True)
+    file_hash = Column(String(64), primary_key=True, index=True)
+
 
 class TaskStatus(Base):
+    """
+    On MySQL the table is partitioned by month of created_at (see
+    app.crud.file.maintain_task_status_partitions), which makes its primary
+    key (id, created_at) and rules out a unique index on task_id; task ids
+    are UUID4s, unique by construction. Partitioned tables cannot have
+    foreign keys either, so user_id is a plain column.
+    """
     __tablename__ = "task_statuses"
     
     id = Column(Integer, primary_key=True, index=True)
-    task_id = Column(String(255), unique=True)
+    task_id = Column(UUIDBinary, nullable=False, index=True)
+    user_id = Column(Integer, nullable=True)  # Who started the task; NULL for rows written before it was recorded
     status = Column(String(50))
-    created_at = Column(DateTime, default=datetime.now)
+    created_at = Column(DateTime, nullable=False, default=datetime.now, index=True)
     updated_at = Column(DateTime, default=datetime.now, onupdate=datetime.now)
-    result = Column(JSON, nullable=True)
\ No newline at end of file
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+    result = Column(JSON, nullable=True)
+
+
+class IdempotencyKey(Base):
+    __tablename__ = "idempotency_keys"
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    key = Column(String(255), nullable=False)
+    scope = Column(String(100), nullable=False)
+    request_hash = Column(String(64), nullable=True)  # SHA-256 of the request the key was first used with
+    response = Column(JSON(none_as_null=True), nullable=True)  # NULL while that request is still in progress
+    created_at = Column(DateTime, default=datetime.now, index=True)
+
+    __table_args__ = (
+        UniqueConstraint("user_id", "scope", "key", name="uq_idempotency_keys_user_scope_key"),
+    )
+
+
+class FileChange(Base):
+    """
+    Append-only log of changes to file_uploads, read by sync clients.
+
+    Clients use seq as their cursor. It is NULL until the change has been
+    committed and numbered (see app.crud.file.sequence_changes); ids are
+    assigned in insert order, not commit order, so they cannot serve.
+    """
+    __tablename__ = "file_changes"
+
+    id = Column(BigInteger().with_variant(Integer, "sqlite"), primary_key=True, autoincrement=True)
+    seq = Column(BigInteger, nullable=True, unique=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    file_hash = Column(String(64), nullable=False)
+    change_type = Column(String(20), nullable=False)
+    status = Column(String(20), nullable=True)
+    created_at = Column(DateTime, default=datetime.now, index=True)
+
+    __table_args__ = (
+        Index("ix_file_changes_user_id_seq", "user_id", "seq"),
+    )
+
+
+class ChangeSequence(Base):
+    """Single row holding the last seq handed out to file_changes"""
+    __tablename__ = "change_sequence"
+
+    id = Column(Integer, primary_key=True)
+    last_seq = Column(BigInteger, nullable=False, default=0)
+
+
+class Chunk(Base):
+    """
+    A deduplicated piece of file content, stored once under its SHA-256
+    and shared by every file_chunks row that references it.
+    """
+    __tablename__ = "chunks"
+
+    digest = Column(String(64), primary_key=True)
+    size = Column(Integer, nullable=False)
+    refcount = Column(Integer, nullable=False, default=0, index=True)
+    created_at = Column(DateTime, default=datetime.now)
+
+
+class FileChunk(Base):
+    """The ordered list of chunks a chunked file is made of"""
+    __tablename__ = "file_chunks"
+
+    file_hash = Column(String(64), ForeignKey("file_uploads.file_hash"), primary_key=True)
+    seq = Column(Integer, primary_key=True)
+    chunk_digest = Column(String(64), nullable=False, index=True)
+    size = Column(Integer, nullable=False)
@@ -0,0 +1,37 @@
+from __future__ import annotations
+from sqlalchemy import BigInteger, Column, Date, DateTime, ForeignKey, Integer, String
+from datetime import datetime
+from app.database import Base
+
+
+# Counters kept up to date by app.crud.stats in the same transaction as the
+# file_uploads writes they count, so dashboards never aggregate file_uploads.
+
+class UserFileStats(Base):
+    __tablename__ = "user_file_stats"
+
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    file_count = Column(Integer, nullable=False, default=0)  # Stored files, trash included
+    total_bytes = Column(BigInteger, nullable=False, default=0)
+    deleted_count = Column(Integer, nullable=False, default=0)  # Files in the trash
+    failed_count = Column(Integer, nullable=False, default=0)  # Processing failures, ever
+    updated_at = Column(DateTime, default=datetime.now, onupdate=datetime.now)
+
+
+class UserStatusCount(Base):
+    __tablename__ = "user_status_counts"
+
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    status = Column(String(20), primary_key=True)
+    file_count = Column(Integer, nullable=False, default=0)
+
+
+class DailyFileStats(Base):
+    __tablename__ = "daily_file_stats"
+
+    day = Column(Date, primary_key=True)
+    uploads = Column(Integer, nullable=False, default=0)
+    upload_bytes = Column(BigInteger, nullable=False, default=0)
+    failures = Column(Integer, nullable=False, default=0)
+    deletions = Column(Integer, nullable=False, default=0)
+    purges = Column(Integer, nullable=False, default=0)
@@ -0,0 +1,13 @@
+from __future__ import annotations
+from sqlalchemy import Column, String, Integer, DateTime
+from datetime import datetime
+from app.database import Base
+
+
+class RevokedToken(Base):
+    __tablename__ = "revoked_tokens"
+
+    id = Column(Integer, primary_key=True, index=True)
+    jti = Column(String(64), unique=True, index=True, nullable=False)
+    expires_at = Column(DateTime, nullable=False, index=True)
+    revoked_at = Column(DateTime, default=datetime.now, index=True)
@@ -0,0 +1,31 @@
+import uuid
+from typing import Optional
+
+from sqlalchemy.types import BINARY, TypeDecorator
+
+
+class UUIDBinary(TypeDecorator):
+    """
+    A UUID stored as BINARY(16) and handled as its canonical string.
+
+    Strings that are not UUIDs bind as NULL, so looking one up simply finds
+    nothing, and inserting one fails on the NOT NULL column.
+    """
+
+    impl = BINARY(16)
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect) -> Optional[bytes]:
+        if value is None:
+            return None
+        if isinstance(value, uuid.UUID):
+            return value.bytes
+        try:
+            return uuid.UUID(str(value)).bytes
+        except ValueError:
+            return None
+
+    def process_result_value(self, value, dialect) -> Optional[str]:
+        if value is None:
+            return None
+        return str(uuid.UUID(bytes=bytes(value)))
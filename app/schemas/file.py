@@ -1,6 +1,7 @@
-from typing import Optional, List
+from typing import Literal, Optional, List
 from datetime import datetime
-from pydantic import BaseModel
+from pydantic import BaseModel, ConfigDict, Field
+from app.config import settings
 
 
 class FileUploadBase(BaseModel):
@@ -18,24 +19,48 @@ class FileUploadUpdate(BaseModel):
 
 class FileUploadInDB(FileUploadBase):
     file_hash: str
+    content_sha256: Optional[str] = None
+    size: Optional[int] = None
     user_id: int
     status: str
     created_at: datetime
     updated_at: datetime
     is_deleted: bool
+    deleted_at: Optional[datetime] = None
 
-    class Config:
-        orm_mode = True
+    model_config = ConfigDict(from_attributes=True)
 
 
 class FileUpload(FileUploadBase):
     file_hash: str
+    content_sha256: Optional[str] = None
+    size: Optional[int] = None
     status: str
     created_at: datetime
     is_deleted: bool
+    deleted_at: Optional[datetime] = None
 
-    class Config:
-        orm_mode = True
+    model_config = ConfigDict(from_attributes=True)
+
+
+class ArchiveRequest(BaseModel):
+    file_hashes: List[str]
+    compression: Literal["auto", "stored", "deflate"] = "auto"
+
+
+class FileChange(BaseModel):
+    seq: int
+    file_hash: str
+    change_type: str
+    status: Optional[str] = None
+    changed_at: datetime
+    file: Optional[FileUpload] = None
+
+
+class FileChangeFeed(BaseModel):
+    changes: List[FileChange]
+    cursor: int
+    has_more: bool
 
 
 class FileUploadResponse(BaseModel):
@@ -57,14 +82,33 @@ class TaskStatusInDB(TaskStatusBase):
     id: int
     created_at: datetime
     updated_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
     result: Optional[dict] = None
 
-    class Config:
-        orm_mode = True
+    model_config = ConfigDict(from_attributes=True)
 
 
 class TaskStatus(TaskStatusBase):
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
     result: Optional[dict] = None
 
-    class Config:
-        orm_mode = True
\ No newline at end of file
+    model_config = ConfigDict(from_attributes=True)
+
+
+class TaskStatusBatchRequest(BaseModel):
+    # Rejected during validation, before an oversized list is deduplicated
+    task_ids: List[str] = Field([], max_length=settings.TASK_STATUS_BATCH_MAX)
+    file_hashes: List[str] = Field([], max_length=settings.TASK_STATUS_BATCH_MAX)
+
+
+class FileStatus(BaseModel):
+    file_hash: str
+    status: str
+
+
+class TaskStatusBatch(BaseModel):
+    tasks: List[TaskStatus]
+    files: List[FileStatus]
+    not_found: List[str]
@@ -0,0 +1,74 @@
+from typing import Dict, List, Optional
+from datetime import date, datetime
+from pydantic import BaseModel, ConfigDict, Field
+
+from app.schemas.user import User
+
+
+class UserFileStats(BaseModel):
+    file_count: int = 0
+    total_bytes: int = 0
+    deleted_count: int = 0
+    failed_count: int = 0
+    updated_at: Optional[datetime] = None
+
+    model_config = ConfigDict(from_attributes=True)
+
+
+class UserWithStats(User):
+    is_active: bool
+    stats: UserFileStats
+
+
+class UserStatsDetail(UserFileStats):
+    user_id: int
+    statuses: Dict[str, int]
+
+
+class DailyFileStats(BaseModel):
+    day: date
+    uploads: int
+    upload_bytes: int
+    failures: int
+    deletions: int
+    purges: int
+
+    model_config = ConfigDict(from_attributes=True)
+
+
+class ProfilerSettings(BaseModel):
+    enabled: bool
+    interval_ms: Optional[int] = Field(None, ge=1, le=1000)
+    slow_request_ms: Optional[int] = Field(None, ge=1)
+
+
+class ProfilerStatus(BaseModel):
+    pid: int
+    enabled: bool
+    interval_ms: float
+    slow_request_ms: Optional[float] = None
+    started_at: Optional[datetime] = None
+    samples: int
+    captures: int
+
+
+class SlowRequestQuery(BaseModel):
+    statement: str
+    duration_ms: float
+    executemany: bool
+
+
+class SlowRequestSummary(BaseModel):
+    id: int
+    method: str
+    path: str
+    status_code: Optional[int] = None
+    duration_ms: float
+    captured_at: datetime
+    sample_count: int
+    query_count: int
+
+
+class SlowRequestCapture(SlowRequestSummary):
+    queries: List[SlowRequestQuery]
+    stacks: str
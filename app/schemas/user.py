@@ -1,6 +1,6 @@
 from typing import Optional
 from datetime import datetime
-from pydantic import BaseModel, EmailStr, Field
+from pydantic import BaseModel, ConfigDict, EmailStr, Field
 
 
 class UserBase(BaseModel):
@@ -26,16 +26,14 @@ class UserInDB(UserBase):
     created_at: datetime
     is_active: bool
 
-    class Config:
-        orm_mode = True
+    model_config = ConfigDict(from_attributes=True)
 
 
 class User(UserBase):
     id: int
     created_at: datetime
 
-    class Config:
-        orm_mode = True
+    model_config = ConfigDict(from_attributes=True)
 
 
 class Token(BaseModel):
@@ -44,6 +42,12 @@ class Token(BaseModel):
     token_type: str
 
 
+class TokenRefresh(BaseModel):
+    refresh_token: str
+
+
 class TokenPayload(BaseModel):
     sub: Optional[int] = None
-    exp: Optional[datetime] = None
\ No newline at end of file
+    exp: Optional[datetime] = None
+    type: Optional[str] = None
+    jti: Optional[str] = None
\ No newline at end of file
@@ -0,0 +1,345 @@
+"""
+Production server entry point.
+
+The master process imports the application once, binds the listening
+socket and forks the workers, so the imported code is shared copy-on-write
+between them. Each worker runs uvicorn on the inherited socket with
+uvloop/httptools when they are installed.
+
+    python -m app.server --workers 4
+
+Signals handled by the master:
+
+    SIGHUP            reload: re-exec the master so it imports the current
+                      code and settings, keeping the listening socket and
+                      the running workers, then replace the workers one by
+                      one (start a replacement, wait until it serves, then
+                      gracefully stop an old worker)
+    SIGTERM, SIGINT   graceful shutdown
+
+A reload first imports app.main in a separate interpreter and is skipped,
+with the old master and workers left running, if that fails. The master
+keeps its pid and its environment variables across the re-exec; settings
+from the .env file and code changes are picked up, environment variable
+changes still need a full restart.
+
+The database schema is not touched at startup; run `alembic upgrade head`
+as a deploy step.
+"""
+import argparse
+import logging
+import os
+import resource
+import select
+import signal
+import socket
+import subprocess
+import sys
+import time
+from typing import Dict, List, Optional, Tuple
+
+import uvicorn
+
+from app.config import settings
+
+logger = logging.getLogger("app.server")
+
+LAUNCHED_AT = time.monotonic()
+
+
+def memory_usage() -> Tuple[float, Optional[float]]:
+    """
+    Return this process's resident and private memory in MiB.
+
+    Private memory excludes pages still shared with the master, which is
+    what preforking saves; it is only available on Linux.
+    """
+    try:
+        rss = private = 0
+        with open("/proc/self/smaps_rollup") as smaps:
+            for line in smaps:
+                field, _, value = line.partition(":")
+                if field == "Rss":
+                    rss = int(value.split()[0])
+                elif field in ("Private_Clean", "Private_Dirty"):
+                    private += int(value.split()[0])
+        return rss / 1024, private / 1024
+    except OSError:
+        # ru_maxrss is the peak, in KiB on Linux and bytes on macOS
+        maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return (maxrss / 1024 / 1024 if sys.platform == "darwin" else maxrss / 1024), None
+
+
+def bind_socket(host: str, port: int, backlog: int) -> socket.socket:
+    family = socket.AF_INET6 if ":" in host else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    sock.set_inheritable(True)
+    return sock
+
+
+class WorkerServer(uvicorn.Server):
+    """uvicorn server that tells the master when it is ready to serve"""
+
+    def __init__(self, config: uvicorn.Config, ready_fd: int, forked_at: float):
+        super().__init__(config)
+        self.ready_fd = ready_fd
+        self.forked_at = forked_at
+
+    async def startup(self, sockets=None) -> None:
+        await super().startup(sockets=sockets)
+        if self.should_exit:
+            return
+        rss, private = memory_usage()
+        private_info = f", {private:.1f} MiB private" if private is not None else ""
+        logger.info(
+            f"Worker {os.getpid()} ready in {time.monotonic() - self.forked_at:.3f}s, "
+            f"RSS {rss:.1f} MiB{private_info}"
+        )
+        os.write(self.ready_fd, f"{os.getpid()}\n".encode())
+
+
+def reexec_argv(argv: List[str], fd: int, pids: List[int]) -> List[str]:
+    """Command line that re-executes the server on an inherited socket, adopting pids"""
+    kept, skip = [], False
+    for arg in argv:
+        if skip:
+            skip = False
+        elif arg in ("--fd", "--adopt"):
+            skip = True
+        elif not arg.startswith(("--fd=", "--adopt=")):
+            kept.append(arg)
+    command = [sys.executable, "-m", "app.server", *kept, "--fd", str(fd)]
+    if pids:
+        command += ["--adopt", ",".join(str(pid) for pid in pids)]
+    return command
+
+
+class Master:
+    def __init__(
+        self, app, sock: socket.socket, workers: int, graceful_timeout: int, log_level: str,
+        argv: List[str], adopted: List[int],
+    ):
+        self.app = app
+        self.sock = sock
+        self.num_workers = workers
+        self.graceful_timeout = graceful_timeout
+        self.log_level = log_level
+        self.argv = argv
+        # Workers started by the master this process replaced are still our children
+        self.workers: Dict[int, float] = {pid: 0.0 for pid in adopted}  # pid -> fork time
+        self.stopping: Dict[int, float] = {}  # pid -> kill deadline
+        self.ready_r, self.ready_w = os.pipe()
+        self.ready_buffer = b""
+        self.signals = []
+        self.running = True
+
+    # Signal handling
+
+    def handle_signal(self, signum, frame) -> None:
+        self.signals.append(signum)
+
+    def install_signal_handlers(self) -> None:
+        for signum in (signal.SIGHUP, signal.SIGTERM, signal.SIGINT, signal.SIGCHLD):
+            signal.signal(signum, self.handle_signal)
+
+    # Workers
+
+    def spawn_worker(self) -> int:
+        forked_at = time.monotonic()
+        pid = os.fork()
+        if pid:
+            self.workers[pid] = forked_at
+            return pid
+
+        # Worker process: drop the master's handlers before uvicorn installs its own
+        exit_code = 0
+        try:
+            for signum in (signal.SIGTERM, signal.SIGINT, signal.SIGCHLD):
+                signal.signal(signum, signal.SIG_DFL)
+            signal.signal(signal.SIGHUP, signal.SIG_IGN)
+            os.close(self.ready_r)
+
+            # Connections opened by the master must not be shared with the child
+            from app.database import engine
+            engine.dispose(close=False)
+
+            config = uvicorn.Config(
+                self.app, loop="auto", http="auto", lifespan="auto", log_level=self.log_level
+            )
+            WorkerServer(config, self.ready_w, forked_at).run(sockets=[self.sock])
+        except BaseException:
+            logger.exception(f"Worker {os.getpid()} crashed")
+            exit_code = 1
+        finally:
+            os._exit(exit_code)
+
+    def stop_worker(self, pid: int) -> None:
+        self.workers.pop(pid, None)
+        self.stopping[pid] = time.monotonic() + self.graceful_timeout
+        try:
+            os.kill(pid, signal.SIGTERM)
+        except ProcessLookupError:
+            self.stopping.pop(pid, None)
+
+    def reap_workers(self) -> None:
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if not pid:
+                return
+            if self.stopping.pop(pid, None) is None and self.workers.pop(pid, None) is not None:
+                logger.warning(f"Worker {pid} exited unexpectedly with status {status}")
+
+    def kill_stragglers(self) -> None:
+        now = time.monotonic()
+        for pid, deadline in list(self.stopping.items()):
+            if now >= deadline:
+                logger.warning(f"Worker {pid} did not stop in {self.graceful_timeout}s, killing it")
+                try:
+                    os.kill(pid, signal.SIGKILL)
+                except ProcessLookupError:
+                    pass
+                self.stopping[pid] = now + self.graceful_timeout
+
+    def read_ready(self, timeout: float) -> list:
+        """Wait up to timeout for readiness messages and return the pids that became ready"""
+        readable, _, _ = select.select([self.ready_r], [], [], timeout)
+        if not readable:
+            return []
+        self.ready_buffer += os.read(self.ready_r, 4096)
+        *lines, self.ready_buffer = self.ready_buffer.split(b"\n")
+        return [int(line) for line in lines if line]
+
+    def wait_ready(self, pid: int) -> bool:
+        deadline = time.monotonic() + self.graceful_timeout
+        while time.monotonic() < deadline:
+            if pid in self.read_ready(0.5):
+                return True
+            self.reap_workers()
+            if pid not in self.workers:
+                return False
+        return False
+
+    def rolling_restart(self) -> None:
+        logger.info("Rolling restart of all workers")
+        for index, old_pid in enumerate(list(self.workers)):
+            if index < self.num_workers:
+                new_pid = self.spawn_worker()
+                if not self.wait_ready(new_pid):
+                    logger.error(f"Replacement worker {new_pid} did not become ready, aborting restart")
+                    return
+            self.stop_worker(old_pid)
+        logger.info("Rolling restart complete")
+
+    def reload(self) -> None:
+        """
+        Re-exec the master on the current code and settings. The workers and
+        the listening socket are inherited; the new master replaces the workers.
+        """
+        check = subprocess.run(
+            [sys.executable, "-c", "import app.main"], capture_output=True, text=True, timeout=60
+        )
+        if check.returncode != 0:
+            logger.error(f"Not reloading, the application fails to import:\n{check.stderr.strip()}")
+            return
+        command = reexec_argv(self.argv, self.sock.fileno(), list(self.workers))
+        logger.info(f"Reloading master {os.getpid()} with {len(self.workers)} workers")
+        for handler in logging.getLogger().handlers:
+            handler.flush()
+        os.execv(command[0], command)
+
+    # Main loop
+
+    def run(self) -> None:
+        self.install_signal_handlers()
+        booting = set()
+        if self.workers:
+            logger.info(f"Master {os.getpid()} reloaded, replacing {len(self.workers)} workers")
+            self.reap_workers()
+            self.rolling_restart()
+        else:
+            logger.info(f"Master {os.getpid()} starting {self.num_workers} workers")
+            for _ in range(self.num_workers):
+                self.spawn_worker()
+            booting = set(self.workers)
+        while self.running:
+            for pid in self.read_ready(0.5):
+                if pid in booting:
+                    booting.discard(pid)
+                    if not booting:
+                        logger.info(f"All workers ready {time.monotonic() - LAUNCHED_AT:.3f}s after launch")
+
+            while self.signals:
+                signum = self.signals.pop(0)
+                if signum == signal.SIGHUP:
+                    self.reload()
+                elif signum in (signal.SIGTERM, signal.SIGINT):
+                    self.running = False
+
+            self.reap_workers()
+            self.kill_stragglers()
+            if self.running:
+                for _ in range(self.num_workers - len(self.workers)):
+                    self.spawn_worker()
+                    time.sleep(0.1)  # Don't spin if workers crash on start
+
+        self.shutdown()
+
+    def shutdown(self) -> None:
+        logger.info("Shutting down workers")
+        for pid in list(self.workers):
+            self.stop_worker(pid)
+        while self.stopping:
+            self.reap_workers()
+            self.kill_stragglers()
+            time.sleep(0.1)
+        self.sock.close()
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Run the File Server API in production")
+    parser.add_argument("--host", default=settings.SERVER_HOST)
+    parser.add_argument("--port", type=int, default=settings.SERVER_PORT)
+    parser.add_argument(
+        "--workers", type=int, default=settings.SERVER_WORKERS or os.cpu_count() or 1,
+        help="number of worker processes (default: one per CPU core)",
+    )
+    parser.add_argument("--backlog", type=int, default=settings.SERVER_BACKLOG)
+    parser.add_argument("--graceful-timeout", type=int, default=settings.SERVER_GRACEFUL_TIMEOUT)
+    parser.add_argument("--log-level", default="info")
+    # Set by the master when it re-executes itself on SIGHUP
+    parser.add_argument("--fd", type=int, help=argparse.SUPPRESS)
+    parser.add_argument(
+        "--adopt", type=lambda value: [int(pid) for pid in value.split(",") if pid], default=[], help=argparse.SUPPRESS
+    )
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> None:
+    argv = sys.argv[1:] if argv is None else argv
+    args = parse_args(argv)
+    logging.basicConfig(level=args.log_level.upper(), format="%(asctime)s %(levelname)s [%(name)s] %(message)s")
+
+    if args.fd is not None:
+        # Reloaded: keep serving on the socket the previous master bound
+        sock = socket.socket(fileno=args.fd)
+    else:
+        sock = bind_socket(args.host, args.port, args.backlog)
+
+    # Import before forking so every worker shares the loaded modules
+    import_started = time.monotonic()
+    from app.main import app
+    logger.info(f"Application imported in {time.monotonic() - import_started:.3f}s")
+    rss, _ = memory_usage()
+    logger.info(f"Master RSS after import {rss:.1f} MiB, listening on {sock.getsockname()}")
+
+    Master(app, sock, args.workers, args.graceful_timeout, args.log_level, argv, args.adopt).run()
+
+
+if __name__ == "__main__":
+    main()
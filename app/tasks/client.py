@@ -0,0 +1,48 @@
+"""
+Queue Celery tasks from the API.
+
+The API only publishes messages, so it sends tasks by name instead of
+importing the task modules, and Celery itself is imported, configured and
+connected to the broker on the first task sent rather than when the app
+is imported.
+"""
+from typing import Any, Dict, List, Optional
+
+PROCESS_UPLOADED_FILE = "app.tasks.file_processing.process_uploaded_file"
+PROCESS_MULTIPLE_FILES = "app.tasks.file_processing.process_multiple_files"
+GENERATE_ARTIFACT = "app.tasks.file_processing.generate_artifact"
+
+_celery_app = None
+
+
+def get_celery_app():
+    global _celery_app
+    if _celery_app is None:
+        from app.core.celery_app import celery_app
+        _celery_app = celery_app
+    return _celery_app
+
+
+def send_task(name: str, args: Optional[List[Any]] = None, task_id: Optional[str] = None):
+    celery_app = get_celery_app()
+    if celery_app.conf.task_always_eager:
+        # send_task ignores eager mode (development and tests), so run the task here
+        celery_app.loader.import_default_modules()
+        return celery_app.tasks[name].apply_async(args=args, task_id=task_id)
+    return celery_app.send_task(name, args=args, task_id=task_id)
+
+
+def dispatch_file_task(file_hash: str, task_id: str):
+    """
+    Queue process_uploaded_file under a task id whose task_statuses row
+    has already been committed, so every state the worker records lands on it.
+    """
+    return send_task(PROCESS_UPLOADED_FILE, args=[file_hash], task_id=task_id)
+
+
+def dispatch_multiple_files(file_hashes: List[str], task_id: str):
+    return send_task(PROCESS_MULTIPLE_FILES, args=[file_hashes], task_id=task_id)
+
+
+def dispatch_artifact(file_hash: str, transform: str, params: Dict[str, Any]):
+    return send_task(GENERATE_ARTIFACT, args=[file_hash, transform, params])
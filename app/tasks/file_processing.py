@@ -1,13 +1,38 @@
 import logging
-from celery.result import AsyncResult
-from typing import List, Dict, Any
+import time
+import uuid
+from typing import Any, BinaryIO, Dict, List, Optional
 from celery import shared_task
 from sqlalchemy.orm import Session
+from app.config import settings
+from app.core import storage
+from app.core.artifacts import artifact_key, artifact_store
+from app.core.chunks import open_chunked, store_chunks
 from app.database import SessionLocal
+from app.crud import chunk as chunk_crud
 from app.crud import file as file_crud
+from app.tasks.status_writer import status_writer
 
 logger = logging.getLogger(__name__)
 
+
+def store_as_chunks(db: Session, file_record) -> Dict[str, int]:
+    """
+    Replace a file's blob with content-defined chunks, writing only the
+    chunks not stored yet, and commit. Returns the chunk and byte counts.
+    """
+    source_path = storage.locate_blob(file_record.file_hash, file_record.file_path)
+    if not source_path:
+        raise FileNotFoundError(f"Content of file {file_record.file_hash} not found")
+    with open(source_path, "rb") as source:
+        chunks, written = store_chunks(db, source)
+    chunk_crud.add_file_chunks(db, file_record.file_hash, chunks)
+    db.commit()
+    # A crash here leaves the blob to the orphan collector, which ignores chunked files
+    storage.remove_blob_copies(file_record.file_hash)
+    return written
+
+
 @shared_task(bind=True)
 def process_uploaded_file(self, file_hash: str) -> dict:
     logger.info(f"Task started for file_hash: {file_hash}")
@@ -17,90 +42,87 @@ def process_uploaded_file(self, file_hash: str) -> dict:
         file_record = file_crud.get(db, file_hash)
         if not file_record:
             logger.error(f"File with hash {file_hash} not found")
-            file_crud.update_task_status(db, self.request.id, "failed")
-            db.commit()
             return {"status": "error", "file_hash": file_hash, "error": "File not found"}
 
-        # Update file status to "processing"
-        file_crud.update(
-            db,
-            db_obj=file_record,
-            obj_in={"status": "processing"}
-        )
-        db.commit()
+        # Status updates are buffered and written in bulk with other tasks'.
+        # The task's own state is recorded by the handlers in app.tasks.lifecycle.
+        status_writer.set_file_status(file_hash, "processing")
 
         # Simulate file processing
         logger.info(f"Processing file with hash: {file_hash}")
         # Add your file processing logic here...
 
-        # Update file status to "processed"
-        file_crud.update(
-            db,
-            db_obj=file_record,
-            obj_in={"status": "processed"}
-        )
-        db.commit()
+        if settings.STORAGE_MODE == "chunked" and not file_record.is_chunked:
+            # Deduplication only saves space: if it fails the file stays a whole blob
+            try:
+                started = time.monotonic()
+                written = store_as_chunks(db, file_record)
+                logger.info(
+                    f"Stored {file_hash} as {written['chunks']} chunks in {time.monotonic() - started:.2f}s, "
+                    f"{written['new_chunks']} new ({written['new_bytes']} of {file_record.size} bytes written)"
+                )
+            except Exception as e:
+                db.rollback()
+                logger.error(f"Error storing file {file_hash} as chunks: {str(e)}")
+                # The upload wrote a single copy for chunking; replicate it instead
+                nodes = storage.blob_nodes(file_hash)
+                if nodes:
+                    storage.under_replicated(file_hash, nodes)
 
-        # Update task status to "completed"
-        file_crud.update_task_status(db, self.request.id, "completed")
-        db.commit()
+        # Update file status to "processed"
+        status_writer.set_file_status(file_hash, "processed")
 
         logger.info(f"Task completed for file_hash: {file_hash}")
         return {"status": "success", "file_hash": file_hash}
     except Exception as e:
         logger.error(f"Error processing file {file_hash}: {str(e)}")
-        file_crud.update_task_status(db, self.request.id, "failed")
-        db.commit()
+        status_writer.set_file_status(file_hash, "failed")
         return {"status": "error", "file_hash": file_hash, "error": str(e)}
     finally:
         db.close()
 
 @shared_task(bind=True)
-def process_multiple_files(self, file_hashes: List[str]) -> List[dict]:
+def process_multiple_files(self, file_hashes: List[str]) -> dict:
     """
     Process multiple uploaded files.
 
-    This is a Celery task that runs in the background.
+    This is a Celery task that runs in the background. It fans out one
+    process_uploaded_file task per file; their progress is tracked in
+    task_statuses under the task ids returned here.
     """
     logger.info(f"Starting to process multiple files: {file_hashes}")
     db = SessionLocal()
     results = []
 
     try:
-        # Save the parent task in the database
-        logger.info(f"Saving parent task info for task_id: {self.request.id}")
-        file_crud.create_task_status(db, {"task_id": self.request.id, "status": "pending"})
+        # Mark every known file as "processing" with one UPDATE. This is
+        # written directly rather than buffered so it cannot land after the
+        # status written by the per-file task in another process.
+        known_hashes = file_crud.set_status_many(db, file_hashes, "processing")
+
+        # Create the child task rows up front, in one commit. They belong to
+        # whoever started this task, so its owner can look them up.
+        parent = file_crud.get_task_status(db, self.request.id)
+        user_id = parent.user_id if parent else None
+        child_task_ids = {file_hash: str(uuid.uuid4()) for file_hash in file_hashes if file_hash in known_hashes}
+        for task_id in child_task_ids.values():
+            file_crud.create_task_status(db, {"task_id": task_id, "user_id": user_id, "status": "pending"})
         db.commit()
 
         # Dispatch individual tasks for each file
-        tasks = []
         for file_hash in file_hashes:
-            try:
-                # Get the file record
-                file_record = file_crud.get(db, file_hash)
-                if not file_record:
-                    logger.error(f"File with hash {file_hash} not found")
-                    results.append({
-                        "status": "error",
-                        "file_hash": file_hash,
-                        "error": "File not found"
-                    })
-                    continue
-
-                # Update file status to "processing"
-                logger.info(f"Updating file status to 'processing' for file_hash: {file_hash}")
-                file_crud.update(
-                    db,
-                    db_obj=file_record,
-                    obj_in={"status": "processing"}
-                )
-                db.commit()
+            if file_hash not in known_hashes:
+                logger.error(f"File with hash {file_hash} not found")
+                results.append({
+                    "status": "error",
+                    "file_hash": file_hash,
+                    "error": "File not found"
+                })
+                continue
 
-                # Dispatch the task for this file
+            try:
                 logger.info(f"Dispatching task for file_hash: {file_hash}")
-                task = process_uploaded_file.delay(file_hash)
-                tasks.append((task, file_hash))
-
+                task = process_uploaded_file.apply_async(args=[file_hash], task_id=child_task_ids[file_hash])
                 results.append({
                     "file_hash": file_hash,
                     "task_id": task.id,
@@ -108,63 +130,68 @@ def process_multiple_files(self, file_hashes: List[str]) -> List[dict]:
                 })
             except Exception as e:
                 logger.error(f"Error in processing file {file_hash}: {str(e)}")
+                status_writer.set_file_status(file_hash, "failed")
+                status_writer.set_task_status(child_task_ids[file_hash], "failed", result={"error": str(e)})
                 results.append({
                     "status": "error",
                     "file_hash": file_hash,
                     "error": str(e)
                 })
+    finally:
+        db.close()
 
-        # Wait for all tasks to complete and update statuses
-        for task, file_hash in tasks:
-            try:
-                logger.info(f"Checking status for task_id: {task.id}")
-                task_result = AsyncResult(task.id)
-
-                # Update file statuses based on the task result
-                if task_result.state == "SUCCESS":
-                    logger.info(f"Task {task.id} completed successfully for file_hash: {file_hash}")
-                    file_record = file_crud.get(db, file_hash)
-                    if file_record:
-                        file_crud.update(
-                            db,
-                            db_obj=file_record,
-                            obj_in={"status": "processed"}
-                        )
-                    db.commit()
-                elif task_result.state == "FAILURE":
-                    logger.info(f"Task {task.id} failed for file_hash: {file_hash}")
-                    file_record = file_crud.get(db, file_hash)
-                    if file_record:
-                        file_crud.update(
-                            db,
-                            db_obj=file_record,
-                            obj_in={"status": "failed"}
-                        )
-                    db.commit()
-                else:
-                    logger.info(f"Task {task.id} is still in state: {task_result.state}")
-            except Exception as e:
-                logger.error(f"Error checking status for task {task.id}: {str(e)}")
-                file_record = file_crud.get(db, file_hash)
-                if file_record:
-                    file_crud.update(
-                        db,
-                        db_obj=file_record,
-                        obj_in={"status": "failed"}
-                    )
-                db.commit()
-
-        # Update the status of the parent task (process_multiple_files)
-        logger.info(f"Updating parent task status to 'completed' for task_id: {self.request.id}")
-        file_crud.update_task_status(db, self.request.id, "completed")
-        db.commit()
+    return {"status": "success", "files": results}
+
+
+def open_content(db: Session, file_record) -> Optional[BinaryIO]:
+    """Open a file's content, whether stored whole or as chunks, or return None if it is missing"""
+    if not file_record.is_chunked:
+        file_path = storage.locate_blob(file_record.file_hash, file_record.file_path)
+        if file_path:
+            return open(file_path, "rb")
+        # The blob goes away once the file has been chunked
+        db.refresh(file_record)
+        if not file_record.is_chunked:
+            return None
+    return open_chunked(chunk_crud.get_file_chunks(db, file_record.file_hash))
+
+
+@shared_task(bind=True)
+def generate_artifact(self, file_hash: str, transform: str, params: Dict[str, int]) -> dict:
+    """
+    Build a derived artifact of an uploaded file.
 
+    Queued by the API for the first request of an artifact, which holds the
+    artifact's lock until this task releases it.
+    """
+    key = artifact_key(file_hash, transform, params)
+    db = SessionLocal()
+    try:
+        if artifact_store.get(key, transform):
+            return {"status": "success", "file_hash": file_hash, "transform": transform}
+
+        file_record = file_crud.get(db, file_hash)
+        if not file_record:
+            logger.error(f"File with hash {file_hash} not found")
+            artifact_store.record_error(key, "File not found")
+            return {"status": "error", "file_hash": file_hash, "error": "File not found"}
+
+        source = open_content(db, file_record)
+        if source is None:
+            logger.error(f"Content of file {file_hash} not found")
+            artifact_store.record_error(key, "File content not found")
+            return {"status": "error", "file_hash": file_hash, "error": "File content not found"}
+
+        started = time.monotonic()
+        with source:
+            artifact_store.generate(key, transform, source, params)
+        artifact_store.clear_error(key)
+        logger.info(f"Generated {transform} of {file_hash} in {time.monotonic() - started:.3f}s")
+        return {"status": "success", "file_hash": file_hash, "transform": transform}
     except Exception as e:
-        logger.error(f"Error in processing multiple files: {str(e)}")
-        logger.info(f"Updating parent task status to 'failed' for task_id: {self.request.id}")
-        file_crud.update_task_status(db, self.request.id, "failed")
-        db.rollback()
+        logger.error(f"Error generating {transform} of {file_hash}: {str(e)}")
+        artifact_store.record_error(key, str(e))
+        return {"status": "error", "file_hash": file_hash, "error": str(e)}
     finally:
+        artifact_store.release(key)
         db.close()
-
-    return results
\ No newline at end of file
@@ -0,0 +1,97 @@
+import logging
+import time
+from datetime import datetime
+from typing import Any, Dict, Optional
+from celery.signals import (
+    task_failure,
+    task_postrun,
+    task_prerun,
+    task_retry,
+    worker_process_init,
+    worker_process_shutdown,
+    worker_shutdown,
+)
+from app import database
+from app.tasks.status_writer import status_writer
+
+logger = logging.getLogger(__name__)
+
+# Monotonic start time of the tasks running in this process, for runtimes
+_started: Dict[str, float] = {}
+
+
+@worker_process_init.connect
+def init_worker_process(**kwargs) -> None:
+    """
+    Build this pool process's own engine after fork.
+
+    The engine in app.database is created when the worker imports its tasks,
+    before the prefork pool forks, so its pool must not be shared.
+    """
+    database.rebind_engine()
+    logger.info("Worker process database engine initialized")
+
+
+@worker_process_shutdown.connect
+def shutdown_worker_process(**kwargs) -> None:
+    status_writer.stop()
+    database.engine.dispose()
+
+
+@worker_shutdown.connect
+def shutdown_worker(**kwargs) -> None:
+    # Covers the solo and thread pools, which never start pool processes
+    status_writer.stop()
+
+
+# Task lifecycle: task_statuses is the only record of task state (there is
+# no result backend), so every transition is written here. The writes are
+# buffered and flushed in batches. A pool process killed while running a
+# task does not ack it, because of task_acks_late and
+# task_reject_on_worker_lost, so the task runs again on another process and
+# rewrites its states. The writes are plain UPDATEs by task id, so doing
+# them twice is harmless. Only a process killed in the
+# STATUS_FLUSH_INTERVAL_SECONDS after a task has returned loses that task's
+# final state. A graceful shutdown flushes first.
+
+def _runtime(task_id: str) -> Optional[float]:
+    started = _started.pop(task_id, None)
+    return round(time.monotonic() - started, 6) if started is not None else None
+
+
+def _as_result(retval: Any) -> dict:
+    # A copy, so adding the runtime does not change the dict the task returned
+    return dict(retval) if isinstance(retval, dict) else {"value": retval}
+
+
+@task_prerun.connect
+def record_task_started(task_id: str = None, **kwargs) -> None:
+    _started[task_id] = time.monotonic()
+    status_writer.set_task_status(task_id, "started", started_at=datetime.now())
+
+
+@task_postrun.connect
+def record_task_finished(task_id: str = None, retval: Any = None, state: str = None, **kwargs) -> None:
+    # Failures and retries are recorded by their own signals, which run first
+    if state == "SUCCESS":
+        result = _as_result(retval)
+        result["runtime"] = _runtime(task_id)
+        # Tasks report handled errors by returning {"status": "error", ...}
+        status = "failed" if result.get("status") == "error" else "completed"
+        status_writer.set_task_status(task_id, status, result=result, finished_at=datetime.now())
+
+
+@task_failure.connect
+def record_task_failed(task_id: str = None, exception: BaseException = None, **kwargs) -> None:
+    result = {
+        "error": str(exception),
+        "exception": type(exception).__name__,
+        "runtime": _runtime(task_id),
+    }
+    status_writer.set_task_status(task_id, "failed", result=result, finished_at=datetime.now())
+
+
+@task_retry.connect
+def record_task_retry(request=None, reason: Any = None, **kwargs) -> None:
+    result = {"retry_reason": str(reason), "retries": request.retries, "runtime": _runtime(request.id)}
+    status_writer.set_task_status(request.id, "retrying", result=result)
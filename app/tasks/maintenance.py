@@ -0,0 +1,326 @@
+import logging
+import time
+from datetime import datetime, timedelta
+from typing import Iterable, Iterator
+from celery import shared_task
+from app.config import settings
+from app.core import storage
+from app.core.artifacts import artifact_store
+from app.crud import chunk as chunk_crud
+from app.crud import file as file_crud
+from app.crud import token as token_crud
+from app.database import SessionLocal
+from app.models.file import FileNameTrigram
+
+logger = logging.getLogger(__name__)
+
+
+def merge_orphans(stored: Iterable[str], known: Iterable[str]) -> Iterator[str]:
+    """
+    Walk two ascending streams of file hashes in lockstep and yield the
+    stored names that have no matching database row.
+    """
+    known_iter = iter(known)
+    current = next(known_iter, None)
+    for name in stored:
+        while current is not None and current < name:
+            current = next(known_iter, None)
+        if current == name:
+            current = next(known_iter, None)
+        else:
+            yield name
+
+
+@shared_task(bind=True)
+def purge_deleted_files(self) -> dict:
+    """
+    Permanently remove files that have been in the trash longer than the retention period.
+    """
+    cutoff = datetime.now() - timedelta(days=settings.TRASH_RETENTION_DAYS)
+    batch_size = settings.TRASH_PURGE_BATCH_SIZE
+    logger.info(f"Purging files deleted before {cutoff.isoformat()}")
+    db = SessionLocal()
+    purged = 0
+    try:
+        while True:
+            batch = file_crud.get_expired_trash(db, cutoff, limit=batch_size)
+            if not batch:
+                break
+            file_hashes = [file_record.file_hash for file_record in batch]
+            file_crud.purge(db, file_hashes)
+            db.commit()
+            # Rows go first: a crash between the two steps leaves an orphan
+            # blob for the collector rather than a row pointing at nothing.
+            for file_hash in file_hashes:
+                storage.remove_blob_copies(file_hash)
+            purged += len(batch)
+            if len(batch) < batch_size:
+                break
+    except Exception as e:
+        logger.error(f"Error purging deleted files: {str(e)}")
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+    logger.info(f"Purged {purged} deleted files")
+    return {"status": "success", "purged": purged}
+
+
+@shared_task(bind=True)
+def collect_orphan_blobs(self) -> dict:
+    """
+    Reconcile the storage nodes against the file_uploads and chunks tables
+    and delete blobs and chunks nobody references.
+    """
+    older_than = time.time() - settings.ORPHAN_GC_GRACE_SECONDS
+    db = SessionLocal()
+    removed = removed_chunks = 0
+    try:
+        # Files stored as chunks have no blob; any left over is an orphan
+        stored = storage.iter_blob_names(older_than=older_than)
+        known = file_crud.iter_file_hashes(db, chunked=False)
+        for file_hash in merge_orphans(stored, known):
+            if storage.remove_blob_copies(file_hash):
+                removed += 1
+
+        # Left behind when a chunking task failed between writing and committing
+        stored = storage.iter_chunk_names(older_than=older_than)
+        known = chunk_crud.iter_chunk_digests(db)
+        for digest in merge_orphans(stored, known):
+            if storage.remove_chunk_copies(digest, older_than=older_than):
+                removed_chunks += 1
+    finally:
+        db.close()
+
+    logger.info(f"Removed {removed} orphan blobs and {removed_chunks} orphan chunks")
+    return {"status": "success", "removed": removed, "removed_chunks": removed_chunks}
+
+
+@shared_task(bind=True)
+def collect_unused_chunks(self) -> dict:
+    """
+    Delete chunks that no file references any more.
+    """
+    batch_size = settings.TRASH_PURGE_BATCH_SIZE
+    db = SessionLocal()
+    collected = 0
+    try:
+        while True:
+            # The rows stay locked until commit, so no upload can take a new
+            # reference to a chunk while its copies are being removed
+            digests = chunk_crud.get_unused_chunks(db, limit=batch_size)
+            if not digests:
+                break
+            for digest in digests:
+                storage.remove_chunk_copies(digest)
+            collected += chunk_crud.delete_chunks(db, digests)
+            db.commit()
+            if len(digests) < batch_size:
+                break
+    except Exception as e:
+        logger.error(f"Error collecting unused chunks: {str(e)}")
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+    logger.info(f"Collected {collected} unused chunks")
+    return {"status": "success", "collected": collected}
+
+
+@shared_task(bind=True)
+def rebalance_blobs(self) -> dict:
+    """
+    Move blobs to the storage nodes the hash ring places them on.
+
+    Only nodes not yet balanced for the current ring are scanned, so this
+    is a no-op until STORAGE_NODES, STORAGE_REPLICAS or
+    STORAGE_DRAINING_NODES change, or a write missed some replicas, or
+    the blob layout on disk changes (storage.BLOB_LAYOUT).
+    """
+    older_than = time.time() - settings.STORAGE_REBALANCE_GRACE_SECONDS
+    totals = {"copied": 0, "moved": 0, "removed": 0, "skipped": 0, "failed": 0}
+    for node in storage.storage_nodes():
+        if storage.is_balanced(node):
+            continue
+        started = time.monotonic()
+        counts = storage.rebalance_node(node, older_than)
+        logger.info(
+            f"Rebalanced {node} in {time.monotonic() - started:.1f}s: {counts['copied']} copied, "
+            f"{counts['moved']} moved, {counts['removed']} removed, {counts['skipped']} skipped, {counts['failed']} failed"
+        )
+        for name, count in counts.items():
+            totals[name] += count
+
+    return {"status": "success", **totals}
+
+
+@shared_task(bind=True)
+def purge_idempotency_keys(self) -> dict:
+    """
+    Delete idempotency keys that are past the replay window.
+    """
+    cutoff = datetime.now() - timedelta(seconds=settings.IDEMPOTENCY_WINDOW_SECONDS)
+    batch_size = settings.TRASH_PURGE_BATCH_SIZE
+    db = SessionLocal()
+    purged = 0
+    try:
+        while True:
+            deleted = file_crud.delete_expired_idempotency_keys(db, cutoff, limit=batch_size)
+            db.commit()
+            purged += deleted
+            if deleted < batch_size:
+                break
+    except Exception as e:
+        logger.error(f"Error purging idempotency keys: {str(e)}")
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+    logger.info(f"Purged {purged} expired idempotency keys")
+    return {"status": "success", "purged": purged}
+
+
+@shared_task(bind=True)
+def purge_revoked_tokens(self) -> dict:
+    """
+    Delete revocations of tokens that have expired anyway.
+    """
+    now = datetime.utcnow()  # Token expiry times are UTC
+    batch_size = settings.TRASH_PURGE_BATCH_SIZE
+    db = SessionLocal()
+    purged = 0
+    try:
+        while True:
+            deleted = token_crud.delete_expired(db, now, limit=batch_size)
+            db.commit()
+            purged += deleted
+            if deleted < batch_size:
+                break
+    except Exception as e:
+        logger.error(f"Error purging revoked tokens: {str(e)}")
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+    logger.info(f"Purged {purged} expired token revocations")
+    return {"status": "success", "purged": purged}
+
+
+@shared_task(bind=True)
+def purge_file_changes(self) -> dict:
+    """
+    Delete change feed entries older than the retention period.
+    """
+    cutoff = datetime.now() - timedelta(days=settings.CHANGE_FEED_RETENTION_DAYS)
+    batch_size = settings.TRASH_PURGE_BATCH_SIZE
+    db = SessionLocal()
+    purged = 0
+    try:
+        while True:
+            deleted = file_crud.delete_old_changes(db, cutoff, limit=batch_size)
+            db.commit()
+            purged += deleted
+            if deleted < batch_size:
+                break
+    except Exception as e:
+        logger.error(f"Error purging file changes: {str(e)}")
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+    logger.info(f"Purged {purged} file changes")
+    return {"status": "success", "purged": purged}
+
+
+@shared_task(bind=True)
+def rebuild_search_index(self) -> dict:
+    """
+    Rebuild the file_name_trigrams search index from file_uploads.
+
+    Run it after the migration that adds the table, or after switching
+    SEARCH_BACKEND to "trigram"; searches miss files until it finishes.
+    Nothing to do for the FULLTEXT backend.
+    """
+    db = SessionLocal()
+    reader = SessionLocal()
+    indexed = 0
+    try:
+        if file_crud.search_backend(db) != "trigram":
+            return {"status": "success", "indexed": 0}
+        db.query(FileNameTrigram).delete(synchronize_session=False)
+        db.commit()
+        batch = []
+        for row in file_crud.iter_file_names(reader):
+            batch.append(row)
+            if len(batch) >= settings.TRASH_PURGE_BATCH_SIZE:
+                file_crud.index_file_names(db, batch)
+                db.commit()
+                indexed += len(batch)
+                batch = []
+        file_crud.index_file_names(db, batch)
+        db.commit()
+        indexed += len(batch)
+    except Exception as e:
+        logger.error(f"Error rebuilding search index: {str(e)}")
+        db.rollback()
+        raise
+    finally:
+        reader.close()
+        db.close()
+
+    logger.info(f"Indexed {indexed} file names")
+    return {"status": "success", "indexed": indexed}
+
+
+@shared_task(bind=True)
+def evict_artifacts(self) -> dict:
+    """
+    Evict the least recently used derived artifacts beyond ARTIFACT_CACHE_MAX_BYTES.
+    """
+    removed, remaining = artifact_store.evict()
+    logger.info(f"Evicted {removed} artifacts, {remaining} bytes remain")
+    return {"status": "success", "removed": removed, "bytes": remaining}
+
+
+@shared_task(bind=True)
+def purge_task_statuses(self) -> dict:
+    """
+    Delete finished task statuses past the retention window, and any task
+    status past the maximum age. On MySQL the latter drops whole monthly
+    partitions, and partitions for the coming months are created here too.
+    """
+    now = datetime.now()
+    retention_cutoff = now - timedelta(days=settings.TASK_STATUS_RETENTION_DAYS)
+    max_age_cutoff = now - timedelta(days=settings.TASK_STATUS_MAX_AGE_DAYS)
+    batch_size = settings.TRASH_PURGE_BATCH_SIZE
+    db = SessionLocal()
+    purged = 0
+    try:
+        added, dropped = file_crud.maintain_task_status_partitions(
+            db, now, settings.TASK_STATUS_PARTITIONS_AHEAD, drop_before=max_age_cutoff
+        )
+        # Batches keep each transaction and its locks short
+        for cutoff, statuses in (
+            (max_age_cutoff, None),
+            (retention_cutoff, file_crud.TERMINAL_TASK_STATUSES),
+        ):
+            while True:
+                deleted = file_crud.delete_old_task_statuses(db, cutoff, statuses, limit=batch_size)
+                db.commit()
+                purged += deleted
+                if deleted < batch_size:
+                    break
+    except Exception as e:
+        logger.error(f"Error purging task statuses: {str(e)}")
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+    logger.info(f"Purged {purged} task statuses, added {added} and dropped {dropped} partitions")
+    return {"status": "success", "purged": purged, "partitions_added": added, "partitions_dropped": dropped}
@@ -0,0 +1,223 @@
+import logging
+import os
+import threading
+from collections import defaultdict
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import bindparam, update
+from sqlalchemy.exc import OperationalError
+
+from app.config import settings
+from app.crud import file as file_crud
+from app.database import SessionLocal
+from app.models.file import TaskStatus
+
+logger = logging.getLogger(__name__)
+
+# Keep IN lists and executemany batches to a size every database accepts
+WRITE_BATCH_SIZE = 1000
+
+
+def chunked(items: List[Any], size: int = WRITE_BATCH_SIZE):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+class StatusWriter:
+    """
+    Buffer file and task status updates and write them in bulk.
+
+    Tasks running concurrently in a worker process record statuses here
+    instead of issuing their own UPDATEs. A background thread flushes the
+    latest status per file and per task every STATUS_FLUSH_INTERVAL_SECONDS,
+    so intermediate states that are superseded before a flush are never
+    written at all, and file updates become one UPDATE (plus the change log
+    and usage counter writes) per distinct status.
+
+    When a flush fails, its updates are written one at a time so that a bad
+    update cannot hold back the others, and an update that still fails is
+    kept for the next flush. After max_attempts failed writes it is dropped
+    with an error. While flushes fail, the thread backs off up to
+    max_backoff seconds between them.
+    """
+
+    def __init__(self, interval: float, max_pending: int, max_attempts: int, max_backoff: float):
+        self.interval = interval
+        self.max_pending = max_pending
+        self.max_attempts = max_attempts
+        self.max_backoff = max_backoff
+        self._lock = threading.Lock()
+        # Held for a whole flush, so flushes from task threads and the flush
+        # thread write in the order they took their updates
+        self._flush_lock = threading.Lock()
+        self._attempts: Dict[Tuple[str, str], int] = {}
+        self._failed_flushes = 0
+        self._wakeup = threading.Event()
+        self._files: Dict[str, str] = {}
+        self._tasks: Dict[str, Dict[str, Any]] = {}
+        self._thread: Optional[threading.Thread] = None
+        self._pid: Optional[int] = None
+        self._stopping = False
+
+    def set_file_status(self, file_hash: str, status: str) -> None:
+        with self._lock:
+            self._files[file_hash] = status
+        self._after_write()
+
+    def set_task_status(
+        self,
+        task_id: str,
+        status: str,
+        result: Optional[dict] = None,
+        started_at: Optional[datetime] = None,
+        finished_at: Optional[datetime] = None,
+    ) -> None:
+        values: Dict[str, Any] = {"status": status}
+        for column, value in (("result", result), ("started_at", started_at), ("finished_at", finished_at)):
+            if value is not None:
+                values[column] = value
+        with self._lock:
+            self._tasks.setdefault(task_id, {}).update(values)
+        self._after_write()
+
+    def _after_write(self) -> None:
+        self._ensure_started()
+        if len(self._files) + len(self._tasks) >= self.max_pending:
+            self._wakeup.set()
+
+    def _ensure_started(self) -> None:
+        # A thread does not survive fork, so each worker process starts its own
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is not None and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._stopping = False
+            self._thread = threading.Thread(target=self._run, name="status-writer", daemon=True)
+            self._thread.start()
+
+    def _run(self) -> None:
+        while not self._stopping:
+            self._wakeup.wait(min(self.interval * 2 ** self._failed_flushes, self.max_backoff))
+            self._wakeup.clear()
+            self.flush()
+
+    def stop(self) -> None:
+        """Stop the flush thread and write whatever is still buffered"""
+        if self._thread is not None and self._pid == os.getpid():
+            self._stopping = True
+            self._wakeup.set()
+            self._thread.join(timeout=max(5.0, self.interval * 2))
+            self._thread = None
+        self.flush()
+
+    def flush(self) -> int:
+        """Write the buffered updates and return how many were written"""
+        with self._flush_lock:
+            with self._lock:
+                files, self._files = self._files, {}
+                tasks, self._tasks = self._tasks, {}
+            if not files and not tasks:
+                return 0
+            try:
+                self._write(files, tasks)
+            except Exception as e:
+                logger.error(f"Error writing {len(files)} file and {len(tasks)} task status updates: {str(e)}")
+                return self._write_each(files, tasks)
+            self._failed_flushes = 0
+            for file_hash in files:
+                self._attempts.pop(("file", file_hash), None)
+            for task_id in tasks:
+                self._attempts.pop(("task", task_id), None)
+            return len(files) + len(tasks)
+
+    def _write(self, files: Dict[str, str], tasks: Dict[str, Dict[str, Any]]) -> None:
+        db = SessionLocal()
+        try:
+            self._write_files(db, files)
+            self._write_tasks(db, tasks)
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    def _write_each(self, files: Dict[str, str], tasks: Dict[str, Dict[str, Any]]) -> int:
+        """Write updates in their own transactions and requeue those that fail"""
+        updates = [("file", key, value) for key, value in files.items()]
+        updates += [("task", key, value) for key, value in tasks.items()]
+        failed: List[Tuple[str, str, Any]] = []
+        for index, (kind, key, value) in enumerate(updates):
+            try:
+                self._write({key: value} if kind == "file" else {}, {key: value} if kind == "task" else {})
+                self._attempts.pop((kind, key), None)
+            except OperationalError as e:
+                # The database is unavailable, not this update at fault: keep the rest for later
+                logger.error(f"Database unavailable for status updates: {str(e)}")
+                failed.extend(updates[index:])
+                break
+            except Exception as e:
+                logger.error(f"Error writing status update for {kind} {key}: {str(e)}")
+                failed.append((kind, key, value))
+        # Back off only while there are updates left to retry
+        self._failed_flushes = self._failed_flushes + 1 if self._requeue(failed) else 0
+        return len(updates) - len(failed)
+
+    def _requeue(self, failed: List[Tuple[str, str, Any]]) -> int:
+        """Put failed updates back for the next flush and return how many were kept"""
+        kept = 0
+        # Updates recorded since the swap are newer and take precedence
+        with self._lock:
+            for kind, key, value in failed:
+                attempts = self._attempts.get((kind, key), 0) + 1
+                if attempts >= self.max_attempts:
+                    self._attempts.pop((kind, key), None)
+                    logger.error(f"Dropping status update {value} for {kind} {key} after {attempts} failed writes")
+                    continue
+                self._attempts[(kind, key)] = attempts
+                if kind == "file":
+                    self._files.setdefault(key, value)
+                else:
+                    self._tasks[key] = {**value, **self._tasks.get(key, {})}
+                kept += 1
+        return kept
+
+    def _write_files(self, db, files: Dict[str, str]) -> None:
+        by_status: Dict[str, List[str]] = defaultdict(list)
+        for file_hash, status in files.items():
+            by_status[status].append(file_hash)
+        now = datetime.now()
+        for status, file_hashes in by_status.items():
+            for batch in chunked(file_hashes):
+                file_crud.set_status(db, batch, status, now)
+
+    def _write_tasks(self, db, tasks: Dict[str, Dict[str, Any]]) -> None:
+        # executemany needs the same columns in every row, so group by the columns set
+        by_columns: Dict[tuple, List[Dict[str, Any]]] = defaultdict(list)
+        now = datetime.now()
+        for task_id, values in tasks.items():
+            columns = tuple(sorted(values))
+            row = {f"b_{column}": value for column, value in values.items()}
+            row["b_task_id"] = task_id
+            row["b_updated_at"] = now
+            by_columns[columns].append(row)
+
+        table = TaskStatus.__table__
+        for columns, rows in by_columns.items():
+            statement = update(table).where(table.c.task_id == bindparam("b_task_id")).values(
+                updated_at=bindparam("b_updated_at"),
+                **{column: bindparam(f"b_{column}") for column in columns},
+            )
+            for batch in chunked(rows):
+                db.execute(statement, batch)
+
+
+status_writer = StatusWriter(
+    interval=settings.STATUS_FLUSH_INTERVAL_SECONDS,
+    max_pending=settings.STATUS_FLUSH_MAX_PENDING,
+    max_attempts=settings.STATUS_FLUSH_MAX_ATTEMPTS,
+    max_backoff=settings.STATUS_FLUSH_MAX_BACKOFF_SECONDS,
+)
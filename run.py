@@ -1,10 +1,8 @@
 import uvicorn
-from app.database import init_db
 
 if __name__ == "__main__":
-    # Initialize database tables if they don't exist
-    init_db()
-    # Run the FastAPI application
+    # Development server with auto-reload. Apply migrations with
+    # `alembic upgrade head` first; use `python -m app.server` in production.
     uvicorn.run(
         "app.main:app",
         host="0.0.0.0",
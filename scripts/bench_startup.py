@@ -0,0 +1,161 @@
+"""
+Startup benchmark and import-time budget.
+
+Measures, each in fresh processes:
+
+    import      time to import app.main, median of --runs interpreters
+    api         time from launch until `python -m app.server` answers GET /
+    worker      time from launch until a Celery worker reports it is ready
+                (needs the broker in RABBITMQ_URL)
+
+and exits with status 1 when importing app.main takes longer than
+--import-budget seconds or imports a module the API should only load on
+first use (Celery and its broker libraries, Pillow).
+
+    python scripts/bench_startup.py
+    python scripts/bench_startup.py --runs 10 --import-budget 0.8 --skip-worker
+
+Run it with the environment (DATABASE_URL, RABBITMQ_URL, ...) of the
+deployment being measured.
+"""
+import argparse
+import json
+import os
+import select
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Top-level packages that importing the API must not load
+LAZY_MODULES = ("celery", "kombu", "amqp", "billiard", "PIL")
+
+# Seconds allowed to import app.main, by default. The target is one second;
+# FastAPI alone takes about half of that, see the README.
+IMPORT_BUDGET = 1.5
+
+IMPORT_SCRIPT = """
+import json, sys, time
+started = time.perf_counter()
+import app.main
+elapsed = time.perf_counter() - started
+print(json.dumps({"seconds": elapsed, "modules": sorted({name.split(".")[0] for name in sys.modules})}))
+"""
+
+
+def measure_import(runs: int):
+    timings, modules = [], set()
+    for _ in range(runs):
+        output = subprocess.run(
+            [sys.executable, "-c", IMPORT_SCRIPT], cwd=ROOT, check=True, capture_output=True, text=True
+        ).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        timings.append(result["seconds"])
+        modules.update(result["modules"])
+    return statistics.median(timings), max(timings), sorted(modules.intersection(LAZY_MODULES))
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def stop(process: subprocess.Popen) -> None:
+    process.terminate()
+    try:
+        process.wait(timeout=10)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+
+
+def measure_api(timeout: float):
+    """Seconds from launching the production server until it answers a request"""
+    port = free_port()
+    started = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "app.server", "--host", "127.0.0.1", "--port", str(port),
+         "--workers", "1", "--log-level", "warning"],
+        cwd=ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        while time.perf_counter() - started < timeout:
+            if process.poll() is not None:
+                return None
+            try:
+                with urllib.request.urlopen(f"http://127.0.0.1:{port}/", timeout=1) as response:
+                    if response.status == 200:
+                        return time.perf_counter() - started
+            except OSError:
+                time.sleep(0.005)
+        return None
+    finally:
+        stop(process)
+
+
+def measure_worker(timeout: float):
+    """Seconds from launching a Celery worker until it logs that it is ready"""
+    started = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "celery", "-A", "app.core.celery_app.celery_app", "worker",
+         "--pool=solo", "--loglevel=info", "--without-heartbeat", "--without-gossip", "--without-mingle"],
+        cwd=ROOT, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+    )
+    try:
+        buffered = b""
+        while time.perf_counter() - started < timeout:
+            readable, _, _ = select.select([process.stdout], [], [], 0.1)
+            if not readable:
+                continue
+            chunk = os.read(process.stdout.fileno(), 65536)
+            if not chunk:
+                return None
+            buffered += chunk
+            if b" ready." in buffered:
+                return time.perf_counter() - started
+        return None
+    finally:
+        stop(process)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Measure API and worker startup time")
+    parser.add_argument("--runs", type=int, default=5, help="interpreters to time the import in")
+    parser.add_argument("--import-budget", type=float, default=IMPORT_BUDGET, help="seconds allowed to import app.main")
+    parser.add_argument("--timeout", type=float, default=30.0, help="seconds to wait for a server or worker")
+    parser.add_argument("--skip-api", action="store_true")
+    parser.add_argument("--skip-worker", action="store_true")
+    args = parser.parse_args(argv)
+
+    failed = False
+    median, slowest, eager = measure_import(args.runs)
+    print(f"import app.main      {median:.3f}s median, {slowest:.3f}s slowest of {args.runs} (budget {args.import_budget:.3f}s)")
+    if median > args.import_budget:
+        print("  over budget")
+        failed = True
+    if eager:
+        print(f"  imports {', '.join(eager)}, which must only be loaded on first use")
+        failed = True
+
+    if not args.skip_api:
+        seconds = measure_api(args.timeout)
+        print(f"api first request    {seconds:.3f}s" if seconds is not None else "api first request    failed to start")
+        failed = failed or seconds is None
+
+    if not args.skip_worker:
+        seconds = measure_worker(args.timeout)
+        print(
+            f"worker ready         {seconds:.3f}s" if seconds is not None
+            else f"worker ready         not ready within {args.timeout:.0f}s (is the broker reachable?)"
+        )
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
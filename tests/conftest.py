@@ -0,0 +1,74 @@
+import os
+import tempfile
+
+# Settings are read once, when app.config is first imported, so the test
+# environment has to be in place before anything from app is. SQLite keeps
+# the suite independent of a MySQL server and its driver.
+TEST_DIR = tempfile.mkdtemp(prefix="fileserver-tests-")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(TEST_DIR, 'test.db')}"
+os.environ["UPLOAD_DIR"] = os.path.join(TEST_DIR, "uploads")
+os.environ["ARTIFACT_DIR"] = os.path.join(TEST_DIR, "artifacts")
+os.environ["STORAGE_NODES"] = "[]"
+os.environ["STORAGE_MODE"] = "whole"
+os.environ["RATE_LIMIT_ENABLED"] = "false"
+
+import pytest
+from fastapi.testclient import TestClient
+
+import app.models  # noqa: F401  Registers every table on Base
+from app.config import settings
+from app.core import storage
+from app.database import Base, SessionLocal, engine
+
+
+@pytest.fixture
+def db():
+    """A session on freshly created tables"""
+    Base.metadata.drop_all(engine)
+    Base.metadata.create_all(engine)
+    session = SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
+
+
+@pytest.fixture
+def dispatched(monkeypatch):
+    """Record the Celery tasks the API would send instead of sending them"""
+    import app.api.files as files_api
+
+    sent = []
+    monkeypatch.setattr(files_api, "dispatch_file_task", lambda *args: sent.append(("file",) + args))
+    monkeypatch.setattr(files_api, "dispatch_multiple_files", lambda *args: sent.append(("files",) + args))
+    monkeypatch.setattr(files_api, "dispatch_artifact", lambda *args: sent.append(("artifact",) + args))
+    return sent
+
+
+@pytest.fixture
+def client(db, dispatched):
+    from app.main import app
+
+    return TestClient(app)
+
+
+@pytest.fixture
+def login(client):
+    """Register a user and return the headers of an authenticated request"""
+    def register(username: str = "alice", password: str = "secret1") -> dict:
+        client.post("/api/register", json={"username": username, "email": f"{username}@example.com", "password": password})
+        tokens = client.post("/api/token", data={"username": username, "password": password}).json()
+        return {"Authorization": f"Bearer {tokens['access_token']}"}
+    return register
+
+
+@pytest.fixture
+def use_nodes(tmp_path, monkeypatch):
+    """Point storage at a ring over the given node names, as directories under tmp_path"""
+    def configure(*node_names, replicas=2, draining=()):
+        nodes = [str(tmp_path / name) for name in node_names]
+        monkeypatch.setattr(settings, "STORAGE_NODES", nodes)
+        monkeypatch.setattr(settings, "STORAGE_DRAINING_NODES", [str(tmp_path / name) for name in draining])
+        monkeypatch.setattr(storage, "ring", storage.HashRing(nodes, vnodes=160, replicas=replicas))
+        return nodes
+    return configure
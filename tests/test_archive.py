@@ -0,0 +1,76 @@
+import io
+import zipfile
+from datetime import datetime
+
+from app.core.archive import ArchiveEntry, archive_name, stream_zip
+
+
+def entry(name, content, modified=None):
+    return ArchiveEntry(name, lambda: io.BytesIO(content), len(content), modified)
+
+
+def test_stream_zip_builds_a_valid_archive():
+    contents = {"notes.txt": b"hello " * 5000, "photo.jpg": b"\xff\xd8" * 1000, "empty.txt": b""}
+    data = b"".join(stream_zip([entry(name, content, datetime(2024, 5, 6, 7, 8, 10)) for name, content in contents.items()]))
+
+    archive = zipfile.ZipFile(io.BytesIO(data))
+    assert archive.testzip() is None
+    assert {name: archive.read(name) for name in archive.namelist()} == contents
+    infos = {info.filename: info for info in archive.infolist()}
+    assert infos["notes.txt"].compress_type == zipfile.ZIP_DEFLATED
+    # Already compressed formats are stored as they are in "auto" mode
+    assert infos["photo.jpg"].compress_type == zipfile.ZIP_STORED
+    assert infos["notes.txt"].date_time == (2024, 5, 6, 7, 8, 10)
+
+
+def test_compression_modes():
+    entries = [entry("notes.txt", b"a" * 1000), entry("photo.jpg", b"b" * 1000)]
+    for mode, expected in (("stored", zipfile.ZIP_STORED), ("deflate", zipfile.ZIP_DEFLATED)):
+        archive = zipfile.ZipFile(io.BytesIO(b"".join(stream_zip(entries, mode))))
+        assert {info.compress_type for info in archive.infolist()} == {expected}
+
+
+def test_stream_zip_is_produced_incrementally():
+    opened = []
+
+    def opener(name):
+        def open_member():
+            opened.append(name)
+            return io.BytesIO(b"x" * 1000)
+        return open_member
+
+    stream = stream_zip([ArchiveEntry(name, opener(name), 1000, None) for name in ("a", "b", "c")], "stored")
+    first = next(stream)
+    assert first.startswith(b"PK\x03\x04")
+    assert opened == ["a"]
+    rest = b"".join(stream)
+    assert opened == ["a", "b", "c"]
+    assert zipfile.ZipFile(io.BytesIO(first + rest)).namelist() == ["a", "b", "c"]
+
+
+def test_archive_names_are_safe_and_unique():
+    used = set()
+    names = [archive_name(name, used) for name in ("a.txt", "a.txt", "../../etc/passwd", "dir\\b.txt", "..", None, "a.txt")]
+    assert names == ["a.txt", "a (1).txt", "passwd", "b.txt", "file", "file (1)", "a (2).txt"]
+
+
+def test_archive_endpoint_streams_the_users_files(client, login):
+    headers = login()
+    file_hashes = [
+        client.post("/api/files/upload", files={"file": (name, content)}, headers=headers).json()["file_hash"]
+        for name, content in (("a.txt", b"first"), ("a.txt", b"second"))
+    ]
+
+    response = client.post("/api/files/archive", json={"file_hashes": file_hashes}, headers=headers)
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/zip"
+    archive = zipfile.ZipFile(io.BytesIO(response.content))
+    assert [(name, archive.read(name)) for name in archive.namelist()] == [("a.txt", b"first"), ("a (1).txt", b"second")]
+
+
+def test_archive_endpoint_rejects_other_users_and_empty_requests(client, login):
+    alice, bob = login("alice"), login("bob")
+    file_hash = client.post("/api/files/upload", files={"file": ("a.txt", b"x")}, headers=alice).json()["file_hash"]
+
+    assert client.post("/api/files/archive", json={"file_hashes": [file_hash]}, headers=bob).status_code == 404
+    assert client.post("/api/files/archive", json={"file_hashes": []}, headers=alice).status_code == 400
@@ -0,0 +1,105 @@
+import gzip
+import io
+import os
+import threading
+
+import pytest
+
+from app.core import storage
+from app.core.artifacts import ArtifactStore, TransformError, artifact_key, normalize_params
+from app.tasks.file_processing import generate_artifact
+
+
+def upload(client, headers, content=b"line\n" * 2000, name="notes.txt"):
+    return client.post("/api/files/upload", files={"file": (name, content)}, headers=headers).json()["file_hash"]
+
+
+def test_concurrent_requests_share_one_job_then_get_the_artifact(client, login, dispatched):
+    headers = login()
+    file_hash = upload(client, headers)
+    url = f"/api/files/{file_hash}/artifacts/preview?bytes=20"
+    responses = []
+    threads = [threading.Thread(target=lambda: responses.append(client.get(url, headers=headers))) for _ in range(20)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert {response.status_code for response in responses} == {202}
+    assert all(response.headers["Retry-After"] for response in responses)
+    jobs = [call for call in dispatched if call[0] == "artifact"]
+    assert jobs == [("artifact", file_hash, "preview", {"bytes": 20})]
+
+    assert generate_artifact.run(*jobs[0][1:])["status"] == "success"
+    response = client.get(url, headers=headers)
+    assert response.status_code == 200
+    assert response.text == "line\n" * 4
+    assert response.headers["content-type"].startswith("text/plain")
+
+
+def test_equivalent_parameters_map_to_one_artifact(client, login, dispatched):
+    headers = login()
+    file_hash = upload(client, headers)
+    assert client.get(f"/api/files/{file_hash}/artifacts/gzip", headers=headers).status_code == 202
+    assert client.get(f"/api/files/{file_hash}/artifacts/gzip?level=6", headers=headers).status_code == 202
+    jobs = [call for call in dispatched if call[0] == "artifact"]
+    assert len(jobs) == 1
+
+    generate_artifact.run(*jobs[0][1:])
+    response = client.get(f"/api/files/{file_hash}/artifacts/gzip?level=6", headers=headers)
+    assert gzip.decompress(response.content) == b"line\n" * 2000
+
+
+def test_invalid_requests_are_rejected(client, login):
+    alice, bob = login("alice"), login("bob")
+    file_hash = upload(client, alice)
+    assert client.get(f"/api/files/{file_hash}/artifacts/nope", headers=alice).status_code == 400
+    assert client.get(f"/api/files/{file_hash}/artifacts/preview?bytes=0", headers=alice).status_code == 400
+    assert client.get(f"/api/files/{file_hash}/artifacts/preview", headers=bob).status_code == 404
+
+
+def test_failed_generation_is_reported(client, login, dispatched):
+    headers = login()
+    file_hash = upload(client, headers)
+    client.get(f"/api/files/{file_hash}/artifacts/preview", headers=headers)
+    storage.remove_blob_copies(file_hash)
+    result = generate_artifact.run(*dispatched[-1][1:])
+
+    assert result["status"] == "error"
+    response = client.get(f"/api/files/{file_hash}/artifacts/preview", headers=headers)
+    assert response.status_code == 422
+    assert "File content not found" in response.json()["detail"]
+
+
+def test_normalize_params_fills_defaults():
+    assert normalize_params("preview", {}) == {"bytes": 4096}
+    assert normalize_params("gzip", {"level": "9"}) == {"level": 9}
+    for transform, params in (("gzip", {"level": "10"}), ("gzip", {"size": "1"}), ("gzip", {"level": "x"}), ("nope", {})):
+        with pytest.raises(TransformError):
+            normalize_params(transform, params)
+
+
+def test_stale_lock_is_taken_over(tmp_path):
+    store = ArtifactStore(str(tmp_path), max_bytes=1000, lock_timeout=60)
+    key = artifact_key("a" * 64, "preview", {"bytes": 10})
+    assert store.acquire(key)
+    assert not store.acquire(key)
+
+    os.utime(store._lock_path(key), (0, 0))
+    assert store.acquire(key)
+    store.release(key)
+    assert store.acquire(key)
+
+
+def test_eviction_removes_least_recently_used(tmp_path):
+    store = ArtifactStore(str(tmp_path), max_bytes=250, lock_timeout=60)
+    keys = [artifact_key(str(index) * 64, "preview", {"bytes": 100}) for index in range(3)]
+    for age, key in enumerate(keys):
+        path = store.generate(key, "preview", io.BytesIO(b"x" * 100), {"bytes": 100})
+        os.utime(path, (1000 - age * 100, 1000 - age * 100))
+    # A hit makes the oldest artifact the most recently used
+    store.get(keys[2], "preview")
+
+    assert store.evict() == (1, 200)
+    assert store.get(keys[1], "preview") is None
+    assert store.get(keys[0], "preview") and store.get(keys[2], "preview")
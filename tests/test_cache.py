@@ -0,0 +1,91 @@
+import time
+
+from sqlalchemy import event
+
+from app.core.cache import ContentCache, CountMinSketch, FileMetadata, MetadataCache
+from app.database import engine
+
+
+def test_sketch_counts_saturate_and_age():
+    sketch = CountMinSketch(width=64)
+    for _ in range(20):
+        sketch.increment("hot")
+    assert sketch.estimate("hot") == CountMinSketch.MAX_COUNT
+    assert sketch.estimate("cold") == 0
+
+    for index in range(sketch.sample_size):
+        sketch.increment(f"other-{index}")
+    assert sketch.estimate("hot") < CountMinSketch.MAX_COUNT
+
+
+def test_one_off_reads_do_not_flush_the_hot_set():
+    cache = ContentCache(max_bytes=1000, max_item_bytes=500)
+    for _ in range(5):
+        cache.get("hot")
+    assert cache.put("hot", b"h" * 400)
+
+    for index in range(20):
+        key = f"scan-{index}"
+        cache.get(key)
+        cache.put(key, b"s" * 400)
+    assert cache.get("hot") == b"h" * 400
+    assert cache.stats()["rejections"] > 0
+
+
+def test_more_frequent_newcomer_evicts_least_recently_used():
+    cache = ContentCache(max_bytes=1000, max_item_bytes=500)
+    cache.put("old", b"o" * 400)
+    cache.put("recent", b"r" * 400)
+    cache.get("recent")
+    for _ in range(3):
+        cache.get("new")
+
+    assert cache.put("new", b"n" * 400)
+    assert cache.get("old") is None
+    assert cache.get("recent") is not None
+    assert cache.stats()["bytes"] == 800
+
+
+def test_oversized_items_are_never_cached():
+    cache = ContentCache(max_bytes=1000, max_item_bytes=100)
+    assert not cache.put("big", b"x" * 101)
+    assert cache.stats()["items"] == 0
+
+
+def test_metadata_entries_expire():
+    cache = MetadataCache(max_entries=2, ttl=0.05)
+    metadata = FileMetadata("a" * 64, 1, "a.txt", None, 1, None, "text/plain", False)
+    cache.put(metadata)
+    assert cache.get(metadata.file_hash) == metadata
+    time.sleep(0.06)
+    assert cache.get(metadata.file_hash) is None
+
+
+def test_hot_download_skips_the_file_query(client, login):
+    headers = login()
+    file_hash = client.post("/api/files/upload", files={"file": ("notes.txt", b"hello")}, headers=headers).json()["file_hash"]
+    statements = []
+    listener = lambda *args: statements.append(args[2])
+    event.listen(engine, "before_cursor_execute", listener)
+    try:
+        cold = client.get(f"/api/files/{file_hash}/download", headers=headers)
+        cold_statements, statements[:] = len(statements), []
+        hot = client.get(f"/api/files/{file_hash}/download", headers=headers)
+    finally:
+        event.remove(engine, "before_cursor_execute", listener)
+
+    assert cold.content == hot.content == b"hello"
+    assert len(statements) < cold_statements
+    assert not any("file_uploads" in statement for statement in statements)
+
+    etag = hot.headers["etag"]
+    assert client.get(f"/api/files/{file_hash}/download", headers={**headers, "If-None-Match": etag}).status_code == 304
+
+
+def test_deleted_file_is_not_served_from_cache(client, login):
+    headers = login()
+    file_hash = client.post("/api/files/upload", files={"file": ("notes.txt", b"hello")}, headers=headers).json()["file_hash"]
+    client.get(f"/api/files/{file_hash}/download", headers=headers)
+
+    client.delete(f"/api/files/{file_hash}", headers=headers)
+    assert client.get(f"/api/files/{file_hash}/download", headers=headers).status_code == 404
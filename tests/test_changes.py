@@ -0,0 +1,102 @@
+from datetime import datetime, timedelta
+
+from app.crud import file as file_crud
+from app.models.file import FileChange
+from app.models.user import User
+
+
+def upload(client, headers, name="notes.txt"):
+    return client.post("/api/files/upload", files={"file": (name, b"hello")}, headers=headers).json()["file_hash"]
+
+
+def changes(client, headers, **params):
+    response = client.get("/api/files/changes", params=params, headers=headers)
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+def test_feed_follows_uploads_deletes_and_restores(client, login):
+    headers = login()
+    cursor = changes(client, headers)["cursor"]
+    file_hash = upload(client, headers)
+    client.delete(f"/api/files/{file_hash}", headers=headers)
+    client.post(f"/api/files/{file_hash}/restore", headers=headers)
+
+    feed = changes(client, headers, since=cursor)
+    assert [change["change_type"] for change in feed["changes"]] == ["created", "deleted", "restored"]
+    assert all(change["file_hash"] == file_hash for change in feed["changes"])
+    assert feed["changes"][-1]["file"]["is_deleted"] is False
+    assert feed["cursor"] == feed["changes"][-1]["seq"]
+    assert changes(client, headers, since=feed["cursor"])["changes"] == []
+
+
+def test_sequence_numbers_only_grow(client, login):
+    headers = login()
+    seqs = []
+    cursor = changes(client, headers)["cursor"]
+    for index in range(5):
+        upload(client, headers, f"{index}.txt")
+        feed = changes(client, headers, since=cursor)
+        seqs += [change["seq"] for change in feed["changes"]]
+        cursor = feed["cursor"]
+    assert seqs == sorted(set(seqs)) and len(seqs) == 5
+
+
+def test_late_commit_is_numbered_after_the_cursor(client, login, db):
+    headers = login()
+    file_hash = upload(client, headers)
+    cursor = changes(client, headers)["cursor"]
+    user = db.query(User).one()
+
+    # A transaction that took an earlier id but committed after the cursor
+    # was handed out
+    first_id = db.query(FileChange.id).order_by(FileChange.id).first()[0]
+    db.query(FileChange).filter(FileChange.id == first_id).delete()
+    db.add(FileChange(id=first_id, user_id=user.id, file_hash=file_hash, change_type="status", status="processed"))
+    db.commit()
+
+    feed = changes(client, headers, since=cursor)
+    assert [(change["change_type"], change["seq"] > cursor) for change in feed["changes"]] == [("status", True)]
+
+
+def test_feed_is_per_user_and_skips_other_users_changes(client, login):
+    alice, bob = login("alice"), login("bob")
+    cursor = changes(client, alice)["cursor"]
+    upload(client, bob)
+
+    feed = changes(client, alice, since=cursor)
+    assert feed["changes"] == []
+    # Idle cursors move past other users' changes so they never expire
+    assert feed["cursor"] > cursor
+
+
+def test_pages_report_has_more(client, login):
+    headers = login()
+    cursor = changes(client, headers)["cursor"]
+    for index in range(3):
+        upload(client, headers, f"{index}.txt")
+
+    first = changes(client, headers, since=cursor, limit=2)
+    assert len(first["changes"]) == 2 and first["has_more"] is True
+    rest = changes(client, headers, since=first["cursor"], limit=2)
+    assert len(rest["changes"]) == 1 and rest["has_more"] is False
+
+
+def test_cursor_older_than_history_gets_410(client, login, db):
+    headers = login()
+    cursor = changes(client, headers)["cursor"]
+    for index in range(3):
+        upload(client, headers, f"{index}.txt")
+    changes(client, headers, since=cursor)
+    file_crud.delete_old_changes(db, datetime.now() + timedelta(seconds=1), limit=2)
+    db.commit()
+
+    assert client.get("/api/files/changes", params={"since": cursor}, headers=headers).status_code == 410
+    assert changes(client, headers, since=cursor + 2)["changes"][0]["seq"] == cursor + 3
+
+
+def test_wait_returns_empty_once_the_deadline_passes(client, login):
+    headers = login()
+    cursor = changes(client, headers)["cursor"]
+    feed = changes(client, headers, since=cursor, wait=1)
+    assert feed == {"changes": [], "cursor": cursor, "has_more": False}
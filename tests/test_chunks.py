@@ -0,0 +1,138 @@
+import hashlib
+import io
+import random
+
+import pytest
+
+from app.config import settings
+from app.core import storage
+from app.core.chunks import Chunker, ChunkerError, open_chunked, store_chunks
+from app.crud import chunk as chunk_crud
+from app.models.file import Chunk, FileUpload
+from app.tasks.file_processing import process_uploaded_file
+
+MIN_SIZE, AVG_SIZE, MAX_SIZE = 256, 1024, 4096
+
+
+def random_bytes(size, seed=1):
+    return random.Random(seed).randbytes(size)
+
+
+def cut(data, chunker=None):
+    chunker = chunker or Chunker(MIN_SIZE, AVG_SIZE, MAX_SIZE)
+    return list(chunker.iter_chunks(io.BytesIO(data)))
+
+
+@pytest.fixture
+def small_chunks(monkeypatch, use_nodes):
+    use_nodes("a", "b")
+    monkeypatch.setattr(settings, "DEDUP_MIN_CHUNK_SIZE", MIN_SIZE)
+    monkeypatch.setattr(settings, "DEDUP_AVG_CHUNK_SIZE", AVG_SIZE)
+    monkeypatch.setattr(settings, "DEDUP_MAX_CHUNK_SIZE", MAX_SIZE)
+
+
+def test_chunking_is_deterministic_and_lossless():
+    data = random_bytes(200000)
+    chunks = cut(data)
+    assert b"".join(chunks) == data
+    assert chunks == cut(data)
+    assert all(MIN_SIZE <= len(chunk) <= MAX_SIZE for chunk in chunks[:-1])
+    assert AVG_SIZE / 2 < len(data) / len(chunks) < AVG_SIZE * 2
+
+
+def test_cut_points_do_not_depend_on_read_size(monkeypatch):
+    import app.core.chunks as chunks_module
+
+    data = random_bytes(100000)
+    expected = cut(data)
+    monkeypatch.setattr(chunks_module, "READ_SIZE", 777)
+    assert cut(data) == expected
+
+
+def test_an_edit_only_changes_the_chunks_around_it():
+    data = random_bytes(200000)
+    edited = data[:100000] + b"inserted bytes" + data[100000:]
+    before, after = set(cut(data)), cut(edited)
+
+    changed = [chunk for chunk in after if chunk not in before]
+    assert len(changed) <= 2
+    assert sum(map(len, changed)) < 3 * MAX_SIZE
+
+
+def test_repetitive_input_is_cut_at_the_maximum_size():
+    chunks = cut(b"\0" * 20000)
+    assert [len(chunk) for chunk in chunks] == [MAX_SIZE] * 4 + [20000 - 4 * MAX_SIZE]
+    assert len(set(chunks[:4])) == 1
+
+
+def test_invalid_sizes_are_rejected():
+    with pytest.raises(ChunkerError):
+        Chunker(1024, 1024, 4096)
+
+
+def test_chunked_file_reads_and_seeks_like_the_original(small_chunks):
+    data = random_bytes(50000)
+    chunks = []
+    for piece in cut(data):
+        digest = hashlib.sha256(piece).hexdigest()
+        storage.write_chunk(digest, piece)
+        chunks.append((digest, len(piece)))
+
+    with open_chunked(chunks) as source:
+        assert source.read() == data
+        source.seek(12345)
+        assert source.read(5000) == data[12345:17345]
+        source.seek(-10, io.SEEK_END)
+        assert source.read() == data[-10:]
+
+
+def test_store_chunks_writes_only_new_chunks(small_chunks, db):
+    data = random_bytes(100000)
+    chunks, written = store_chunks(db, io.BytesIO(data))
+    chunk_crud.add_file_chunks(db, "f" * 64, chunks)
+    db.commit()
+    assert written["chunks"] == len(chunks)
+    assert written["new_bytes"] == sum(dict(chunks).values())
+
+    edited = data[:50000] + b"inserted bytes" + data[50000:]
+    edited_chunks, written = store_chunks(db, io.BytesIO(edited))
+    assert 1 <= written["new_chunks"] <= 2
+    assert written["new_bytes"] < 3 * MAX_SIZE
+    with open_chunked(edited_chunks) as source:
+        assert source.read() == edited
+
+
+def test_collected_chunk_is_written_again(small_chunks, db):
+    data = random_bytes(20000)
+    chunks, _ = store_chunks(db, io.BytesIO(data))
+    digest, size = chunks[0]
+    # The collector took the chunk: its row has no references and its file is gone
+    db.add(Chunk(digest=digest, size=size, refcount=0))
+    db.commit()
+    for node in storage.storage_nodes():
+        storage.remove_blob(storage.chunk_path(digest, node))
+
+    store_chunks(db, io.BytesIO(data))
+    assert storage.locate_chunk(digest) is not None
+
+
+def test_chunked_upload_round_trip(client, login, db, small_chunks, monkeypatch):
+    monkeypatch.setattr(settings, "STORAGE_MODE", "chunked")
+    headers = login()
+    data = random_bytes(300000)
+    edited = data[:150000] + b"inserted bytes" + data[150000:]
+    file_hashes = []
+    for name, content in (("v1.bin", data), ("v2.bin", edited)):
+        file_hash = client.post("/api/files/upload", files={"file": (name, content)}, headers=headers).json()["file_hash"]
+        # The API keeps one copy until the worker has chunked it
+        assert len(storage.blob_nodes(file_hash)) == 1
+        process_uploaded_file.run(file_hash)
+        assert storage.blob_nodes(file_hash) == []
+        file_hashes.append(file_hash)
+
+    assert all(record.is_chunked for record in db.query(FileUpload))
+    rows = db.query(Chunk).all()
+    assert sum(row.size for row in rows) < len(data) + 3 * MAX_SIZE
+    for file_hash, content in zip(file_hashes, (data, edited)):
+        response = client.get(f"/api/files/{file_hash}/download", headers=headers)
+        assert response.status_code == 200 and response.content == content
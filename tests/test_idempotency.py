@@ -0,0 +1,86 @@
+import hashlib
+from datetime import datetime, timedelta
+
+from app.api.files import request_fingerprint
+from app.crud import file as file_crud
+from app.models.file import FileUpload, IdempotencyKey
+from app.models.user import User
+
+
+def upload(client, headers, key, content=b"hello", name="notes.txt"):
+    return client.post(
+        "/api/files/upload", files={"file": (name, content)}, headers={**headers, "Idempotency-Key": key}
+    )
+
+
+def test_retry_replays_the_first_response(client, login, db, dispatched):
+    headers = login()
+    first = upload(client, headers, "key-1")
+    retry = upload(client, headers, "key-1")
+
+    assert first.status_code == retry.status_code == 200
+    assert retry.json() == first.json()
+    assert len(dispatched) == 1
+    assert db.query(FileUpload).count() == 1
+
+
+def test_keys_are_scoped_per_user(client, login, db):
+    alice, bob = login("alice"), login("bob")
+    assert upload(client, alice, "shared").json() != upload(client, bob, "shared").json()
+    assert db.query(FileUpload).count() == 2
+
+
+def test_key_reused_for_other_content_is_rejected(client, login, db):
+    headers = login()
+    upload(client, headers, "key-1", b"hello")
+
+    response = upload(client, headers, "key-1", b"something else")
+    assert response.status_code == 422
+    assert db.query(FileUpload).count() == 1
+
+
+def test_key_still_in_progress_gets_409(client, login, db, dispatched):
+    headers = login()
+    user = db.query(User).filter(User.username == "alice").one()
+    fingerprint = request_fingerprint([("notes.txt", hashlib.sha256(b"hello").hexdigest())])
+    file_crud.reserve_idempotency_key(db, user.id, "files.upload", "key-1", fingerprint)
+    db.commit()
+
+    response = upload(client, headers, "key-1")
+    assert response.status_code == 409
+    assert response.headers["Retry-After"] == "1"
+    assert dispatched == []
+
+    # Abandoned once the reservation times out, so the retry runs it
+    db.query(IdempotencyKey).update({"created_at": datetime.now() - timedelta(hours=1)})
+    db.commit()
+    assert upload(client, headers, "key-1").status_code == 200
+    assert len(dispatched) == 1
+
+
+def test_failed_upload_releases_the_key(client, login, db, dispatched, monkeypatch):
+    import app.api.files as files_api
+
+    headers = login()
+    def broker_down(*args):
+        raise RuntimeError("broker down")
+    monkeypatch.setattr(files_api, "dispatch_file_task", broker_down)
+    assert upload(client, headers, "key-1").status_code == 500
+    assert db.query(FileUpload).count() == 0
+    assert db.query(IdempotencyKey).count() == 0
+
+    monkeypatch.setattr(files_api, "dispatch_file_task", lambda *args: dispatched.append(args))
+    assert upload(client, headers, "key-1").status_code == 200
+    assert len(dispatched) == 1
+
+
+def test_content_check_finds_stored_digest(client, login):
+    headers = login()
+    upload(client, headers, "key-1", b"hello")
+    digest = hashlib.sha256(b"hello").hexdigest()
+
+    response = client.get(f"/api/files/check/{digest.upper()}", headers=headers)
+    assert response.status_code == 200
+    assert response.json()["content_sha256"] == digest
+    assert client.get(f"/api/files/check/{hashlib.sha256(b'other').hexdigest()}", headers=headers).status_code == 404
+    assert client.get("/api/files/check/not-a-digest", headers=headers).status_code == 400
@@ -0,0 +1,109 @@
+import asyncio
+
+import pytest
+from starlette.responses import JSONResponse
+from starlette.testclient import TestClient
+
+from app.config import settings
+from app.core import admission
+from app.core.admission import AdmissionControlMiddleware
+from app.core.rate_limit import MemoryBucketStore, RateLimitMiddleware, draw_tokens
+
+UPLOAD_PATH = f"{settings.API_PREFIX}/files/upload"
+
+
+async def ok_app(scope, receive, send):
+    await JSONResponse({"ok": True})(scope, receive, send)
+
+
+def test_bucket_refills_at_its_rate():
+    tokens, wait = draw_tokens(tokens=0, updated=0, now=0.5, rate=4, burst=10, cost=1)
+    assert (tokens, wait) == (1, 0)
+    tokens, wait = draw_tokens(tokens=0, updated=0, now=0.1, rate=4, burst=10, cost=1)
+    assert tokens == pytest.approx(0.4)
+    assert wait == pytest.approx(0.15)
+    # Never more than the burst, however long the bucket sat idle
+    assert draw_tokens(tokens=3, updated=0, now=3600, rate=4, burst=10, cost=1)[0] == 9
+
+
+def test_cost_above_burst_is_admitted_into_debt():
+    tokens, wait = draw_tokens(tokens=10, updated=0, now=0, rate=5, burst=10, cost=25)
+    assert (tokens, wait) == (-15, 0)
+    assert draw_tokens(tokens, 0, 1, 5, 10, 1)[1] == pytest.approx(2.2)
+
+
+def test_memory_store_limits_each_key_separately():
+    store = MemoryBucketStore()
+    waits = [asyncio.run(store.take("a", rate=1, burst=3)) for _ in range(4)]
+    assert waits[:3] == [0, 0, 0] and waits[3] > 0
+    assert asyncio.run(store.take("b", rate=1, burst=3)) == 0
+
+
+def test_memory_store_evicts_least_recently_used_keys():
+    store = MemoryBucketStore(max_keys=2)
+    for key in ("a", "b", "c"):
+        asyncio.run(store.take(key, rate=1, burst=1))
+    assert list(store._buckets) == ["b", "c"]
+
+
+@pytest.fixture
+def rate_limited(monkeypatch):
+    monkeypatch.setattr(settings, "RATE_LIMIT_ENABLED", True)
+    monkeypatch.setattr(settings, "RATE_LIMIT_IP_BURST", 2)
+    monkeypatch.setattr(settings, "RATE_LIMIT_IP_REQUESTS_PER_SECOND", 0.01)
+    monkeypatch.setattr(settings, "RATE_LIMIT_UPLOAD_BURST_BYTES", 100)
+    monkeypatch.setattr(settings, "RATE_LIMIT_UPLOAD_BYTES_PER_SECOND", 1)
+    return TestClient(RateLimitMiddleware(ok_app, store=MemoryBucketStore()))
+
+
+def test_requests_over_the_burst_get_429(rate_limited):
+    assert [rate_limited.get("/api/files").status_code for _ in range(2)] == [200, 200]
+    response = rate_limited.get("/api/files")
+    assert response.status_code == 429
+    assert int(response.headers["Retry-After"]) >= 1
+
+
+def test_uploads_draw_their_size_from_the_bytes_bucket(rate_limited, monkeypatch):
+    monkeypatch.setattr(settings, "RATE_LIMIT_IP_BURST", 100)
+    assert rate_limited.post(UPLOAD_PATH, content=b"x" * 80).status_code == 200
+    response = rate_limited.post(UPLOAD_PATH, content=b"x" * 80)
+    assert response.status_code == 429
+    assert response.json()["detail"] == "Upload bandwidth limit exceeded"
+
+
+def test_uploads_without_content_length_get_411(rate_limited):
+    def body():
+        yield b"x" * 10
+    assert rate_limited.post(UPLOAD_PATH, content=body()).status_code == 411
+
+
+def test_busy_database_pool_sheds_requests(monkeypatch):
+    monkeypatch.setattr(admission, "db_pool_saturated", lambda: True)
+    client = TestClient(AdmissionControlMiddleware(ok_app))
+    response = client.get("/api/files")
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == str(settings.ADMISSION_RETRY_AFTER_SECONDS)
+    # Only the API is shed
+    assert client.get("/docs").status_code == 200
+
+
+def test_uploads_beyond_the_inflight_limit_are_shed(monkeypatch):
+    monkeypatch.setattr(admission, "db_pool_saturated", lambda: False)
+    middleware = AdmissionControlMiddleware(ok_app)
+    client = TestClient(middleware)
+    middleware.inflight_uploads = settings.MAX_INFLIGHT_UPLOADS
+    response = client.post(UPLOAD_PATH, content=b"x")
+    assert response.status_code == 503
+    assert "Retry-After" in response.headers
+    assert client.get("/api/files").status_code == 200
+
+    middleware.inflight_uploads = 0
+    assert client.post(UPLOAD_PATH, content=b"x").status_code == 200
+    assert middleware.inflight_uploads == 0
+
+
+def test_admission_runs_before_rate_limiting():
+    from app.main import app
+
+    order = [middleware.cls.__name__ for middleware in app.user_middleware]
+    assert order.index("AdmissionControlMiddleware") < order.index("RateLimitMiddleware")
@@ -0,0 +1,20 @@
+import importlib.util
+import os
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def load_bench():
+    spec = importlib.util.spec_from_file_location("bench_startup", os.path.join(ROOT, "scripts", "bench_startup.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def test_api_import_stays_within_budget():
+    bench = load_bench()
+    median, slowest, eager = bench.measure_import(runs=3)
+    assert eager == [], f"importing app.main loads {', '.join(eager)}"
+    assert median <= bench.IMPORT_BUDGET, (
+        f"importing app.main takes {median:.3f}s, over the {bench.IMPORT_BUDGET:.3f}s budget"
+    )
@@ -0,0 +1,80 @@
+from datetime import date
+
+from app.crud import file as file_crud
+from app.crud import stats as stats_crud
+from app.models.stats import UserFileStats, UserStatusCount
+from app.models.user import User
+
+
+def upload(client, headers, name, content):
+    return client.post("/api/files/upload", files={"file": (name, content)}, headers=headers).json()["file_hash"]
+
+
+def staff_headers(client, login, db):
+    headers = login("admin")
+    db.query(User).filter(User.username == "admin").update({"is_staff": True})
+    db.commit()
+    return headers
+
+
+def test_increment_creates_then_adds_to_counter_rows(db):
+    db.add(User(id=1, username="alice", email="alice@example.com", hashed_password="x"))
+    db.commit()
+    stats_crud.increment(db, UserFileStats, [{"user_id": 1, "file_count": 2, "total_bytes": 10}])
+    stats_crud.increment(db, UserFileStats, [{"user_id": 1, "file_count": 1, "total_bytes": -4}])
+    db.commit()
+
+    row = db.query(UserFileStats).one()
+    assert (row.file_count, row.total_bytes, row.deleted_count) == (3, 6, 0)
+
+
+def test_increment_only_touches_the_named_counters(db):
+    stats_crud.increment(db, UserStatusCount, [{"user_id": 1, "status": "pending", "file_count": 5}])
+    stats_crud.increment(db, UserStatusCount, [
+        {"user_id": 1, "status": "pending", "file_count": -1},
+        {"user_id": 1, "status": "processed", "file_count": 1},
+    ])
+    db.commit()
+
+    assert stats_crud.get_user_status_counts(db, 1) == {"pending": 4, "processed": 1}
+
+
+def test_counters_follow_the_file_lifecycle(client, login, db):
+    headers = login()
+    user_id = db.query(User.id).filter(User.username == "alice").scalar()
+    kept, trashed, failed = (upload(client, headers, f"{index}.txt", b"x" * 10) for index in range(3))
+
+    client.delete(f"/api/files/{trashed}", headers=headers)
+    # Repeated changes are counted once
+    assert client.delete(f"/api/files/{trashed}", headers=headers).status_code == 404
+    file_crud.set_status(db, [failed], "failed")
+    file_crud.set_status(db, [failed], "failed")
+    file_crud.set_status(db, [kept], "processed")
+    db.commit()
+    file_crud.purge(db, [trashed])
+    db.commit()
+
+    stats = stats_crud.get_user_stats(db, user_id)
+    db.refresh(stats)
+    assert (stats.file_count, stats.total_bytes, stats.deleted_count, stats.failed_count) == (2, 20, 0, 1)
+    assert stats_crud.get_user_status_counts(db, user_id) == {"processed": 1, "failed": 1}
+
+    today = stats_crud.get_daily_stats(db, date.today(), date.today())[0]
+    assert (today.uploads, today.upload_bytes, today.failures, today.deletions, today.purges) == (3, 30, 1, 1, 1)
+
+
+def test_admin_endpoints_report_the_counters(client, login, db):
+    headers = login()
+    admin = staff_headers(client, login, db)
+    upload(client, headers, "a.txt", b"x" * 10)
+    user_id = db.query(User.id).filter(User.username == "alice").scalar()
+
+    detail = client.get(f"/api/admin/users/{user_id}/stats", headers=admin).json()
+    assert (detail["file_count"], detail["total_bytes"], detail["statuses"]) == (1, 10, {"pending": 1})
+    listed = {user["username"]: user["stats"] for user in client.get("/api/admin/users", headers=admin).json()}
+    assert listed["alice"]["file_count"] == 1 and listed["admin"]["file_count"] == 0
+    assert client.get("/api/admin/stats/daily", headers=admin).json()[0]["uploads"] == 1
+
+    assert client.get(f"/api/admin/users/{user_id}/stats", headers=headers).status_code == 403
+    assert client.get("/api/admin/users/9999/stats", headers=admin).status_code == 404
+    assert client.get("/api/admin/stats/daily?start=2024-01-02&end=2024-01-01", headers=admin).status_code == 400
@@ -0,0 +1,139 @@
+import builtins
+import hashlib
+import os
+import time
+from collections import Counter
+
+from app.core import storage
+from app.core.storage import HashRing
+
+
+def names(count):
+    return [hashlib.sha256(str(index).encode()).hexdigest() for index in range(count)]
+
+
+def rebalance_all():
+    for node in storage.storage_nodes():
+        if not storage.is_balanced(node):
+            storage.rebalance_node(node, time.time() + 10)
+
+
+def test_ring_places_replicas_on_distinct_nodes_deterministically():
+    ring = HashRing(["a", "b", "c"], vnodes=160, replicas=2)
+    again = HashRing(["c", "b", "a"], vnodes=160, replicas=2)
+    for name in names(200):
+        placed = ring.nodes_for(name)
+        assert len(set(placed)) == 2
+        assert placed == again.nodes_for(name)
+    assert HashRing(["a"], vnodes=160, replicas=3).nodes_for("x") == ["a"]
+
+
+def test_ring_spreads_blobs_evenly():
+    ring = HashRing(["a", "b", "c", "d"], vnodes=160, replicas=1)
+    counts = Counter(ring.nodes_for(name)[0] for name in names(8000))
+    assert min(counts.values()) > 8000 / 4 * 0.75
+
+
+def test_adding_a_node_moves_about_one_nth():
+    before = HashRing(["a", "b", "c"], vnodes=160, replicas=1)
+    after = HashRing(["a", "b", "c", "d"], vnodes=160, replicas=1)
+    moved = [name for name in names(8000) if before.nodes_for(name) != after.nodes_for(name)]
+    assert all(after.nodes_for(name) == ["d"] for name in moved)
+    assert 0.15 < len(moved) / 8000 < 0.35
+
+
+def test_blobs_are_written_to_every_replica(use_nodes):
+    use_nodes("a", "b", "c")
+    file_hash = names(1)[0]
+    path = storage.write_blob(file_hash, b"hello")
+
+    assert path == storage.replica_paths(file_hash)[0]
+    assert path.endswith(os.path.join(file_hash[:2], file_hash))
+    assert all(open(replica, "rb").read() == b"hello" for replica in storage.replica_paths(file_hash))
+    assert not [name for name in os.listdir(os.path.dirname(path)) if name.endswith(".partial")]
+
+
+def test_reads_fail_over_to_another_replica(use_nodes):
+    use_nodes("a", "b", "c")
+    file_hash = names(1)[0]
+    storage.write_blob(file_hash, b"hello")
+    primary, secondary = storage.replica_paths(file_hash)
+
+    os.remove(primary)
+    assert storage.locate_blob(file_hash) == secondary
+    os.remove(secondary)
+    assert storage.locate_blob(file_hash) is None
+
+
+def test_failed_replica_is_restored_by_the_next_rebalance(use_nodes, monkeypatch):
+    a, b = use_nodes("a", "b")
+    for node in (a, b):
+        storage.mark_balanced(node)
+    real_open = builtins.open
+
+    def failing_open(path, mode="r", *args, **kwargs):
+        if str(path).startswith(b + os.sep) and "w" in mode and storage.RING_MARKER not in str(path):
+            raise OSError("disk gone")
+        return real_open(path, mode, *args, **kwargs)
+
+    file_hash = names(1)[0]
+    monkeypatch.setattr(builtins, "open", failing_open)
+    assert storage.write_blob(file_hash, b"hello").startswith(a)
+    monkeypatch.setattr(builtins, "open", real_open)
+
+    assert not storage.is_balanced(a) and storage.is_balanced(b)
+    rebalance_all()
+    assert os.path.isfile(storage.blob_path(file_hash, b))
+    assert storage.is_balanced(a)
+
+
+def test_rebalance_after_adding_a_node(use_nodes):
+    use_nodes("a", "b", "c")
+    stored = names(300)
+    for name in stored:
+        storage.write_blob(name, name.encode())
+    rebalance_all()
+
+    nodes = use_nodes("a", "b", "c", "d")
+    assert not any(storage.is_balanced(node) for node in nodes)
+    rebalance_all()
+
+    for name in stored:
+        holders = [node for node in nodes if os.path.isfile(storage.blob_path(name, node))]
+        assert sorted(holders) == sorted(storage.ring.nodes_for(name))
+    assert len(os.listdir(os.path.join(nodes[3]))) > 1
+    assert list(storage.iter_blob_names()) == sorted(stored)
+
+
+def test_draining_node_is_read_until_emptied(use_nodes):
+    use_nodes("a", "b", "c")
+    stored = names(100)
+    for name in stored:
+        storage.write_blob(name, name.encode())
+
+    nodes = use_nodes("a", "b", draining=("c",))
+    assert all(storage.locate_blob(name) for name in stored)
+    rebalance_all()
+    assert list(storage.iter_node_blob_names(os.path.join(os.path.dirname(nodes[0]), "c"))) == []
+    assert all(storage.locate_blob(name).startswith(tuple(nodes)) for name in stored)
+
+
+def test_legacy_flat_blobs_are_moved_into_shards(use_nodes):
+    a, b = use_nodes("a", "b")
+    file_hash = names(1)[0]
+    os.makedirs(a)
+    with open(storage.legacy_blob_path(file_hash, a), "wb") as blob:
+        blob.write(b"old")
+
+    assert storage.locate_blob(file_hash) == storage.legacy_blob_path(file_hash, a)
+    rebalance_all()
+    assert not os.path.exists(storage.legacy_blob_path(file_hash, a))
+    assert [open(path, "rb").read() for path in storage.replica_paths(file_hash)] == [b"old", b"old"]
+
+
+def test_young_blobs_are_left_for_a_later_run(use_nodes):
+    a, = use_nodes("a", replicas=1)
+    storage.write_blob(names(1)[0], b"in flight")
+    counts = storage.rebalance_node(a, older_than=time.time() - 60)
+    assert counts["skipped"] == 1
+    assert not storage.is_balanced(a)
@@ -0,0 +1,65 @@
+import types
+
+from app.config import settings
+from app.tasks import file_processing
+
+
+def upload(client, headers, name="notes.txt", content=b"hello"):
+    return client.post("/api/files/upload", files={"file": (name, content)}, headers=headers).json()
+
+
+def batch(client, headers, task_ids=(), file_hashes=()):
+    return client.post(
+        "/api/files/task-status/batch",
+        json={"task_ids": list(task_ids), "file_hashes": list(file_hashes)},
+        headers=headers,
+    )
+
+
+def test_batch_resolves_tasks_and_files(client, login):
+    headers = login()
+    first, second = upload(client, headers, "a.txt"), upload(client, headers, "b.txt")
+
+    result = batch(
+        client, headers,
+        task_ids=[first["task_id"], second["task_id"], first["task_id"], "missing-task"],
+        file_hashes=[first["file_hash"], "missing-file"],
+    ).json()
+    assert sorted(task["task_id"] for task in result["tasks"]) == sorted([first["task_id"], second["task_id"]])
+    assert result["files"] == [{"file_hash": first["file_hash"], "status": "pending"}]
+    assert result["not_found"] == ["missing-task", "missing-file"]
+
+
+def test_batch_only_returns_the_callers_tasks(client, login):
+    alice, bob = login("alice"), login("bob")
+    uploaded = upload(client, alice)
+
+    result = batch(client, bob, task_ids=[uploaded["task_id"]], file_hashes=[uploaded["file_hash"]]).json()
+    assert result["tasks"] == [] and result["files"] == []
+    assert result["not_found"] == [uploaded["task_id"], uploaded["file_hash"]]
+
+
+def test_per_file_tasks_belong_to_the_uploader(client, login, dispatched, monkeypatch):
+    alice, bob = login("alice"), login("bob")
+    response = client.post(
+        "/api/files/upload-multiple", files=[("files", ("a.txt", b"1")), ("files", ("b.txt", b"2"))], headers=alice
+    )
+    _, file_hashes, task_id = dispatched[-1]
+    monkeypatch.setattr(
+        file_processing.process_uploaded_file, "apply_async", lambda *args, **kwargs: types.SimpleNamespace(id=kwargs["task_id"])
+    )
+    result = file_processing.process_multiple_files.apply(args=[file_hashes], task_id=task_id).result
+    child_ids = [child["task_id"] for child in result["files"]]
+
+    assert response.json()[0]["task_id"] == task_id
+    assert len(batch(client, alice, task_ids=child_ids).json()["tasks"]) == 2
+    assert batch(client, bob, task_ids=child_ids).json()["tasks"] == []
+
+
+def test_batch_size_is_capped(client, login):
+    headers = login()
+    too_many = [f"task-{index}" for index in range(settings.TASK_STATUS_BATCH_MAX + 1)]
+    assert batch(client, headers, task_ids=too_many).status_code == 422
+
+    half = settings.TASK_STATUS_BATCH_MAX // 2 + 1
+    assert batch(client, headers, task_ids=too_many[:half], file_hashes=too_many[:half]).status_code == 400
@@ -0,0 +1,110 @@
+import time
+from datetime import datetime, timedelta
+
+from jose import jwt
+
+from app.core.bloom import BloomFilter
+from app.core.revocation import RevocationList, revocation_list
+from app.crud import token as token_crud
+
+
+def login_tokens(client, username="alice", password="secret1"):
+    client.post("/api/register", json={"username": username, "email": f"{username}@example.com", "password": password})
+    return client.post("/api/token", data={"username": username, "password": password}).json()
+
+
+def bearer(token):
+    return {"Authorization": f"Bearer {token}"}
+
+
+def refresh(client, refresh_token):
+    return client.post("/api/token/refresh", json={"refresh_token": refresh_token})
+
+
+def test_refresh_rotates_the_token_pair(client):
+    tokens = login_tokens(client)
+    response = refresh(client, tokens["refresh_token"])
+
+    assert response.status_code == 200
+    renewed = response.json()
+    assert renewed["refresh_token"] != tokens["refresh_token"]
+    assert client.get("/api/files", headers=bearer(renewed["access_token"])).status_code == 200
+    assert refresh(client, renewed["refresh_token"]).status_code == 200
+
+
+def test_reused_refresh_token_is_rejected(client):
+    tokens = login_tokens(client)
+    assert refresh(client, tokens["refresh_token"]).status_code == 200
+
+    assert refresh(client, tokens["refresh_token"]).status_code == 401
+
+
+def test_concurrent_refresh_with_one_token_succeeds_once(client, db, monkeypatch):
+    tokens = login_tokens(client)
+    claims = jwt.get_unverified_claims(tokens["refresh_token"])
+    # Another process revoked it a moment ago; this one has not synced yet
+    monkeypatch.setattr(revocation_list, "_synced_at", time.monotonic())
+    token_crud.revoke(db, claims["jti"], datetime.utcnow() + timedelta(days=1))
+    db.commit()
+
+    response = refresh(client, tokens["refresh_token"])
+    assert response.status_code == 401
+    assert response.json()["detail"] == "Refresh token has already been used"
+
+
+def test_token_types_are_not_interchangeable(client):
+    tokens = login_tokens(client)
+    assert client.get("/api/files", headers=bearer(tokens["refresh_token"])).status_code == 401
+    assert refresh(client, tokens["access_token"]).status_code == 401
+
+
+def test_revoke_logs_out_both_tokens(client):
+    tokens = login_tokens(client)
+    headers = bearer(tokens["access_token"])
+
+    assert client.post("/api/token/revoke", json={"refresh_token": tokens["refresh_token"]}, headers=headers).status_code == 204
+    assert client.get("/api/files", headers=headers).status_code == 401
+    assert refresh(client, tokens["refresh_token"]).status_code == 401
+
+
+def test_revoke_refuses_another_users_refresh_token(client):
+    alice, bob = login_tokens(client, "alice"), login_tokens(client, "bob")
+    response = client.post(
+        "/api/token/revoke", json={"refresh_token": bob["refresh_token"]}, headers=bearer(alice["access_token"])
+    )
+    assert response.status_code == 403
+    assert refresh(client, bob["refresh_token"]).status_code == 200
+
+
+def test_bloom_filter_has_no_false_negatives_and_few_false_positives():
+    bloom = BloomFilter(10000, error_rate=0.001)
+    for index in range(10000):
+        bloom.add(f"in-{index}")
+
+    assert all(f"in-{index}" in bloom for index in range(10000))
+    false_positives = sum(f"out-{index}" in bloom for index in range(100000))
+    assert false_positives / 100000 < 0.003
+    assert len(bloom) == 10000
+
+
+def test_filter_hits_are_confirmed_against_the_table(db):
+    revocations = RevocationList(capacity=100, error_rate=0.01, sync_interval=3600)
+    # A key in the filter but not in the table stands in for a false positive
+    revocations.remember("not-revoked")
+    assert not revocations.is_revoked(db, "not-revoked")
+
+    token_crud.revoke(db, "revoked", datetime.utcnow() + timedelta(hours=1))
+    db.commit()
+    revocations.remember("revoked")
+    assert revocations.is_revoked(db, "revoked")
+    assert not revocations.is_revoked(db, "never-seen")
+
+
+def test_revocations_made_elsewhere_are_picked_up_on_sync(db):
+    revocations = RevocationList(capacity=100, error_rate=0.01, sync_interval=0)
+    assert not revocations.is_revoked(db, "elsewhere")
+
+    token_crud.revoke(db, "elsewhere", datetime.utcnow() + timedelta(hours=1))
+    db.commit()
+    assert revocations.is_revoked(db, "elsewhere")
+    assert "elsewhere" in revocations._bloom
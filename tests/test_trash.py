@@ -0,0 +1,67 @@
+import os
+from datetime import datetime, timedelta
+
+from app.core import storage
+from app.models.file import FileUpload
+from app.tasks.maintenance import collect_orphan_blobs, merge_orphans, purge_deleted_files
+
+
+def upload(client, headers, name="notes.txt", content=b"hello"):
+    response = client.post("/api/files/upload", files={"file": (name, content)}, headers=headers)
+    assert response.status_code == 200, response.text
+    return response.json()["file_hash"]
+
+
+def test_deleted_file_moves_to_trash_and_back(client, login):
+    headers = login()
+    file_hash = upload(client, headers)
+
+    assert client.delete(f"/api/files/{file_hash}", headers=headers).status_code == 200
+    assert client.delete(f"/api/files/{file_hash}", headers=headers).status_code == 404
+    assert [f["file_hash"] for f in client.get("/api/files", headers=headers).json()] == []
+    assert [f["file_hash"] for f in client.get("/api/files/trash", headers=headers).json()] == [file_hash]
+    assert client.get(f"/api/files/{file_hash}/download", headers=headers).status_code == 404
+
+    assert client.post(f"/api/files/{file_hash}/restore", headers=headers).status_code == 200
+    assert client.post(f"/api/files/{file_hash}/restore", headers=headers).status_code == 404
+    assert client.get(f"/api/files/{file_hash}/download", headers=headers).content == b"hello"
+
+
+def test_trash_is_purged_after_retention(client, login, db):
+    headers = login()
+    expired, recent = upload(client, headers, "old.txt"), upload(client, headers, "new.txt")
+    for file_hash in (expired, recent):
+        client.delete(f"/api/files/{file_hash}", headers=headers)
+    db.query(FileUpload).filter(FileUpload.file_hash == expired).update(
+        {"deleted_at": datetime.now() - timedelta(days=31)}
+    )
+    db.commit()
+
+    assert purge_deleted_files.run() == {"status": "success", "purged": 1}
+    assert storage.locate_blob(expired) is None
+    assert storage.locate_blob(recent) is not None
+    assert [f["file_hash"] for f in client.get("/api/files/trash", headers=headers).json()] == [recent]
+
+
+def test_merge_orphans_yields_names_without_rows():
+    stored = ["a1", "b2", "c3", "d4", "e5"]
+    known = ["b2", "bb", "d4", "f6"]
+    assert list(merge_orphans(stored, known)) == ["a1", "c3", "e5"]
+
+
+def test_orphan_collector_removes_only_old_unknown_blobs(client, login):
+    headers = login()
+    kept = upload(client, headers)
+    orphan, fresh = "0" * 64, "f" * 64
+    for name in (orphan, fresh):
+        storage.write_blob(name, b"left over")
+    for name in (kept, orphan):
+        for path in storage.replica_paths(name):
+            os.utime(path, (0, 0))
+
+    assert collect_orphan_blobs.run()["removed"] == 1
+    assert storage.locate_blob(orphan) is None
+    assert storage.locate_blob(kept) is not None
+    # Younger than the grace period: possibly an upload not committed yet
+    assert storage.locate_blob(fresh) is not None
+    storage.remove_blob_copies(fresh)